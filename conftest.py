@@ -91,3 +91,11 @@ def _tear_down():
     print("Removing users' storage...")
     for username in TEST_USERNAMES:
         rmdir(username)
+
+
+@pytest.fixture(autouse=True)
+def clear_survey_cache():
+    # Primary keys are reused across tests (and `date_modified` may be mocked),
+    # so cached surveys must not leak from one test to another
+    from onadata.libs.utils.survey_cache import survey_cache
+    survey_cache.clear()
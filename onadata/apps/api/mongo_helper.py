@@ -1,22 +1,39 @@
-import re
-
+from functools import lru_cache
 
 from onadata.libs.utils.common_tags import NESTED_RESERVED_ATTRIBUTES
 from onadata.libs.utils.string import base64_encodestring
 
+ENCODED_DOLLAR = base64_encodestring('$').strip()
+ENCODED_DOT = base64_encodestring('.').strip()
+# Form field names repeat across millions of records: their translations are
+# memoized
+KEY_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _encode(key):
+    if key.startswith('$'):
+        key = ENCODED_DOLLAR + key[1:]
+    return key.replace('.', ENCODED_DOT)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _decode(key):
+    if key.startswith(ENCODED_DOLLAR):
+        key = '$' + key[len(ENCODED_DOLLAR):]
+    return key.replace(ENCODED_DOT, '.')
+
 
 class MongoHelper:
 
-    KEY_WHITELIST = ['$or', '$and', '$exists', '$in', '$gt', '$gte',
-                     '$lt', '$lte', '$regex', '$options', '$all']
-    ENCODING_SUBSTITUTIONS = [
-        (re.compile(r'^\$'), base64_encodestring('$').strip()),
-        (re.compile(r'\.'), base64_encodestring('.').strip()),
-    ]
-    DECODING_SUBSTITUTIONS = [
-        (re.compile(r'^' + base64_encodestring('$').strip()), '$'),
-        (re.compile(base64_encodestring('.').strip()), '.'),
-    ]
+    KEY_WHITELIST = frozenset([
+        '$or', '$and', '$exists', '$in', '$gt', '$gte',
+        '$lt', '$lte', '$regex', '$options', '$all',
+    ])
+    NESTED_RESERVED_PREFIXES = tuple(
+        '{}.'.format(reserved_attribute)
+        for reserved_attribute in NESTED_RESERVED_ATTRIBUTES
+    )
 
     @classmethod
     def to_readable_dict(cls, d):
@@ -29,16 +46,27 @@ class MongoHelper:
         :return: dict
         """
 
-        for key, value in list(d.items()):
+        encoded_keys = None
+        for key, value in d.items():
+            # Nested dicts are updated in place
             if type(value) == list:
-                value = [cls.to_readable_dict(e)
-                         if type(e) == dict else e for e in value]
+                for e in value:
+                    if type(e) == dict:
+                        cls.to_readable_dict(e)
             elif type(value) == dict:
-                value = cls.to_readable_dict(value)
+                cls.to_readable_dict(value)
 
+            # Cheaper than `_is_attribute_encoded()`, which is only called for
+            # keys which may be encoded
+            if ENCODED_DOT in key or key.startswith(ENCODED_DOLLAR):
+                if encoded_keys is None:
+                    encoded_keys = []
+                encoded_keys.append(key)
+
+        # Most dicts have no encoded attributes and are left as they are
+        for key in encoded_keys or []:
             if cls._is_attribute_encoded(key):
-                del d[key]
-                d[cls.decode(key)] = value
+                d[cls.decode(key)] = d.pop(key)
 
         return d
 
@@ -77,12 +105,15 @@ class MongoHelper:
                     '_validation_status.uid': 'approved'
                 }
         """
-        for key, value in list(d.items()):
+        invalid_keys = None
+        for key, value in d.items():
+            # Nested dicts are updated in place
             if type(value) == list:
-                value = [cls.to_safe_dict(e, reading=reading)
-                         if type(e) == dict else e for e in value]
+                for e in value:
+                    if type(e) == dict:
+                        cls.to_safe_dict(e, reading=reading)
             elif type(value) == dict:
-                value = cls.to_safe_dict(value, reading=reading)
+                cls.to_safe_dict(value, reading=reading)
             elif key == '_id':
                 try:
                     d[key] = int(value)
@@ -90,6 +121,15 @@ class MongoHelper:
                     # if it is not an int don't convert it
                     pass
 
+            # Only keys with `.` or `$` need to be transformed
+            if '.' in key or key.startswith('$'):
+                if invalid_keys is None:
+                    invalid_keys = []
+                invalid_keys.append(key)
+
+        # Most dicts have no such keys and are left as they are
+        for key in invalid_keys or []:
+            value = d[key]
             if cls._is_nested_reserved_attribute(key):
                 # If we want to write into Mongo, we need to transform the dot delimited string into a dict
                 # Otherwise, for reading, Mongo query engine reads dot delimited string as a nested object.
@@ -127,9 +167,9 @@ class MongoHelper:
         :param key: string
         :return: string
         """
-        for pattern, repl in cls.ENCODING_SUBSTITUTIONS:
-            key = re.sub(pattern, repl, key)
-        return key
+        if '.' not in key and not key.startswith('$'):
+            return key
+        return _encode(key)
 
     @classmethod
     def decode(cls, key):
@@ -140,9 +180,9 @@ class MongoHelper:
         :param key: string
         :return: string
         """
-        for pattern, repl in cls.DECODING_SUBSTITUTIONS:
-            key = re.sub(pattern, repl, key)
-        return key
+        if ENCODED_DOT not in key and not key.startswith(ENCODED_DOLLAR):
+            return key
+        return _decode(key)
 
     @classmethod
     def is_attribute_invalid(cls, key):
@@ -151,8 +191,10 @@ class MongoHelper:
         :param key:
         :return:
         """
-        return key not in \
-               cls.KEY_WHITELIST and (key.startswith('$') or key.count('.') > 0)
+        return (
+            ('.' in key or key.startswith('$'))
+            and key not in cls.KEY_WHITELIST
+        )
 
     @classmethod
     def _is_attribute_encoded(cls, key):
@@ -163,21 +205,16 @@ class MongoHelper:
         :return: string
         """
         return (
-            key not in cls.KEY_WHITELIST and (
-                key.startswith('JA==') or
-                    key.count('Lg==') > 0
-            )
+            (ENCODED_DOT in key or key.startswith(ENCODED_DOLLAR))
+            and key not in cls.KEY_WHITELIST
         )
 
-    @staticmethod
-    def _is_nested_reserved_attribute(key):
+    @classmethod
+    def _is_nested_reserved_attribute(cls, key):
         """
         Checks if key starts with one of variables values declared in NESTED_RESERVED_ATTRIBUTES
 
         :param key: string
         :return: boolean
         """
-        for reserved_attribute in NESTED_RESERVED_ATTRIBUTES:
-            if key.startswith("{}.".format(reserved_attribute)):
-                return True
-        return False
+        return key.startswith(cls.NESTED_RESERVED_PREFIXES)
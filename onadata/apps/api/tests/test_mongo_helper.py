@@ -0,0 +1,103 @@
+# coding: utf-8
+import re
+import timeit
+
+from django.test import SimpleTestCase
+
+from onadata.apps.api.mongo_helper import MongoHelper
+
+
+def _reference_to_readable_dict(d):
+    """
+    Regex-based implementation of `MongoHelper.to_readable_dict()`, which the
+    latter must outperform
+    """
+    for key, value in list(d.items()):
+        if type(value) == list:
+            value = [_reference_to_readable_dict(e)
+                     if type(e) == dict else e for e in value]
+        elif type(value) == dict:
+            value = _reference_to_readable_dict(value)
+
+        if key.startswith('JA==') or 'Lg==' in key:
+            del d[key]
+            d[re.sub('Lg==', '.', re.sub('^JA==', '$', key))] = value
+
+    return d
+
+
+class TestMongoHelper(SimpleTestCase):
+
+    def test_encode_decode(self):
+        for key, encoded_key in [
+            ('name', 'name'),
+            ('my.attribute', 'myLg==attribute'),
+            ('$key.a.b', 'JA==keyLg==aLg==b'),
+            ('a$b', 'a$b'),
+        ]:
+            self.assertEqual(MongoHelper.encode(key), encoded_key)
+            self.assertEqual(MongoHelper.decode(encoded_key), key)
+
+    def test_to_safe_dict(self):
+        d = {
+            '_id': '3',
+            '_validation_status.other.nested': 'lorem',
+            '_validation_status.uid': 'approved',
+            'my.string.with.dots': 'yes',
+            'rep': [{'rep/a.b': 1}],
+            '$or': [{'c': 1}],
+        }
+        self.assertEqual(MongoHelper.to_safe_dict(dict(d), reading=True), {
+            '_id': 3,
+            '_validation_status.other.nested': 'lorem',
+            '_validation_status.uid': 'approved',
+            'myLg==stringLg==withLg==dots': 'yes',
+            'rep': [{'rep/aLg==b': 1}],
+            '$or': [{'c': 1}],
+        })
+        d['rep'] = [{'rep/a.b': 1}]
+        self.assertEqual(MongoHelper.to_safe_dict(dict(d)), {
+            '_id': 3,
+            '_validation_status': {
+                'other': {'nested': 'lorem'},
+                'uid': 'approved',
+            },
+            'myLg==stringLg==withLg==dots': 'yes',
+            'rep': [{'rep/aLg==b': 1}],
+            '$or': [{'c': 1}],
+        })
+
+    def test_to_readable_dict(self):
+        repeat = [{'rep/aLg==b': 1}]
+        d = {'JA==key': 1, 'name': 'Abe', 'rep': repeat, '$in': [1]}
+        self.assertEqual(MongoHelper.to_readable_dict(d), {
+            '$key': 1,
+            'name': 'Abe',
+            'rep': [{'rep/a.b': 1}],
+            '$in': [1],
+        })
+        # Nested values are updated in place
+        self.assertIs(d['rep'], repeat)
+
+    def test_to_readable_dict_benchmark(self):
+        record = {
+            '_id': 1,
+            '_uuid': '2ba5e9ce-6d3c-4ad5-8a0f-6d8a2c4bdcb1',
+            '_attachments': [],
+            '_geolocation': [None, None],
+            'meta/instanceID': 'uuid:2ba5e9ce-6d3c-4ad5-8a0f-6d8a2c4bdcb1',
+            'group/rep': [
+                {'group/rep/q%d' % i: i for i in range(10)} for _ in range(5)
+            ],
+        }
+        record.update({'group/q%d' % i: str(i) for i in range(60)})
+
+        def _benchmark(to_readable_dict):
+            return min(timeit.repeat(
+                lambda: to_readable_dict(record), number=500, repeat=5
+            ))
+
+        self.assertLess(
+            _benchmark(MongoHelper.to_readable_dict),
+            _benchmark(_reference_to_readable_dict),
+        )
@@ -1,10 +1,12 @@
 # coding: utf-8
-import requests
+import json
 
+import requests
 from django.conf import settings
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
 from guardian.shortcuts import assign_perm, remove_perm
 from kobo_service_account.utils import get_request_headers
+from mock import patch
 from rest_framework import status
 
 from onadata.apps.api.viewsets.data_viewset import DataViewSet
@@ -50,6 +52,13 @@ def _data_instance(dataid):
     }
 
 
+def _get_records(response):
+    # The data of forms is streamed if `STREAMING_DATA_ENABLED` is on
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return response.data
+
+
 class TestDataViewSet(TestBase):
 
     def setUp(self):
@@ -77,12 +86,13 @@ class TestDataViewSet(TestBase):
         request = self.factory.get('/', **self.extra)
         response = view(request, pk=formid)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
 
         dataid = self.xform.instances.all().order_by('id')[0].pk
         data = _data_instance(dataid)
-        response_first_element = sorted(response.data, key=lambda x: x['_id'])[0]
+        response_first_element = sorted(records, key=lambda x: x['_id'])[0]
         self.assertEqual(dict(response_first_element, **data),
                          response_first_element)
 
@@ -110,7 +120,8 @@ class TestDataViewSet(TestBase):
         request = self.factory.get('/', **self.extra)
         response = view(request, pk=formid)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
 
         # Alice cannot see Bob's data
@@ -133,7 +144,7 @@ class TestDataViewSet(TestBase):
 
         dataid = self.xform.instances.all().order_by('id')[0].pk
         data = _data_instance(dataid)
-        response_first_element = sorted(response.data, key=lambda x: x['_id'])[0]
+        response_first_element = sorted(records, key=lambda x: x['_id'])[0]
         self.assertEqual(dict(response_first_element, **data),
                          response_first_element)
 
@@ -157,11 +168,12 @@ class TestDataViewSet(TestBase):
         response = view(request, pk=formid)
         # access to a public data
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
         dataid = self.xform.instances.all().order_by('id')[0].pk
         data = _data_instance(dataid)
-        response_first_element = sorted(response.data, key=lambda x: x['_id'])[0]
+        response_first_element = sorted(records, key=lambda x: x['_id'])[0]
         self.assertEqual(dict(response_first_element, **data),
                          response_first_element)
 
@@ -207,7 +219,8 @@ class TestDataViewSet(TestBase):
         self.assertEqual(response.data, data)
         response = view(request, pk=formid)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
         dataid = 'INVALID'
         data = _data_instance(dataid)
@@ -223,12 +236,194 @@ class TestDataViewSet(TestBase):
         dataid = self.xform.instances.all()[0].pk
         response = view(request, pk=formid)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(_get_records(response)), 4)
         query_str = '{"_id": "%s"}' % dataid
         request = self.factory.get('/?query=%s' % query_str, **self.extra)
         response = view(request, pk=formid)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(_get_records(response)), 1)
+
+    def test_data_with_cursor(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        formid = self.xform.pk
+        instance_ids = list(
+            self.xform.instances.order_by('pk').values_list('pk', flat=True)
+        )
+
+        request = self.factory.get('/?limit=3', **self.extra)
+        response = view(request, pk=formid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [record['_id'] for record in _get_records(response)],
+            instance_ids[:3],
+        )
+        cursor = response['X-Next-Cursor']
+
+        request = self.factory.get(
+            '/', {'limit': 3, 'cursor': cursor}, **self.extra
+        )
+        response = view(request, pk=formid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [record['_id'] for record in _get_records(response)],
+            instance_ids[3:],
+        )
+        # Last page
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+        request = self.factory.get('/?cursor=invalid', **self.extra)
+        response = view(request, pk=formid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_data_with_cursor_and_sort(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        formid = self.xform.pk
+        # Some records do not have this key, and others share its value
+        sort_key = 'transport/available_transportation_types_to_referral_facility'
+        sort = json.dumps({sort_key: -1})
+        request = self.factory.get('/', {'sort': sort}, **self.extra)
+        response = view(request, pk=formid)
+        expected_ids = [record['_id'] for record in _get_records(response)]
+        self.assertEqual(len(expected_ids), 4)
+
+        # Follow the `Link` headers, one record at a time
+        request = self.factory.get(
+            '/', {'limit': 1, 'sort': sort}, **self.extra
+        )
+        response = view(request, pk=formid)
+        first_cursor = response['X-Next-Cursor']
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(record['_id'] for record in _get_records(response))
+            if not response.has_header('Link'):
+                break
+            link = response['Link']
+            self.assertTrue(link.endswith('>; rel="next"'))
+            next_url = link[1:-len('>; rel="next"')]
+            self.assertIn(f"cursor={response['X-Next-Cursor']}", next_url)
+            response = view(
+                self.factory.get(next_url, **self.extra), pk=formid
+            )
+        self.assertEqual(ids, expected_ids)
+
+        # The cursor remembers its sort, which cannot be changed
+        request = self.factory.get(
+            '/', {'limit': 1, 'cursor': first_cursor}, **self.extra
+        )
+        response = view(request, pk=formid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(_get_records(response)[0]['_id'], expected_ids[1])
+        request = self.factory.get(
+            '/',
+            {'limit': 1, 'cursor': first_cursor, 'sort': '{"_id": -1}'},
+            **self.extra
+        )
+        response = view(request, pk=formid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_data_streaming(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        formid = self.xform.pk
+        # Off by default
+        request = self.factory.get('/', **self.extra)
+        response = view(request, pk=formid)
+        self.assertFalse(response.streaming)
+        expected = response.data
+
+        with override_settings(STREAMING_DATA_ENABLED=True):
+            request = self.factory.get('/', **self.extra)
+            response = view(request, pk=formid)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(
+                json.loads(b''.join(response.streaming_content)), expected
+            )
+
+            request = self.factory.get('/?query={"_id": -1}', **self.extra)
+            response = view(request, pk=formid)
+            self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+            # Counts are not streamed
+            request = self.factory.get('/?count=1', **self.extra)
+            response = view(request, pk=formid)
+            self.assertFalse(response.streaming)
+
+            request = self.factory.get('/?cursor=invalid', **self.extra)
+            response = view(request, pk=formid)
+            self.assertFalse(response.streaming)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    @override_settings(STREAMING_DATA_ENABLED=True)
+    def test_data_streamed(self):
+        self.test_data()
+
+    @override_settings(STREAMING_DATA_ENABLED=True)
+    def test_data_with_cursor_streamed(self):
+        self.test_data_with_cursor()
+
+    @override_settings(STREAMING_DATA_ENABLED=True)
+    def test_data_with_cursor_and_sort_streamed(self):
+        self.test_data_with_cursor_and_sort()
+
+    def test_data_count(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        formid = self.xform.pk
+        instance_ids = list(
+            self.xform.instances.order_by('pk').values_list('pk', flat=True)
+        )
+        count_documents = (
+            'onadata.apps.viewer.models.parsed_instance.xform_instances'
+            '.count_documents'
+        )
+
+        # Unfiltered counts do not query MongoDB
+        request = self.factory.get('/', {'count': 1}, **self.extra)
+        with patch(count_documents) as mock_count_documents:
+            response = view(request, pk=formid)
+        mock_count_documents.assert_not_called()
+        self.assertEqual(response.data, {'count': 4})
+        # ...unless `num_of_submissions` lags behind MongoDB
+        with override_settings(COALESCE_SUBMISSION_COUNTERS=True):
+            with patch(
+                count_documents, return_value=4
+            ) as mock_count_documents:
+                response = view(request, pk=formid)
+        mock_count_documents.assert_called_once()
+        self.assertEqual(response.data, {'count': 4})
+
+        query = json.dumps({'_id': {'$gt': instance_ids[0]}})
+        request = self.factory.get(
+            '/', {'count': 1, 'query': query}, **self.extra
+        )
+        response = view(request, pk=formid)
+        self.assertEqual(response.data, {'count': 3})
+        # Filtered counts are cached
+        with patch(count_documents) as mock_count_documents:
+            response = view(request, pk=formid)
+        mock_count_documents.assert_not_called()
+        self.assertEqual(response.data, {'count': 3})
+
+        # Deleting a submission invalidates them
+        delete_view = DataViewSet.as_view({'delete': 'destroy'})
+        response = delete_view(
+            self.factory.delete('/', **self.extra),
+            pk=formid,
+            dataid=instance_ids[-1],
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = view(request, pk=formid)
+        self.assertEqual(response.data, {'count': 2})
+        request = self.factory.get('/', {'count': 1}, **self.extra)
+        response = view(request, pk=formid)
+        self.assertEqual(response.data, {'count': 3})
 
     def test_anon_data_list(self):
         self._make_submissions()
@@ -419,11 +614,12 @@ class TestDataViewSet(TestBase):
         response = view(request, pk=formid)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
         dataid = self.xform.instances.all().order_by('id')[0].pk
         data = _data_instance(dataid)
-        response_first_element = sorted(response.data, key=lambda x: x['_id'])[0]
+        response_first_element = sorted(records, key=lambda x: x['_id'])[0]
         self.assertEqual(dict(response_first_element, **data),
                          response_first_element)
 
@@ -435,11 +631,12 @@ class TestDataViewSet(TestBase):
         response = view(request, pk=formid)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
         dataid = self.xform.instances.all().order_by('id')[0].pk
         data = _data_instance(dataid)
-        response_first_element = sorted(response.data, key=lambda x: x['_id'])[0]
+        response_first_element = sorted(records, key=lambda x: x['_id'])[0]
         self.assertEqual(dict(response_first_element, **data),
                          response_first_element)
 
@@ -455,7 +652,8 @@ class TestDataViewSet(TestBase):
         self.assertEqual(response.data, data)
         response = view(request, pk=formid)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        records = _get_records(response)
+        self.assertIsInstance(records, list)
         self.assertTrue(self.xform.instances.count())
         dataid = self.xform.instances.all().order_by('id')[0].pk
 
@@ -477,7 +675,7 @@ class TestDataViewSet(TestBase):
             '_status': 'submitted_via_web',
             '_id': dataid
         }
-        response_first_element = sorted(response.data, key=lambda x: x['_id'])[0]
+        response_first_element = sorted(records, key=lambda x: x['_id'])[0]
         self.assertEqual(dict(response_first_element, **data),
                          response_first_element)
 
@@ -1,11 +1,14 @@
 # coding: utf-8
 import os
 
-from django.test import RequestFactory
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, override_settings
 
 from onadata.apps.api.viewsets.xform_viewset import XFormViewSet
 from onadata.apps.api.viewsets.data_viewset import DataViewSet
 from onadata.apps.main.tests.test_base import TestBase
+from onadata.apps.viewer.models.export import Export
+from onadata.libs.utils.export_tools import generate_export
 
 
 class TestExportViewSet(TestBase):
@@ -52,6 +55,28 @@ class TestExportViewSet(TestBase):
                          'application/vnd.openxmlformats')
         self.assertEqual(ext, '.xlsx')
 
+        # parquet
+        request = self.factory.get('/', **self.extra)
+        response = view(request, pk=formid, format='parquet')
+        self.assertEqual(response.status_code, 200)
+        headers = dict(response.items())
+        content_disposition = headers['Content-Disposition']
+        filename = self._filename_from_disposition(content_disposition)
+        basename, ext = os.path.splitext(filename)
+        self.assertEqual(headers['Content-Type'], 'application/zip')
+        self.assertEqual(ext, '.zip')
+
+        # jsonl
+        request = self.factory.get('/', **self.extra)
+        response = view(request, pk=formid, format='jsonl')
+        self.assertEqual(response.status_code, 200)
+        headers = dict(response.items())
+        content_disposition = headers['Content-Disposition']
+        filename = self._filename_from_disposition(content_disposition)
+        basename, ext = os.path.splitext(filename)
+        self.assertEqual(headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(ext, '.jsonl')
+
     def test_data_export(self):
         self._make_submissions()
         view = DataViewSet.as_view({
@@ -80,3 +105,47 @@ class TestExportViewSet(TestBase):
         self.assertEqual(headers['Content-Type'],
                          'application/vnd.openxmlformats')
         self.assertEqual(ext, '.xlsx')
+
+    def test_filtered_data_export_is_not_streamed_by_default(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({
+            'get': 'list'
+        })
+        formid = self.xform.pk
+        for export_type in [Export.CSV_EXPORT, Export.JSONL_EXPORT]:
+            request = self.factory.get('/', {'query': '{}'}, **self.extra)
+            response = view(request, pk=formid, format=export_type)
+            self.assertEqual(response.status_code, 200)
+            # The saved export is served
+            self.assertTrue(response.has_header('Content-Length'))
+            self.assertTrue(Export.objects.filter(
+                xform=self.xform, export_type=export_type).exists())
+
+    @override_settings(STREAMING_EXPORTS_ENABLED=True)
+    def test_filtered_data_export_is_streamed(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({
+            'get': 'list'
+        })
+        formid = self.xform.pk
+        for export_type in [Export.CSV_EXPORT, Export.JSONL_EXPORT]:
+            request = self.factory.get('/', {'query': '{}'}, **self.extra)
+            response = view(request, pk=formid, format=export_type)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content)
+            # Nothing is saved
+            self.assertFalse(Export.objects.filter(
+                xform=self.xform, export_type=export_type).exists())
+
+            export = generate_export(
+                export_type, export_type, self.user.username,
+                self.xform.id_string)
+            with default_storage.open(export.filepath) as f:
+                self.assertEqual(content, f.read())
+
+        # No submissions match
+        request = self.factory.get(
+            '/', {'query': '{"_id": -1}'}, **self.extra)
+        response = view(request, pk=formid, format='csv')
+        self.assertEqual(response.status_code, 404)
@@ -1,4 +1,5 @@
 # coding: utf-8
+import hashlib
 import os
 import uuid
 
@@ -9,6 +10,7 @@ from django.core.files.uploadedfile import InMemoryUploadedFile
 from django_digest.test import DigestAuth
 from guardian.shortcuts import assign_perm
 from kobo_service_account.utils import get_request_headers
+from mock import patch
 from rest_framework import status
 
 from onadata.apps.api.tests.viewsets.test_abstract_viewset import \
@@ -18,7 +20,10 @@ from onadata.apps.logger.models import Attachment
 from onadata.libs.constants import (
     CAN_ADD_SUBMISSIONS
 )
-from onadata.libs.utils.logger_tools import OpenRosaTemporarilyUnavailable
+from onadata.libs.utils.logger_tools import (
+    OpenRosaTemporarilyUnavailable,
+    safe_create_instance,
+)
 
 
 class TestXFormSubmissionApi(TestAbstractViewSet):
@@ -95,6 +100,46 @@ class TestXFormSubmissionApi(TestAbstractViewSet):
                     f'http://testserver/{self.user.username}/submission',
                 )
 
+    def test_post_submission_hashes_uploaded_files(self):
+        self.xform.require_auth = False
+        self.xform.save(update_fields=['require_auth'])
+
+        s = self.surveys[0]
+        media_file = '1335783522563.jpg'
+        instance_path = os.path.join(
+            self.main_directory, 'fixtures', 'transportation', 'instances', s
+        )
+        media_files = []
+
+        def create_instance(username, xml_file, files, *args):
+            # `files` can only be iterated over once
+            media_files.extend(files)
+            return safe_create_instance(
+                username, xml_file, media_files, *args
+            )
+
+        with open(os.path.join(instance_path, media_file), 'rb') as f:
+            media_hash = hashlib.md5(f.read()).hexdigest()
+            f.seek(0)
+            with open(os.path.join(instance_path, s + '.xml')) as sf:
+                data = {'xml_submission_file': sf, 'media_file': f}
+                request = self.factory.post(
+                    f'/{self.user.username}/submission', data
+                )
+                request.user = AnonymousUser()
+                with patch(
+                    'onadata.apps.api.viewsets.xform_submission_api'
+                    '.safe_create_instance',
+                    side_effect=create_instance,
+                ):
+                    response = self.view(
+                        request, username=self.user.username
+                    )
+        self.assertEqual(response.status_code, 201)
+        # Hashed by `SpooledHashingFileUploadHandler` while uploaded
+        self.assertEqual(len(media_files), 1)
+        self.assertEqual(media_files[0].file_hash, media_hash)
+
     def test_post_submission_authenticated(self):
         s = self.surveys[0]
         media_file = '1335783522563.jpg'
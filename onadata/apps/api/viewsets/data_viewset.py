@@ -3,9 +3,10 @@ import logging
 import json
 from typing import Union
 
+from django.conf import settings
 from django.db.models import Q
 from django.db.models.signals import pre_delete, post_delete
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as t
 from kobo_service_account.models import ServiceAccountUser
@@ -17,6 +18,7 @@ from rest_framework.viewsets import ModelViewSet
 from rest_framework.exceptions import ParseError
 from rest_framework.serializers import ValidationError
 from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from onadata.apps.api.exceptions import NoConfirmationProvidedException
 from onadata.apps.api.viewsets.xform_viewset import custom_response_handler
@@ -249,6 +251,22 @@ API Parameters</a>.
 >            }
 >        ]
 
+## Page through submitted data of a specific form
+Submitted data is returned by ascending `_id`, or in the order of `sort` if it
+has a single key, in pages of at most `limit` records. When a page is full,
+the `X-Next-Cursor` response header contains a cursor to pass back with the
+`cursor` query parameter to get the next page, and the `Link` header contains
+the URL of the next page (`rel="next"`).
+Unlike `start`, the cost of getting a page does not grow with its position.
+`cursor` cannot be combined with `start`. The cursor remembers the `sort` of
+the first page, which may be omitted afterwards but cannot be changed.
+<pre class="prettyprint">
+<b>GET</b> /api/v1/data/<code>{pk}</code>?limit=1000&cursor=<code>{cursor}</code></pre>
+> Example
+>
+>       curl -X GET 'https://example.com/api/v1/data/22845?limit=1000&\
+cursor=eyJfaWQiOiA0NTAzfQ=='
+
 ## Query submitted data of a specific form using Tags
 Provides a list of json submitted data for a specific form matching specific
 tags. Use the `tags` query parameter to filter the list of forms, `tags`
@@ -721,16 +739,60 @@ Delete a specific submission in a form
         export_type = kwargs.get('format')
         if export_type is None or export_type in ['json']:
             # perform default viewset retrieve, no data export
+            if self._should_stream(request):
+                return self._get_streaming_response(xform)
 
             # With DRF ListSerializer are automatically created and wraps
             # everything in a list. Since this returns a list
             # # already, we unwrap it.
             res = super().list(request, *args, **kwargs)
             res.data = res.data[0]
+            self._set_next_cursor(
+                request,
+                res,
+                DataListSerializer.get_next_cursor(request, res.data),
+            )
             return res
 
         return custom_response_handler(request, xform, query, export_type)
 
+    @staticmethod
+    def _should_stream(request):
+        """
+        Lists of records rendered as JSON are streamed, their count is not
+        """
+        return (
+            settings.STREAMING_DATA_ENABLED
+            and request.accepted_renderer.format == 'json'
+            and not request.query_params.get('count')
+        )
+
+    def _get_streaming_response(self, xform):
+        serializer = self.get_serializer(xform)
+        response = StreamingHttpResponse(
+            serializer.stream_representation(xform),
+            content_type='application/json',
+        )
+        self._set_next_cursor(
+            self.request,
+            response,
+            serializer.get_streaming_next_cursor(xform),
+        )
+        return response
+
+    @staticmethod
+    def _set_next_cursor(request, response, next_cursor):
+        """
+        Point to the next page, if any, with the `X-Next-Cursor` header and
+        with a `Link` header, whose URL keeps all the other query parameters
+        """
+        if not next_cursor:
+            return
+        url = remove_query_param(request.build_absolute_uri(), 'start')
+        url = replace_query_param(url, 'cursor', next_cursor)
+        response['X-Next-Cursor'] = next_cursor
+        response['Link'] = f'<{url}>; rel="next"'
+
     @staticmethod
     def __build_db_queries(xform_, request_data):
 
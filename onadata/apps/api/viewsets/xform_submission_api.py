@@ -30,6 +30,7 @@ from onadata.libs.utils.logger_tools import (
     safe_create_instance,
     UnauthenticatedEditAttempt,
 )
+from onadata.libs.utils.upload_handlers import SpooledHashingFileUploadHandler
 
 
 # 10,000,000 bytes
@@ -165,6 +166,13 @@ Here is some example JSON, it would replace `[the JSON]` above:
             and not issubclass(auth_class, SessionAuthentication)
         ]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Only submissions spool their files one by one and hash attachments
+        # while they are uploaded; other uploads keep Django's default
+        # `FILE_UPLOAD_HANDLERS`. Must be set before the body is parsed
+        request.upload_handlers = [SpooledHashingFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
 
         username = self.kwargs.get('username')
@@ -2,10 +2,11 @@
 import json
 import os
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
-from django.http import Http404, HttpResponseBadRequest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as t
 from kobo_service_account.models import ServiceAccountUser
@@ -32,11 +33,16 @@ from onadata.libs.serializers.xform_serializer import XFormSerializer
 from onadata.libs.utils.common_tags import SUBMISSION_TIME
 from onadata.libs.utils.csv_import import submit_csv
 from onadata.libs.utils.export_tools import (
+    STREAMING_EXPORT_TYPES,
     generate_export,
     should_create_new_export,
+    stream_export,
 )
 from onadata.libs.utils.export_tools import newset_export_for
-from onadata.libs.utils.logger_tools import response_with_mimetype_and_name
+from onadata.libs.utils.logger_tools import (
+    disposition_ext_and_date,
+    response_with_mimetype_and_name,
+)
 from onadata.libs.utils.storage import rmdir
 from onadata.libs.utils.string import str2bool
 from onadata.libs.utils.viewer_tools import format_date_for_mongo
@@ -45,6 +51,8 @@ EXPORT_EXT = {
     'xls': Export.XLS_EXPORT,
     'xlsx': Export.XLS_EXPORT,
     'csv': Export.CSV_EXPORT,
+    'parquet': Export.PARQUET_EXPORT,
+    'jsonl': Export.JSONL_EXPORT,
 }
 
 
@@ -65,6 +73,9 @@ def _get_extension_from_export_type(export_type):
 
     if export_type == Export.XLS_EXPORT:
         extension = 'xlsx'
+    elif export_type == Export.PARQUET_EXPORT:
+        # one Parquet file per section
+        extension = 'zip'
 
     return extension
 
@@ -112,6 +123,28 @@ def _generate_new_export(request, xform, query, export_type):
         return export
 
 
+def _stream_export(request, xform, query, export_type):
+    query = _set_start_end_params(request, query)
+    extension = _get_extension_from_export_type(export_type)
+
+    try:
+        content = stream_export(
+            export_type, xform.user.username, xform.id_string, query
+        )
+    except NoRecordsFoundError:
+        raise Http404(t("No records found to export"))
+
+    id_string = None if request.GET.get('raw') else xform.id_string
+    response = StreamingHttpResponse(
+        content,
+        content_type='application/%s' % Export.EXPORT_MIMES[extension],
+    )
+    response['Content-Disposition'] = disposition_ext_and_date(
+        id_string, extension
+    )
+    return response
+
+
 def _get_user(username):
     users = User.objects.filter(username=username)
 
@@ -146,6 +179,27 @@ def response_for_format(form, format=None):
     return Response(formatted_data)
 
 
+def should_stream_export(xform, export_type, request):
+    """
+    Filtered exports, which are never saved, and new exports of forms with few
+    submissions are streamed to the client while they are generated
+    """
+    if (
+        not settings.STREAMING_EXPORTS_ENABLED
+        or export_type not in STREAMING_EXPORT_TYPES
+    ):
+        return False
+
+    if 'start' in request.GET or 'end' in request.GET or\
+            'query' in request.GET:
+        return True
+
+    return (
+        xform.num_of_submissions <= settings.STREAMING_EXPORTS_MAX_SUBMISSIONS
+        and should_create_new_export(xform, export_type)
+    )
+
+
 def should_regenerate_export(xform, export_type, request):
     return should_create_new_export(xform, export_type) or\
         'start' in request.GET or 'end' in request.GET or\
@@ -162,6 +216,9 @@ def value_for_type(form, field, value):
 def custom_response_handler(request, xform, query, export_type):
     export_type = _get_export_type(export_type)
 
+    if should_stream_export(xform, export_type, request):
+        return _stream_export(request, xform, query, export_type)
+
     # check if we need to re-generate,
     # we always re-generate if a filter is specified
     if should_regenerate_export(xform, export_type, request):
@@ -506,14 +563,17 @@ https://example.com/api/v1/forms/28058/enketo
 >
 >        HTTP 200 OK
 
-## Get form data in xls, csv format.
+## Get form data in xls, csv, parquet, jsonl format.
 
-Get form data exported as xls, csv, csv zip, sav zip format.
+Get form data exported as xls, csv, csv zip, sav zip format, or as a ZIP
+archive of Parquet files, one per repeat section, with typed columns, or as
+JSON Lines, one object per row, whose `_table` is the name of its section.
 
 Where:
 
 - `pk` - is the form unique identifier
-- `format` - is the data export format i.e csv, xls, csvzip, savzip
+- `format` - is the data export format i.e csv, xls, csvzip, savzip, parquet,
+ jsonl
 
 <pre class="prettyprint">
 <b>GET</b> /api/v1/forms/{pk}.{format}</code>
@@ -555,6 +615,8 @@ data (instance/submission per row)
         renderers.XLSRenderer,
         renderers.XLSXRenderer,
         renderers.CSVRenderer,
+        renderers.ParquetRenderer,
+        renderers.JSONLRenderer,
         renderers.RawXMLRenderer
     ]
     queryset = XForm.objects.all()
@@ -4,10 +4,11 @@ import shutil
 import tempfile
 import zipfile
 
+from django.conf import settings
 from django.core.files.uploadedfile import InMemoryUploadedFile
 
 from onadata.apps.logger.xform_fs import XFormInstanceFS
-from onadata.libs.utils.logger_tools import create_instance
+from onadata.libs.utils.logger_tools import create_instances_in_bulk
 
 # odk
 # ├── forms
@@ -42,24 +43,22 @@ def django_file(path, field_name, content_type):
     )
 
 
-def iterate_through_instances(dirpath, callback):
-    total_file_count = 0
-    success_count = 0
-    errors = []
-
+def iterate_through_instances(dirpath, batch_size):
+    """
+    Yield the instances found in `dirpath`, as lists of at most `batch_size`
+    `XFormInstanceFS`.
+    """
+    batch = []
     for directory, subdirs, subfiles in os.walk(dirpath):
         for filename in subfiles:
             filepath = os.path.join(directory, filename)
             if XFormInstanceFS.is_valid_instance(filepath):
-                xfxs = XFormInstanceFS(filepath)
-                try:
-                    success_count += callback(xfxs)
-                except Exception as e:
-                    errors.append("%s => %s" % (xfxs.filename, str(e)))
-                del xfxs
-                total_file_count += 1
-
-    return total_file_count, success_count, errors
+                batch.append(XFormInstanceFS(filepath))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
 
 
 def import_instances_from_zip(zipfile_path, user, status="zip"):
@@ -78,31 +77,37 @@ def import_instances_from_zip(zipfile_path, user, status="zip"):
 
 
 def import_instances_from_path(path, user, status="zip"):
-    def callback(xform_fs):
-        """
-        This callback is passed an instance of a XFormInstanceFS.
-        See xform_fs.py for more info.
-        """
-        with django_file(xform_fs.path, field_name="xml_file",
-                         content_type="text/xml") as xml_file:
+    total_count = 0
+    success_count = 0
+    errors = []
+
+    for xforms_fs in iterate_through_instances(
+        path, settings.BULK_SUBMISSION_BATCH_SIZE
+    ):
+        # TODO: if an instance has been submitted make sure all the
+        # files are in the database.
+        # there shouldn't be any instances with a submitted status in the
+        # import.
+        submissions = []
+        for xform_fs in xforms_fs:
             images = [django_file(jpg, field_name="image",
                       content_type="image/jpeg") for jpg in xform_fs.photos]
-            # TODO: if an instance has been submitted make sure all the
-            # files are in the database.
-            # there shouldn't be any instances with a submitted status in the
-            # import.
-            instance = create_instance(user.username, xml_file, images, status)
-
-            for i in images:
-                i.close()
-                i.close()
-
-            if instance:
-                return 1
-            else:
-                return 0
-
-    total_count, success_count, errors = iterate_through_instances(
-        path, callback)
+            submissions.append((xform_fs.xml, images))
+
+        try:
+            results = create_instances_in_bulk(
+                user.username, submissions, status
+            )
+        finally:
+            for xml, images in submissions:
+                for i in images:
+                    i.close()
+
+        for xform_fs, result in zip(xforms_fs, results):
+            total_count += 1
+            if isinstance(result, Exception):
+                errors.append("%s => %s" % (xform_fs.filename, str(result)))
+            elif result:
+                success_count += 1
 
     return total_count, success_count, errors
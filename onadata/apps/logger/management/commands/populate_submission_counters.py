@@ -8,14 +8,16 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.db.models import Count, Value, F, DateField
-from django.db.models.functions import Cast, Concat
+from django.db.models import Count, Value, F, DateField, Sum
+from django.db.models.functions import Cast, Coalesce, Concat
 from django.utils import timezone
 
 from onadata.apps.logger.models import (
     DailyXFormSubmissionCounter,
     MonthlyXFormSubmissionCounter,
+    XForm,
 )
+from onadata.apps.logger.submission_counters import flush_submission_counters
 from onadata.apps.main.models.user_profile import UserProfile
 from onadata.libs.utils.jsonbfield_helper import ReplaceValues
 
@@ -57,12 +59,23 @@ class Command(BaseCommand):
             help='Skip updating monthly counters. Default is False',
         )
 
+        parser.add_argument(
+            '--totals',
+            action='store_true',
+            default=False,
+            help=(
+                'Recalculate the total number of submissions of projects and '
+                'users as well. Default is False'
+            ),
+        )
+
     def handle(self, *args, **kwargs):
         days = kwargs['days']
         self._chunks = kwargs['chunks']
         self._force = kwargs['force']
         self._verbosity = kwargs['verbosity']
         self._skip_monthly = kwargs['skip_monthly']
+        self._totals = kwargs['totals']
         today = timezone.now().date()
         delta = timedelta(days=days)
         date_threshold = today - delta
@@ -93,6 +106,12 @@ class Command(BaseCommand):
 
             self.suspend_submissions_for_user(user)
 
+            if settings.COALESCE_SUBMISSION_COUNTERS:
+                # Apply the counts accumulated before submissions were
+                # suspended; otherwise, they would be added on top of the
+                # recalculated counters
+                flush_submission_counters()
+
             with transaction.atomic():
 
                 self.clean_old_data(user)
@@ -108,6 +127,8 @@ class Command(BaseCommand):
                     self.add_daily_counters(daily_counters)
                     if not self._skip_monthly:
                         self.add_monthly_counters(total_submissions, xf, user)
+                    if self._totals:
+                        self.update_xform_total(xf)
 
                 self.update_user_profile(user)
 
@@ -236,6 +257,13 @@ class Command(BaseCommand):
             'submissions_suspended': False,
             'counters_updates_status': 'complete',
         }
+        profile_updates = {}
+        if self._totals:
+            profile_updates['num_of_submissions'] = (
+                XForm.all_objects.filter(user_id=user.pk).aggregate(
+                    total=Coalesce(Sum('num_of_submissions'), 0)
+                )['total']
+            )
         UserProfile.objects.filter(
             user_id=user.pk
         ).update(
@@ -243,4 +271,12 @@ class Command(BaseCommand):
                 'metadata',
                 updates=updates,
             ),
+            **profile_updates,
+        )
+
+    def update_xform_total(self, xform: 'logger.XForm'):
+        if self._verbosity >= 2:
+            self.stdout.write(f'\tUpdating total number of submissions...')
+        XForm.all_objects.filter(pk=xform.pk).update(
+            num_of_submissions=xform.instances.count()
         )
@@ -9,10 +9,13 @@ Relies solely on the `argparse` capabilities of `BaseCommand` for argument parsi
 :Example:
     python manage.py populate_xml_hashes_for_instances --repopulate --usernames someuser anotheruser
     python manage.py populate_xml_hashes_for_instances --all
+    python manage.py populate_xml_hashes_for_instances --all --processes 8 --resume
 '''
 
 from datetime import datetime
+from hashlib import md5
 
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
 
 from ...models import Instance
@@ -38,15 +41,51 @@ class Command(BaseCommand):
             help='Recalculate even `Instance` objects that already have '
                  'hashes.',
         )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Number of worker processes. Default is 1.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of `Instance` objects updated at once. '
+                 'Default is 2000.',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Resume from the checkpoint saved by a previous interrupted '
+                 'run with the same `--usernames` and `--repopulate` '
+                 'arguments.',
+        )
 
     def handle(self, *_, **options):
         # Populate the `Instance` hashes and track how long it took.
         start_time = datetime.now()
+        checkpoint_key = self._get_checkpoint_key(
+            options['usernames'], options['repopulate']
+        )
+        if not options['resume']:
+            cache.delete(checkpoint_key)
         instances_updated_total = Instance.populate_xml_hashes_for_instances(
             usernames=options['usernames'],
             repopulate=options['repopulate'],
+            processes=options['processes'],
+            chunk_size=options['chunk_size'],
+            checkpoint_key=checkpoint_key,
         )
         execution_time = datetime.now() - start_time
 
         print('Populated {} `Instance` hashes in {}.'.format(
             instances_updated_total, execution_time))
+
+    @staticmethod
+    def _get_checkpoint_key(usernames, repopulate):
+        arguments = f'{sorted(usernames or [])}:{repopulate}'
+        return (
+            'populate_xml_hashes_for_instances:'
+            f'{md5(arguments.encode()).hexdigest()}'
+        )
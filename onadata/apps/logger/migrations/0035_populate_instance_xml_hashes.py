@@ -0,0 +1,42 @@
+# coding: utf-8
+from django.conf import settings
+from django.core.management import call_command
+from django.db import migrations
+
+
+def populate_missing_xml_hashes(apps, schema_editor):
+    if settings.SKIP_HEAVY_MIGRATIONS:
+        print(
+            """
+            !!! ATTENTION !!!
+            If you have existing submissions, you need to run this management command:
+
+               > python manage.py populate_xml_hashes_for_instances --all
+
+            Until you do, submissions without a hash are not detected as duplicates
+            """
+        )
+    else:
+        print(
+            """
+            This might take a while. If it is too slow, you may want to re-run the
+            migration with SKIP_HEAVY_MIGRATIONS=True and run the following management command:
+
+                > python manage.py populate_xml_hashes_for_instances --all
+            """
+        )
+        call_command('populate_xml_hashes_for_instances', all=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0034_set_require_auth_at_project_level'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            populate_missing_xml_hashes,
+            migrations.RunPython.noop,
+        ),
+    ]
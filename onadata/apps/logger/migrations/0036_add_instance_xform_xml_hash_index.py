@@ -0,0 +1,51 @@
+# coding: utf-8
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyIfPostgreSQL(AddIndexConcurrently):
+    """
+    `CREATE INDEX CONCURRENTLY` does not block writes to `logger_instance`
+    while the index is built, but only PostgreSQL supports it. Other
+    databases, e.g. SQLite in tests, build the index the usual way.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        return migrations.AddIndex.database_forwards(
+            self, app_label, schema_editor, from_state, to_state
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        return migrations.AddIndex.database_backwards(
+            self, app_label, schema_editor, from_state, to_state
+        )
+
+
+class Migration(migrations.Migration):
+
+    # `CREATE INDEX CONCURRENTLY` cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('logger', '0035_populate_instance_xml_hashes'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgreSQL(
+            model_name='instance',
+            index=models.Index(
+                fields=['xform', 'xml_hash'],
+                name='logger_inst_xform_i_d10a87_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# coding: utf-8
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0036_add_instance_xform_xml_hash_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionCounterFlush',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flush_id', models.CharField(max_length=32, unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -55,6 +55,14 @@ class Attachment(models.Model):
         app_label = 'logger'
 
     def save(self, *args, **kwargs):
+        self.set_media_file_attributes()
+        super().save(*args, **kwargs)
+
+    def set_media_file_attributes(self):
+        """
+        Set the attributes derived from `media_file`. Called by `save()`, and
+        before `bulk_create()`, which does not call `save()`.
+        """
         if self.media_file:
             self.media_file_basename = self.filename
             if self.mimetype == '':
@@ -66,14 +74,13 @@ class Attachment(models.Model):
             # the storage engine when running reports
             self.media_file_size = self.media_file.size
 
-        super().save(*args, **kwargs)
-
     @property
     def file_hash(self):
         if self.media_file.storage.exists(self.media_file.name):
             media_file_position = self.media_file.tell()
             self.media_file.seek(0)
-            media_file_hash = hash_attachment_contents(self.media_file.read())
+            # Hash the file by chunks rather than reading it at once
+            media_file_hash = hash_attachment_contents(self.media_file)
             self.media_file.seek(media_file_position)
             return media_file_hash
         return ''
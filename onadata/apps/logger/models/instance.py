@@ -1,4 +1,6 @@
 # coding: utf-8
+import multiprocessing
+from collections import Counter, defaultdict
 from hashlib import sha256
 
 try:
@@ -7,11 +9,13 @@ except ImportError:
     from backports.zoneinfo import ZoneInfo
 
 import reversion
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import GeometryCollection, Point
-from django.db import transaction
-from django.db.models import Case, F, When
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import Case, F, Max, Min, When
 from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.utils import timezone
@@ -32,8 +36,13 @@ from onadata.apps.logger.models.daily_xform_submission_counter import (
 from onadata.apps.logger.models.monthly_xform_submission_counter import (
     MonthlyXFormSubmissionCounter,
 )
-from onadata.apps.logger.xform_instance_parser import XFormInstanceParser, \
-    clean_and_parse_xml, get_uuid_from_xml
+from onadata.apps.logger.submission_counters import (
+    increment_submission_counters,
+)
+from onadata.apps.logger.xform_instance_parser import (
+    ParsedSubmission,
+    XFormInstanceParser,
+)
 from onadata.libs.utils.common_tags import (
     ATTACHMENTS,
     GEOLOCATION,
@@ -52,25 +61,13 @@ from onadata.libs.utils.model_tools import set_uuid
 # need to establish id_string of the xform before we run get_dict since
 # we now rely on data dictionary to parse the xml
 def get_id_string_from_xml_str(xml_str):
-    xml_obj = clean_and_parse_xml(xml_str)
-    root_node = xml_obj.documentElement
-    id_string = root_node.getAttribute('id')
-
-    if len(id_string) == 0:
-        # may be hidden in submission/data/id_string
-        elems = root_node.getElementsByTagName('data')
-
-        for data in elems:
-            for child in data.childNodes:
-                id_string = data.childNodes[0].getAttribute('id')
-
-                if len(id_string) > 0:
-                    break
-
-            if len(id_string) > 0:
-                break
-
-    return id_string
+    """
+    `xml_str` can be either a string or a `ParsedSubmission`, whose tree is
+    read with its own engine instead of being parsed again with minidom
+    """
+    if not isinstance(xml_str, ParsedSubmission):
+        xml_str = ParsedSubmission(xml_str)
+    return xml_str.id_string
 
 
 def submission_time():
@@ -83,6 +80,15 @@ def update_xform_submission_count(sender, instance, created, **kwargs):
     # `defer_counting` is a Python-only attribute
     if getattr(instance, 'defer_counting', False):
         return
+    if settings.COALESCE_SUBMISSION_COUNTERS:
+        # Accumulates the daily and monthly counters as well, see
+        # `update_xform_daily_counter()` and `update_xform_monthly_counter()`.
+        # Redis is not rolled back with the database: submissions are only
+        # counted once they are committed
+        transaction.on_commit(
+            lambda: increment_submission_counters([instance])
+        )
+        return
     with transaction.atomic():
         xform = XForm.objects.only('user_id').get(pk=instance.xform_id)
         # Update with `F` expression instead of `select_for_update` to avoid
@@ -134,6 +140,9 @@ def update_xform_daily_counter(sender, instance, created, **kwargs):
         return
     if getattr(instance, 'defer_counting', False):
         return
+    if settings.COALESCE_SUBMISSION_COUNTERS:
+        # Handled by `update_xform_submission_count()`
+        return
 
     # get the date submitted
     date_created = instance.date_created.date()
@@ -157,6 +166,9 @@ def update_xform_monthly_counter(sender, instance, created, **kwargs):
         return
     if getattr(instance, 'defer_counting', False):
         return
+    if settings.COALESCE_SUBMISSION_COUNTERS:
+        # Handled by `update_xform_submission_count()`
+        return
 
     # get the user_id for the xform the instance was submitted for
     xform = XForm.objects.only('pk', 'user_id').get(
@@ -182,6 +194,79 @@ def update_xform_monthly_counter(sender, instance, created, **kwargs):
     ).update(counter=F('counter') + 1)
 
 
+def update_xform_counters_in_bulk(instances):
+    """
+    Update the submission counters for many new `instances` at once, i.e. the
+    counters `update_xform_submission_count()`, `update_xform_daily_counter()`
+    and `update_xform_monthly_counter()` update one submission at a time.
+    Counts are aggregated, so that each form, day, month and user is updated
+    only once.
+    """
+    instances_by_xform = defaultdict(list)
+    for instance in instances:
+        instances_by_xform[instance.xform_id].append(instance)
+
+    if not instances_by_xform:
+        return
+
+    if settings.COALESCE_SUBMISSION_COUNTERS:
+        # See `update_xform_submission_count()`
+        transaction.on_commit(
+            lambda: increment_submission_counters(instances)
+        )
+        return
+
+    submissions_by_user = Counter()
+    xforms = XForm.objects.only('pk', 'user_id').in_bulk(
+        list(instances_by_xform)
+    )
+
+    with transaction.atomic():
+        for xform_id, xform_instances in instances_by_xform.items():
+            user_id = xforms[xform_id].user_id
+            submissions_by_user[user_id] += len(xform_instances)
+            XForm.objects.filter(pk=xform_id).update(
+                num_of_submissions=F('num_of_submissions')
+                + len(xform_instances),
+                last_submission_time=max(
+                    instance.date_created for instance in xform_instances
+                ),
+            )
+
+            daily_counts = Counter(
+                instance.date_created.date() for instance in xform_instances
+            )
+            for date_created, count in daily_counts.items():
+                DailyXFormSubmissionCounter.objects.get_or_create(
+                    date=date_created, xform_id=xform_id, user_id=user_id
+                )
+                DailyXFormSubmissionCounter.objects.filter(
+                    date=date_created, xform_id=xform_id
+                ).update(counter=F('counter') + count)
+
+            monthly_counts = Counter(
+                (instance.date_created.year, instance.date_created.month)
+                for instance in xform_instances
+            )
+            for (year, month), count in monthly_counts.items():
+                MonthlyXFormSubmissionCounter.objects.get_or_create(
+                    user_id=user_id, xform_id=xform_id, year=year, month=month
+                )
+                MonthlyXFormSubmissionCounter.objects.filter(
+                    xform_id=xform_id, year=year, month=month
+                ).update(counter=F('counter') + count)
+
+        # Hack to avoid circular imports
+        UserProfile = User.profile.related.related_model  # noqa
+        for user_id, count in submissions_by_user.items():
+            profile, created = UserProfile.objects.only('pk').get_or_create(
+                user_id=user_id
+            )
+            UserProfile.objects.filter(pk=profile.pk).update(
+                num_of_submissions=F('num_of_submissions') + count,
+            )
+
+
 def update_xform_submission_count_delete(sender, instance, **kwargs):
 
     value = kwargs.pop('value', 1)
@@ -222,10 +307,21 @@ def update_xform_submission_count_delete(sender, instance, **kwargs):
         )
 
 
+def _populate_xml_hashes_for_segment(segment):
+    """
+    Entry point of `Instance.populate_xml_hashes_for_instances()` workers,
+    which must be a module-level function to be pickled.
+    """
+    return Instance._populate_xml_hashes_for_pk_range(*segment)
+
+
 @reversion.register
 class Instance(models.Model):
     XML_HASH_LENGTH = 64
     DEFAULT_XML_HASH = None
+    # Number of chunks in each primary key segment processed by a worker of
+    # `populate_xml_hashes_for_instances()`
+    XML_HASH_SEGMENT_CHUNKS = 10
 
     json = JSONField(default={}, null=False)
     xml = models.TextField()
@@ -268,6 +364,10 @@ class Instance(models.Model):
 
     class Meta:
         app_label = 'logger'
+        indexes = [
+            # Duplicate detection, see `create_instance()`
+            models.Index(fields=['xform', 'xml_hash']),
+        ]
 
     @property
     def asset(self):
@@ -296,9 +396,16 @@ class Instance(models.Model):
         if profile.metadata.get('submissions_suspended', False):
             raise TemporarilyUnavailableError()
 
+    def _get_data_dictionary(self):
+        # Fetch the data dictionary only once per `Instance`; its survey comes
+        # from the per-process survey cache
+        if not hasattr(self, '_data_dictionary'):
+            self._data_dictionary = self.xform.data_dictionary()
+        return self._data_dictionary
+
     def _set_geom(self):
         xform = self.xform
-        data_dictionary = xform.data_dictionary()
+        data_dictionary = self._get_data_dictionary()
         geo_xpaths = data_dictionary.geopoint_xpaths()
         doc = self.get_dict()
         points = []
@@ -334,10 +441,22 @@ class Instance(models.Model):
             if self.user is not None else None
         self.json = doc
 
+    def _get_parsed_submission(self) -> ParsedSubmission:
+        """
+        Return the `ParsedSubmission` for `self.xml`, reusing the one handed
+        over by `create_instance()` (as the Python-only attribute
+        `parsed_submission`) as long as it still matches `self.xml`.
+        """
+        parsed_submission = getattr(self, 'parsed_submission', None)
+        if parsed_submission is None or parsed_submission.xml != self.xml:
+            parsed_submission = ParsedSubmission(self.xml)
+            self.parsed_submission = parsed_submission
+        return parsed_submission
+
     def _set_parser(self):
         if not hasattr(self, "_parser"):
             self._parser = XFormInstanceParser(
-                self.xml, self.xform.data_dictionary())
+                self._get_parsed_submission(), self._get_data_dictionary())
 
     def _set_survey_type(self):
         self.survey_type, created = \
@@ -345,7 +464,7 @@ class Instance(models.Model):
 
     def _set_uuid(self):
         if self.xml and not self.uuid:
-            uuid = get_uuid_from_xml(self.xml)
+            uuid = self._get_parsed_submission().uuid
             if uuid is not None:
                 self.uuid = uuid
         set_uuid(self)
@@ -358,16 +477,33 @@ class Instance(models.Model):
         self.xml_hash = self.get_hash(self.xml)
 
     @classmethod
-    def populate_xml_hashes_for_instances(cls, usernames=None, pk__in=None, repopulate=False):
+    def populate_xml_hashes_for_instances(
+        cls,
+        usernames=None,
+        pk__in=None,
+        repopulate=False,
+        processes=1,
+        chunk_size=2000,
+        checkpoint_key=None,
+    ):
         """
         Populate the `xml_hash` field for `Instance` instances limited to the specified users
         and/or DB primary keys.
 
+        Primary keys are split into segments of `XML_HASH_SEGMENT_CHUNKS` chunks, which are
+        handed to a pool of `processes` worker processes. Each segment is walked by keyset
+        pagination and each chunk is written with a single `UPDATE` statement.
+
         :param list[str] usernames: Optional list of usernames for whom `Instance`s will be
         populated with hashes.
         :param list[int] pk__in: Optional list of primary keys for `Instance`s that should be
         populated with hashes.
         :param bool repopulate: Optional argument to force repopulation of existing hashes.
+        :param int processes: Number of worker processes. `1` runs in the current process.
+        :param int chunk_size: Number of `Instance`s hashed and updated at once.
+        :param str checkpoint_key: Optional cache key under which the primary key up to which
+        all `Instance`s have been processed is saved. If the key already exists, processing
+        resumes from there. It is deleted once everything has been processed.
         :returns: Total number of `Instance`s updated.
         :rtype: int
         """
@@ -381,41 +517,109 @@ class Instance(models.Model):
         if not repopulate:
             filter_kwargs['xml_hash'] = cls.DEFAULT_XML_HASH
 
-        # Query for the target `Instance`s.
-        target_instances_queryset = cls.objects.filter(**filter_kwargs)
-
+        pk_range = cls.objects.filter(**filter_kwargs).aggregate(
+            min_pk=Min('pk'), max_pk=Max('pk')
+        )
         # Exit quickly if there's nothing to do.
-        if not target_instances_queryset.exists():
+        if pk_range['min_pk'] is None:
+            if checkpoint_key:
+                cache.delete(checkpoint_key)
             return 0
 
-        # Limit our queryset result content since we'll only need the `pk` and `xml` attributes.
-        target_instances_queryset = target_instances_queryset.only('pk', 'xml')
-        instances_updated_total = 0
+        first_pk = pk_range['min_pk']
+        if checkpoint_key and (checkpoint := cache.get(checkpoint_key)):
+            first_pk = max(first_pk, checkpoint + 1)
+
+        segment_size = chunk_size * cls.XML_HASH_SEGMENT_CHUNKS
+        segments = [
+            (
+                filter_kwargs,
+                start_pk,
+                min(start_pk + segment_size - 1, pk_range['max_pk']),
+                chunk_size,
+            )
+            for start_pk in range(first_pk, pk_range['max_pk'] + 1, segment_size)
+        ]
+
+        if processes > 1:
+            # Worker processes must not share the parent's DB connections
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(processes)
+            # `imap()` yields results in order, thus every segment before the
+            # checkpoint is complete, even though segments run concurrently
+            results = pool.imap(_populate_xml_hashes_for_segment, segments)
+        else:
+            pool = None
+            results = map(_populate_xml_hashes_for_segment, segments)
 
-        # Break the potentially large `target_instances_queryset` into chunks to avoid memory
-        # exhaustion.
-        chunk_size = 2000
-        target_instances_queryset = target_instances_queryset.order_by('pk')
-        target_instances_qs_chunk = target_instances_queryset
-        while target_instances_qs_chunk.exists():
-            # Take a chunk of the target `Instance`s.
-            target_instances_qs_chunk = target_instances_qs_chunk[0:chunk_size]
-
-            for instance in target_instances_qs_chunk:
-                pk = instance.pk
-                xml = instance.xml
-                # Do a `Queryset.update()` on this individual instance to avoid signals triggering
-                # things like `Reversion` versioning.
-                instances_updated_count = Instance.objects.filter(pk=pk).update(
-                    xml_hash=cls.get_hash(xml))
+        instances_updated_total = 0
+        try:
+            for segment, instances_updated_count in zip(segments, results):
                 instances_updated_total += instances_updated_count
+                if checkpoint_key:
+                    cache.set(checkpoint_key, segment[2], None)
+        finally:
+            if pool:
+                pool.terminate()
 
-            # Set up the next chunk
-            target_instances_qs_chunk = target_instances_queryset.filter(
-                pk__gt=instance.pk)
+        if checkpoint_key:
+            cache.delete(checkpoint_key)
 
         return instances_updated_total
 
+    @classmethod
+    def _populate_xml_hashes_for_pk_range(
+        cls, filter_kwargs, start_pk, end_pk, chunk_size
+    ):
+        queryset = (
+            cls.objects.filter(**filter_kwargs)
+            .order_by('pk')
+            .values_list('pk', 'xml')
+        )
+        instances_updated_total = 0
+        last_pk = start_pk - 1
+        while True:
+            # Keyset pagination: every chunk is an index range scan
+            chunk = list(
+                queryset.filter(pk__gt=last_pk, pk__lte=end_pk)[:chunk_size]
+            )
+            if not chunk:
+                break
+            cls._update_xml_hashes(
+                {pk: cls.get_hash(xml) for pk, xml in chunk}
+            )
+            instances_updated_total += len(chunk)
+            last_pk = chunk[-1][0]
+
+        return instances_updated_total
+
+    @classmethod
+    def _update_xml_hashes(cls, xml_hashes):
+        """
+        Write `xml_hashes`, keyed by primary key, with a single statement. Like
+        `Queryset.update()`, it does not trigger signals, e.g. `Reversion`
+        versioning.
+        """
+        if connection.vendor != 'postgresql':
+            cls.objects.bulk_update(
+                [cls(pk=pk, xml_hash=xml_hash) for pk, xml_hash in xml_hashes.items()],
+                ['xml_hash'],
+            )
+            return
+
+        table = connection.ops.quote_name(cls._meta.db_table)
+        values = ', '.join(['(%s::integer, %s)'] * len(xml_hashes))
+        params = [
+            param for pk, xml_hash in xml_hashes.items() for param in (pk, xml_hash)
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET "xml_hash" = v.xml_hash '
+                f'FROM (VALUES {values}) AS v(id, xml_hash) '
+                f'WHERE {table}."id" = v.id',
+                params,
+            )
+
     def get(self, abbreviated_xpath):
         self._set_parser()
         return self._parser.get(abbreviated_xpath)
@@ -0,0 +1,19 @@
+# coding: utf-8
+from django.db import models
+
+
+class SubmissionCounterFlush(models.Model):
+    """
+    Generation of coalesced submission counters applied to the database by
+    `flush_submission_counters()`.
+
+    A row is inserted in the same transaction as the counters, so that a
+    generation whose Redis hashes could not be deleted after the commit is
+    not applied again by the next flush. Only the last generation is kept.
+    """
+
+    flush_id = models.CharField(max_length=32, unique=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'logger'
@@ -0,0 +1,322 @@
+# coding: utf-8
+"""
+Coalesced submission counters.
+
+When `settings.COALESCE_SUBMISSION_COUNTERS` is enabled, new submissions do
+not update `XForm.num_of_submissions`, `UserProfile.num_of_submissions` and
+the daily and monthly counters themselves. They increment Redis hashes
+instead, and the `flush_submission_counters` periodic task applies the
+accumulated deltas to the database, with one statement per table.
+
+`XForm.last_submission_time` is updated by the flush as well, thus counters
+and last submission times lag behind by at most one flush interval.
+"""
+import uuid
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    DateTimeField,
+    F,
+    IntegerField,
+    Value,
+    When,
+)
+from django.utils.dateparse import parse_date, parse_datetime
+from django_redis import get_redis_connection
+
+from onadata.apps.logger.models.daily_xform_submission_counter import (
+    DailyXFormSubmissionCounter,
+)
+from onadata.apps.logger.models.monthly_xform_submission_counter import (
+    MonthlyXFormSubmissionCounter,
+)
+from onadata.apps.logger.models.submission_counter_flush import (
+    SubmissionCounterFlush,
+)
+from onadata.apps.logger.models.xform import XForm
+
+REDIS_KEY_PREFIX = 'submission_counters'
+XFORMS = 'xforms'
+LAST_SUBMISSION_TIMES = 'last_submission_times'
+USERS = 'users'
+DAILY = 'daily'
+MONTHLY = 'monthly'
+HASHES = [XFORMS, LAST_SUBMISSION_TIMES, USERS, DAILY, MONTHLY]
+FLUSH_ID = 'flush_id'
+FLUSH_LOCK = 'submission_counters_flush_lock'
+FLUSH_LOCK_TIMEOUT = 600
+
+
+def increment_submission_counters(instances):
+    """
+    Add new `instances` to the counters accumulated in Redis, with a single
+    round trip.
+    """
+    xforms = Counter()
+    last_submission_times = {}
+    users = Counter()
+    daily = Counter()
+    monthly = Counter()
+
+    for instance in instances:
+        xform = instance.xform
+        date_created = instance.date_created
+        xforms[xform.pk] += 1
+        last_submission_times[xform.pk] = max(
+            date_created, last_submission_times.get(xform.pk, date_created)
+        )
+        users[xform.user_id] += 1
+        daily[f'{xform.pk}:{xform.user_id}:{date_created.date()}'] += 1
+        monthly[
+            f'{xform.pk}:{xform.user_id}:'
+            f'{date_created.year}:{date_created.month}'
+        ] += 1
+
+    if not xforms:
+        return
+
+    # `MULTI`/`EXEC`, so that a flush never sees half of these increments
+    pipeline = _get_redis_client().pipeline(transaction=True)
+    for name, counter in [
+        (XFORMS, xforms),
+        (USERS, users),
+        (DAILY, daily),
+        (MONTHLY, monthly),
+    ]:
+        for field, count in counter.items():
+            pipeline.hincrby(_get_key(name), field, count)
+    for xform_id, last_submission_time in last_submission_times.items():
+        pipeline.hset(
+            _get_key(LAST_SUBMISSION_TIMES),
+            xform_id,
+            last_submission_time.isoformat(),
+        )
+    pipeline.execute()
+
+
+def flush_submission_counters(blocking=True):
+    """
+    Apply the counters accumulated in Redis to the database.
+
+    The Redis hashes are renamed atomically before being read, so that
+    submissions received in the meantime are accumulated for the next flush.
+    Deltas left over by an interrupted flush are applied first.
+
+    Each renamed generation of hashes is tagged with an id, which is recorded
+    in the database in the same transaction as its deltas: a generation
+    whose hashes were not deleted after the commit is not applied twice.
+
+    Returns `False` if `blocking` is `False` and another flush is running.
+    """
+    lock = cache.lock(FLUSH_LOCK, timeout=FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(
+        blocking=blocking, blocking_timeout=FLUSH_LOCK_TIMEOUT
+    ):
+        return False
+
+    try:
+        redis_client = _get_redis_client()
+        flushing_keys = [_get_key(name, flushing=True) for name in HASHES]
+        flush_id_key = _get_key(FLUSH_ID, flushing=True)
+        if not redis_client.exists(*flushing_keys):
+            # Only flushes delete these hashes, and we hold the lock: they
+            # cannot disappear between `EXISTS` and `RENAME`
+            pipeline = redis_client.pipeline(transaction=True)
+            for name in HASHES:
+                if redis_client.exists(_get_key(name)):
+                    pipeline.rename(
+                        _get_key(name), _get_key(name, flushing=True)
+                    )
+            pipeline.set(flush_id_key, uuid.uuid4().hex)
+            pipeline.execute()
+
+        flush_id = redis_client.get(flush_id_key)
+        if flush_id is None:
+            # Left over by a flush which did not tag its generation
+            flush_id = uuid.uuid4().hex
+            redis_client.set(flush_id_key, flush_id)
+        else:
+            flush_id = flush_id.decode()
+
+        deltas = {
+            name: {
+                field.decode(): value.decode()
+                for field, value in redis_client.hgetall(
+                    _get_key(name, flushing=True)
+                ).items()
+            }
+            for name in HASHES
+        }
+        with transaction.atomic():
+            already_applied = SubmissionCounterFlush.objects.filter(
+                flush_id=flush_id
+            ).exists()
+            if any(deltas.values()) and not already_applied:
+                apply_submission_counters(
+                    xforms={
+                        int(k): int(v) for k, v in deltas[XFORMS].items()
+                    },
+                    last_submission_times={
+                        int(k): parse_datetime(v)
+                        for k, v in deltas[LAST_SUBMISSION_TIMES].items()
+                    },
+                    users={int(k): int(v) for k, v in deltas[USERS].items()},
+                    daily={
+                        _parse_daily_field(k): int(v)
+                        for k, v in deltas[DAILY].items()
+                    },
+                    monthly={
+                        tuple(int(part) for part in k.split(':')): int(v)
+                        for k, v in deltas[MONTHLY].items()
+                    },
+                )
+                # Hashes of previous generations are gone, otherwise they
+                # would have been flushed instead of this one
+                SubmissionCounterFlush.objects.all().delete()
+                SubmissionCounterFlush.objects.create(flush_id=flush_id)
+        redis_client.delete(*flushing_keys, flush_id_key)
+    finally:
+        lock.release()
+
+    return True
+
+
+def apply_submission_counters(
+    xforms: dict,
+    last_submission_times: dict,
+    users: dict,
+    daily: dict,
+    monthly: dict,
+):
+    """
+    Add submission counts to the database, with one statement per table.
+
+    - `xforms`: number of submissions, by `XForm` primary key
+    - `last_submission_times`: last submission time, by `XForm` primary key
+    - `users`: number of submissions, by `User` primary key
+    - `daily`: number of submissions, by `(xform_id, user_id, date)`
+    - `monthly`: number of submissions, by
+        `(xform_id, user_id, year, month)`
+    """
+    # Counters of forms or users deleted in the meantime are dropped
+    xform_ids = set(
+        XForm.all_objects.filter(pk__in=list(xforms)).values_list(
+            'pk', flat=True
+        )
+    )
+    user_ids = set(
+        User.objects.filter(pk__in=list(users)).values_list('pk', flat=True)
+    )
+
+    if xform_ids:
+        XForm.all_objects.filter(pk__in=xform_ids).update(
+            num_of_submissions=F('num_of_submissions') + Case(
+                *[
+                    When(pk=xform_id, then=Value(xforms[xform_id]))
+                    for xform_id in xform_ids
+                ],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            last_submission_time=Case(
+                *[
+                    When(pk=xform_id, then=Value(last_submission_time))
+                    for xform_id, last_submission_time
+                    in last_submission_times.items()
+                    if xform_id in xform_ids
+                ],
+                default=F('last_submission_time'),
+                output_field=DateTimeField(),
+            ),
+        )
+
+    if user_ids:
+        # Hack to avoid circular imports
+        UserProfile = User.profile.related.related_model  # noqa
+        existing_user_ids = set(
+            UserProfile.objects.filter(user_id__in=user_ids).values_list(
+                'user_id', flat=True
+            )
+        )
+        UserProfile.objects.bulk_create(
+            [
+                UserProfile(user_id=user_id)
+                for user_id in user_ids - existing_user_ids
+            ]
+        )
+        UserProfile.objects.filter(user_id__in=user_ids).update(
+            num_of_submissions=F('num_of_submissions') + Case(
+                *[
+                    When(user_id=user_id, then=Value(users[user_id]))
+                    for user_id in user_ids
+                ],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+        )
+
+    _upsert_counters(
+        DailyXFormSubmissionCounter,
+        ['xform_id', 'user_id', 'date'],
+        {
+            key: count
+            for key, count in daily.items()
+            if key[0] in xform_ids and key[1] in user_ids
+        },
+    )
+    _upsert_counters(
+        MonthlyXFormSubmissionCounter,
+        ['xform_id', 'user_id', 'year', 'month'],
+        {
+            key: count
+            for key, count in monthly.items()
+            if key[0] in xform_ids and key[1] in user_ids
+        },
+    )
+
+
+def _get_key(name, flushing=False):
+    if flushing:
+        return f'{REDIS_KEY_PREFIX}:{name}:flushing'
+    return f'{REDIS_KEY_PREFIX}:{name}'
+
+
+def _get_redis_client():
+    return get_redis_connection('default')
+
+
+def _parse_daily_field(field):
+    xform_id, user_id, date = field.split(':')
+    return int(xform_id), int(user_id), parse_date(date)
+
+
+def _upsert_counters(model, columns, counts):
+    """
+    Add `counts` to the `counter` of `model` rows, creating missing rows, with
+    a single `INSERT … ON CONFLICT DO UPDATE` statement. `counts` are keyed by
+    the values of `columns`, which must be covered by a unique constraint.
+    """
+    if not counts:
+        return
+
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    quoted_columns = [quote_name(column) for column in columns]
+    placeholders = ', '.join(['%s'] * (len(columns) + 1))
+    params = []
+    for key, count in counts.items():
+        params.extend(key)
+        params.append(count)
+
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quoted_columns)}, "counter") '
+        f'VALUES {", ".join([f"({placeholders})"] * len(counts))} '
+        f'ON CONFLICT ({", ".join(quoted_columns)}) '
+        f'DO UPDATE SET "counter" = {table}."counter" + EXCLUDED."counter"'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
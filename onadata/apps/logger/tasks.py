@@ -16,6 +16,9 @@ from django.utils import timezone
 
 from onadata.celery import app
 from .maintenance_tasks import remove_old_revisions
+from .submission_counters import (
+    flush_submission_counters as _flush_submission_counters,
+)
 from .models.daily_xform_submission_counter import DailyXFormSubmissionCounter
 from .models import Instance, XForm
 
@@ -31,6 +34,15 @@ def delete_daily_counters():
     xform_daily_counters.delete()
 
 
+@shared_task(soft_time_limit=600, time_limit=630)
+def flush_submission_counters():
+    """
+    Apply the submission counters accumulated in Redis when
+    `COALESCE_SUBMISSION_COUNTERS` is enabled
+    """
+    _flush_submission_counters(blocking=False)
+
+
 # ## ISSUE 242 TEMPORARY FIX ##
 # See https://github.com/form-case/kobocat/issues/242
 
@@ -3,6 +3,7 @@ import os
 from datetime import timedelta
 
 from dateutil import parser
+from django.core.cache import cache
 from django.utils import timezone
 from django.test import override_settings
 from django_digest.test import DigestAuth
@@ -14,7 +15,14 @@ from onadata.apps.main.tests.test_base import TestBase
 from onadata.apps.logger.models import XForm, Instance
 from onadata.apps.logger.maintenance_tasks import remove_old_revisions
 from onadata.apps.logger.models.instance import get_id_string_from_xml_str
+from onadata.apps.logger.xform_instance_parser import (
+    PARSER_ENGINE_LXML,
+    PARSER_ENGINE_MINIDOM,
+    ParsedSubmission,
+    get_xform_media_question_xpaths,
+)
 from onadata.apps.viewer.models import ParsedInstance
+from onadata.libs.utils.logger_tools import create_instance
 from onadata.libs.utils.common_tags import MONGO_STRFTIME, SUBMISSION_TIME,\
     XFORM_ID_STRING, SUBMITTED_BY
 
@@ -124,6 +132,24 @@ class TestInstance(TestBase):
         """
         id_string = get_id_string_from_xml_str(submission)
         self.assertEqual(id_string, 'id_string')
+        for engine in (PARSER_ENGINE_LXML, PARSER_ENGINE_MINIDOM):
+            id_string = get_id_string_from_xml_str(
+                ParsedSubmission(submission.strip(), engine)
+            )
+            self.assertEqual(id_string, 'id_string')
+
+    @override_settings(XFORM_INSTANCE_PARSER_ENGINE=PARSER_ENGINE_LXML)
+    def test_create_instance_does_not_parse_with_minidom(self):
+        self._publish_transportation_form()
+        # Built from the form XML, once per form version
+        get_xform_media_question_xpaths(self.xform)
+        with open(self.create_transportation_fixture_xml_path(), 'rb') as f:
+            with patch(
+                'onadata.apps.logger.xform_instance_parser.minidom.parseString'
+            ) as parse_string:
+                instance = create_instance(self.user.username, f, [])
+        parse_string.assert_not_called()
+        self.assertEqual(instance.xform, self.xform)
 
     def test_reversion(self):
         self.assertTrue(is_registered(Instance))
@@ -152,3 +178,33 @@ class TestInstance(TestBase):
 
         assert not Revision.objects.filter(id=old_revision.id).exists()
         assert Revision.objects.filter(id=new_revision.id).exists()
+
+    def test_populate_xml_hashes_for_instances(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        instances = list(Instance.objects.order_by('pk'))
+        Instance.objects.update(xml_hash=Instance.DEFAULT_XML_HASH)
+
+        # Resume after the first two submissions, as if they had been hashed
+        # by an interrupted run
+        cache.set('xml_hashes_checkpoint', instances[1].pk)
+        self.assertEqual(
+            Instance.populate_xml_hashes_for_instances(
+                chunk_size=1, checkpoint_key='xml_hashes_checkpoint'
+            ),
+            len(instances) - 2,
+        )
+        self.assertIsNone(cache.get('xml_hashes_checkpoint'))
+        self.assertEqual(
+            Instance.objects.filter(
+                xml_hash=Instance.DEFAULT_XML_HASH
+            ).count(),
+            2,
+        )
+
+        self.assertEqual(Instance.populate_xml_hashes_for_instances(), 2)
+        for instance in instances:
+            instance.refresh_from_db()
+            self.assertEqual(
+                instance.xml_hash, Instance.get_hash(instance.xml)
+            )
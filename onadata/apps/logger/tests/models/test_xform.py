@@ -29,3 +29,24 @@ class TestXForm(TestBase):
     @unittest.skip('Fails under Django 1.6')
     def test_reversion(self):
         self.assertTrue(reversion.is_registered(XForm))
+
+    def test_data_dictionary_survey_index(self):
+        xls_file_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "../..", "fixtures", "new_repeats", "new_repeats.xls"
+        )
+        self._publish_xls_file_and_set_xform(xls_file_path)
+        data_dictionary = self.xform.data_dictionary()
+
+        self.assertEqual(data_dictionary.geopoint_xpaths(), ['gps'])
+        self.assertEqual(data_dictionary.get_repeat_xpaths(),
+                         {'kids/kids_details'})
+        element = data_dictionary.get_element('kids/kids_details[2]/kids_name')
+        self.assertEqual(element.name, 'kids_name')
+        element = data_dictionary.get_survey_element('kids_age')
+        self.assertEqual(element.get_abbreviated_xpath(),
+                         'kids/kids_details/kids_age')
+        xpath_cmp = data_dictionary.get_xpath_cmp()
+        self.assertEqual(xpath_cmp('info/name', 'gps'), -1)
+        self.assertEqual(xpath_cmp('gps', 'info/name'), 1)
+        self.assertEqual(xpath_cmp('gps', 'unknown'), -1)
@@ -3,11 +3,19 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.test import override_settings
 from django.utils import timezone
+from django_redis import get_redis_connection
+from mock import patch
+from redis.exceptions import ConnectionError as RedisConnectionError
 
 from onadata.apps.logger.models import XForm
 from onadata.apps.logger.models.daily_xform_submission_counter import DailyXFormSubmissionCounter
 from onadata.apps.logger.models.monthly_xform_submission_counter import MonthlyXFormSubmissionCounter
+from onadata.apps.logger.submission_counters import (
+    apply_submission_counters,
+    flush_submission_counters,
+)
 from onadata.apps.logger.tasks import delete_daily_counters
 from onadata.apps.main.tests.test_base import TestBase
 
@@ -129,3 +137,116 @@ class TestXFormSubmissionCounters(TestBase):
         assert (
             DailyXFormSubmissionCounter.objects.get(**criteria).counter == 2
         )
+
+    def test_apply_submission_counters(self):
+        """
+        Test that coalesced counters are added to the existing ones
+        """
+        self._publish_transportation_form_and_submit_instance()
+        today = timezone.now().date()
+        last_submission_time = timezone.now()
+
+        for _ in range(2):
+            apply_submission_counters(
+                xforms={self.xform.pk: 3},
+                last_submission_times={self.xform.pk: last_submission_time},
+                users={self.user.pk: 3},
+                daily={(self.xform.pk, self.user.pk, today): 3},
+                monthly={
+                    (self.xform.pk, self.user.pk, today.year, today.month): 3
+                },
+            )
+
+        xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(xform.num_of_submissions, 7)
+        self.assertEqual(xform.last_submission_time, last_submission_time)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_of_submissions, 7)
+        daily_counter = DailyXFormSubmissionCounter.objects.get(
+            xform=self.xform, date=today
+        )
+        self.assertEqual(daily_counter.counter, 7)
+        monthly_counter = MonthlyXFormSubmissionCounter.objects.get(
+            xform=self.xform, year=today.year, month=today.month
+        )
+        self.assertEqual(monthly_counter.counter, 7)
+
+    @override_settings(COALESCE_SUBMISSION_COUNTERS=True)
+    def test_flush_submission_counters(self):
+        """
+        Test that submissions are counted in Redis once committed, and that
+        flushing adds them to the counters in the database
+        """
+        # Leftovers of other tests
+        self.assertTrue(flush_submission_counters())
+        self._publish_transportation_form()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._submit_transport_instance()
+
+        xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(xform.num_of_submissions, 0)
+        self.assertFalse(
+            DailyXFormSubmissionCounter.objects.filter(
+                xform=self.xform
+            ).exists()
+        )
+
+        self.assertTrue(flush_submission_counters(blocking=False))
+        xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(xform.num_of_submissions, 1)
+        self.assertEqual(
+            xform.last_submission_time,
+            self.xform.instances.get().date_created,
+        )
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_of_submissions, 1)
+        today = timezone.now().date()
+        daily_counter = DailyXFormSubmissionCounter.objects.get(
+            xform=self.xform, date=today
+        )
+        self.assertEqual(daily_counter.counter, 1)
+        monthly_counter = MonthlyXFormSubmissionCounter.objects.get(
+            xform=self.xform, year=today.year, month=today.month
+        )
+        self.assertEqual(monthly_counter.counter, 1)
+
+        # Deltas are only applied once
+        self.assertTrue(flush_submission_counters())
+        xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(xform.num_of_submissions, 1)
+
+    @override_settings(COALESCE_SUBMISSION_COUNTERS=True)
+    def test_interrupted_flush_is_not_applied_twice(self):
+        """
+        Test that deltas whose Redis hashes could not be deleted after the
+        commit are not applied again by the next flush
+        """
+        # Leftovers of other tests
+        self.assertTrue(flush_submission_counters())
+        self._publish_transportation_form()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._submit_transport_instance()
+
+        redis_client = get_redis_connection('default')
+        with patch.object(
+            type(redis_client), 'delete', side_effect=RedisConnectionError
+        ):
+            with self.assertRaises(RedisConnectionError):
+                flush_submission_counters()
+        xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(xform.num_of_submissions, 1)
+
+        self.assertTrue(flush_submission_counters())
+        xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(xform.num_of_submissions, 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_of_submissions, 1)
+        today = timezone.now().date()
+        daily_counter = DailyXFormSubmissionCounter.objects.get(
+            xform=self.xform, date=today
+        )
+        self.assertEqual(daily_counter.counter, 1)
+        monthly_counter = MonthlyXFormSubmissionCounter.objects.get(
+            xform=self.xform, year=today.year, month=today.month
+        )
+        self.assertEqual(monthly_counter.counter, 1)
@@ -4,11 +4,17 @@ import os
 from django.core.files.storage import default_storage
 from django.urls import reverse
 from django.conf import settings
+from mock import patch
+from pymongo.errors import PyMongoError
 
 from onadata.apps.main.tests.test_base import TestBase
-from onadata.apps.logger.models import Instance
+from onadata.apps.logger.models import Instance, XForm
 from onadata.apps.logger.import_tools import import_instances_from_zip
 from onadata.apps.logger.views import bulksubmission
+from onadata.apps.logger.xform_instance_parser import DuplicateInstance
+from onadata.apps.viewer.models.mongo_sync_outbox import MongoSyncOutbox
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance
+from onadata.libs.utils.logger_tools import create_instances_in_bulk
 from onadata.libs.utils.storage import rmdir
 
 CUR_PATH = os.path.abspath(__file__)
@@ -75,6 +81,86 @@ class TestImportingDatabase(TestBase):
         # by 1 (or 2) based on the b1 & b2 data sets
         self.assertEqual(instance_count, initial_instances_count + 2)
 
+    def test_create_instances_in_bulk(self):
+        self._publish_transportation_form()
+        submissions = []
+        for directory, survey in [
+            ('instances_w_uuid', 'transport_2011-07-25_19-05-36'),
+            ('instances', 'transport_2011-07-25_19-05-49'),
+        ]:
+            path = os.path.join(
+                self.this_directory, 'fixtures', 'transportation', directory,
+                survey, survey + '.xml'
+            )
+            with open(path) as f:
+                submissions.append((f.read(), []))
+        # The submission with a UUID twice in the same batch
+        submissions.append(submissions[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            results = create_instances_in_bulk(
+                self.user.username, submissions
+            )
+
+        self.assertIsInstance(results[0], Instance)
+        self.assertIsInstance(results[1], Instance)
+        self.assertIsInstance(results[2], DuplicateInstance)
+        self.assertEqual(self.xform.instances.count(), 2)
+        self.assertEqual(
+            ParsedInstance.objects.filter(instance__xform=self.xform).count(),
+            2,
+        )
+        self.xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(self.xform.num_of_submissions, 2)
+        self.assertEqual(
+            settings.MONGO_DB.instances.count_documents(
+                {'_xform_id_string': self.xform.id_string}
+            ),
+            2,
+        )
+
+        # Importing it again yields a duplicate
+        results = create_instances_in_bulk(
+            self.user.username, submissions[:1]
+        )
+        self.assertIsInstance(results[0], DuplicateInstance)
+        self.assertEqual(self.xform.instances.count(), 2)
+
+    def test_create_instances_in_bulk_with_mongo_error(self):
+        self._publish_transportation_form()
+        submissions = []
+        for survey in self.surveys[:2]:
+            path = os.path.join(
+                self.this_directory, 'fixtures', 'transportation',
+                'instances', survey, survey + '.xml'
+            )
+            with open(path) as f:
+                submissions.append((f.read(), []))
+
+        with patch(
+            'onadata.apps.viewer.models.parsed_instance.xform_instances'
+            '.bulk_write',
+            side_effect=PyMongoError('MongoDB is down'),
+        ), self.captureOnCommitCallbacks(execute=True):
+            results = create_instances_in_bulk(
+                self.user.username, submissions
+            )
+
+        # The batch is saved anyway, once, and queued for MongoDB
+        self.assertIsInstance(results[0], Instance)
+        self.assertIsInstance(results[1], Instance)
+        self.assertEqual(self.xform.instances.count(), 2)
+        self.assertEqual(
+            set(MongoSyncOutbox.objects.values_list('instance_id', flat=True)),
+            {results[0].pk, results[1].pk},
+        )
+        self.assertEqual(
+            settings.MONGO_DB.instances.count_documents(
+                {'_xform_id_string': self.xform.id_string}
+            ),
+            0,
+        )
+
     def test_badzipfile_import(self):
         total, success, errors = import_instances_from_zip(
             os.path.join(
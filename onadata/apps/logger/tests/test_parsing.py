@@ -9,7 +9,8 @@ from onadata.apps.logger.xform_instance_parser import XFormInstanceParser,\
     xpath_from_xml_node
 from onadata.apps.logger.xform_instance_parser import get_uuid_from_xml,\
     get_meta_from_xml, get_deprecated_uuid_from_xml,\
-    _xml_node_to_dict, clean_and_parse_xml
+    _xml_node_to_dict, clean_and_parse_xml, ParsedSubmission,\
+    PARSER_ENGINE_LXML, PARSER_ENGINE_MINIDOM
 from onadata.libs.utils.common_tags import XFORM_ID_STRING
 
 
@@ -89,6 +90,23 @@ class TestXFormInstanceParser(TestBase):
         }
         self.assertEqual(flat_dict, expected_flat_dict)
 
+    def test_parser_engines_produce_same_output(self):
+        self._publish_and_submit_new_repeats()
+        data_dictionary = self.xform.data_dictionary()
+        minidom_parser = XFormInstanceParser(
+            ParsedSubmission(self.xml, PARSER_ENGINE_MINIDOM), data_dictionary
+        )
+        lxml_parser = XFormInstanceParser(
+            ParsedSubmission(self.xml, PARSER_ENGINE_LXML), data_dictionary
+        )
+        self.assertEqual(minidom_parser.to_dict(), lxml_parser.to_dict())
+        self.assertEqual(minidom_parser.to_flat_dict(),
+                         lxml_parser.to_flat_dict())
+        self.assertEqual(list(minidom_parser.get_attributes().items()),
+                         list(lxml_parser.get_attributes().items()))
+        self.assertEqual(minidom_parser.get_root_node_name(),
+                         lxml_parser.get_root_node_name())
+
     def test_xpath_from_xml_node(self):
         xml_str = '<?xml version=\'1.0\' ?><test_item_name_matches_repeat ' \
                   'id="repeat_child_name_matches_repeat">' \
@@ -152,6 +170,24 @@ class TestXFormInstanceParser(TestBase):
         deprecatedID = get_deprecated_uuid_from_xml(xml_str)
         self.assertEqual(deprecatedID, "729f173c688e482486a48661700455ff")
 
+    def test_parsed_submission(self):
+        with open(
+            os.path.join(
+                os.path.dirname(__file__), "..", "fixtures", "tutorial",
+                "instances", "tutorial_2012-06-27_11-27-53_w_uuid_edited.xml"),
+                "r") as xml_file:
+            xml_str = xml_file.read()
+        parsed_submission = ParsedSubmission(xml_str)
+        self.assertEqual(parsed_submission.uuid,
+                         "2d8c59eb-94e9-485d-a679-b28ffe2e9b98")
+        self.assertEqual(parsed_submission.deprecated_uuid,
+                         "729f173c688e482486a48661700455ff")
+        # Helpers accept the parsed submission as well as the raw string
+        self.assertEqual(get_uuid_from_xml(parsed_submission),
+                         get_uuid_from_xml(xml_str))
+        self.assertEqual(parsed_submission.find_values('meta/instanceID'),
+                         ["uuid:2d8c59eb-94e9-485d-a679-b28ffe2e9b98"])
+
     def test_parse_xform_nested_repeats_multiple_nodes(self):
         self._create_user_and_login()
         # publish our form which contains some some repeats
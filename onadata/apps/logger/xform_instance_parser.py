@@ -2,15 +2,22 @@
 import logging
 import re
 import sys
+from typing import Optional, Union
 from xml.dom import Node
+from xml.dom.minidom import Document
+from xml.parsers.expat import ExpatError
 
 import dateutil.parser
 import six
 from defusedxml import minidom
+from django.conf import settings
 from django.utils.encoding import smart_str
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as t
+from lxml import etree
 
 from onadata.libs.utils.common_tags import XFORM_ID_STRING
+from onadata.libs.utils.survey_cache import survey_cache
 
 
 class XLSFormError(Exception):
@@ -41,8 +48,16 @@ class InstanceMultipleNodeError(Exception):
     pass
 
 
+PARSER_ENGINE_LXML = 'lxml'
+PARSER_ENGINE_MINIDOM = 'minidom'
+PARSER_ENGINES = (PARSER_ENGINE_LXML, PARSER_ENGINE_MINIDOM)
+
+UUID_REGEX = re.compile(r'uuid:(.*)')
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+
 def get_meta_from_xml(xml_str, meta_name):
-    xml = clean_and_parse_xml(xml_str)
+    xml = _get_document(xml_str)
     children = xml.childNodes
     # children ideally contains a single element
     # that is the parent of all survey elements
@@ -71,17 +86,13 @@ def get_meta_from_xml(xml_str, meta_name):
 
 
 def get_uuid_from_xml(xml):
-    def _uuid_only(uuid, regex):
-        matches = regex.match(uuid)
-        if matches and len(matches.groups()) > 0:
-            return matches.groups()[0]
-        return None
+    # Parse only once, whether the UUID is found in `<meta>` or in the
+    # attributes of the survey node
+    xml = _get_document(xml)
     uuid = get_meta_from_xml(xml, "instanceID")
-    regex = re.compile(r"uuid:(.*)")
     if uuid:
-        return _uuid_only(uuid, regex)
+        return _uuid_only(uuid)
     # check in survey_node attributes
-    xml = clean_and_parse_xml(xml)
     children = xml.childNodes
     # children ideally contains a single element
     # that is the parent of all survey elements
@@ -90,13 +101,13 @@ def get_uuid_from_xml(xml):
     survey_node = children[0]
     uuid = survey_node.getAttribute('instanceID')
     if uuid != '':
-        return _uuid_only(uuid, regex)
+        return _uuid_only(uuid)
     return None
 
 
 def get_submission_date_from_xml(xml):
     # check in survey_node attributes
-    xml = clean_and_parse_xml(xml)
+    xml = _get_document(xml)
     children = xml.childNodes
     # children ideally contains a single element
     # that is the parent of all survey elements
@@ -111,11 +122,8 @@ def get_submission_date_from_xml(xml):
 
 def get_deprecated_uuid_from_xml(xml):
     uuid = get_meta_from_xml(xml, "deprecatedID")
-    regex = re.compile(r"uuid:(.*)")
     if uuid:
-        matches = regex.match(uuid)
-        if matches and len(matches.groups()) > 0:
-            return matches.groups()[0]
+        return _uuid_only(uuid)
     return None
 
 
@@ -126,6 +134,229 @@ def clean_and_parse_xml(xml_string: str) -> Node:
     return xml_obj
 
 
+def get_parser_engine(xml_str: str, engine: Optional[str] = None) -> str:
+    """
+    Return the engine used to parse `xml_str`, i.e. `engine` or
+    `settings.XFORM_INSTANCE_PARSER_ENGINE`.
+
+    The lxml engine merges CDATA sections into the surrounding text and does
+    not go through `defusedxml`, so documents containing CDATA sections or a
+    DTD are always handed over to minidom.
+    """
+    engine = engine or getattr(
+        settings, 'XFORM_INSTANCE_PARSER_ENGINE', PARSER_ENGINE_LXML
+    )
+    if engine not in PARSER_ENGINES:
+        raise ValueError(f'Unknown XML parser engine: {engine}')
+
+    if engine == PARSER_ENGINE_LXML and (
+        '<![CDATA[' in xml_str or '<!DOCTYPE' in xml_str
+    ):
+        return PARSER_ENGINE_MINIDOM
+
+    return engine
+
+
+def parse_xml_with_lxml(xml_string: str) -> etree._Element:
+    """
+    lxml counterpart of `clean_and_parse_xml()`. Whitespace-only text is not
+    removed with a regex beforehand; the lxml engine ignores it instead.
+    Raises `ExpatError` on malformed XML, like minidom does.
+    """
+    # The XML declaration may announce any encoding, but the string has
+    # already been decoded
+    parser = etree.XMLParser(
+        encoding='utf-8', resolve_entities=False, no_network=True
+    )
+    try:
+        return etree.fromstring(
+            smart_str(xml_string).strip().encode('utf-8'), parser=parser
+        )
+    except etree.XMLSyntaxError as e:
+        raise ExpatError(str(e)) from e
+
+
+class ParsedSubmission:
+    """
+    The XML of one submission, parsed at most once.
+
+    `create_instance()` builds one of these per request and hands it down to
+    `Instance`, `ParsedInstance` and the attachment code, so that UUIDs,
+    the submission date, the `XFormInstanceParser` dictionaries and media
+    basenames all come from the same tree instead of re-parsing the string.
+    Depending on `engine`, that tree is an lxml element or a minidom
+    document; either must be treated as read-only.
+    """
+
+    def __init__(self, xml_str: str, engine: Optional[str] = None):
+        self.xml = xml_str
+        self.engine = get_parser_engine(xml_str, engine)
+
+    @cached_property
+    def document(self) -> Document:
+        """
+        minidom document, also available with the lxml engine for callers
+        which need the DOM API (e.g. `Instance.get_root_node()`).
+        """
+        return clean_and_parse_xml(self.xml)
+
+    @cached_property
+    def root_element(self) -> etree._Element:
+        return parse_xml_with_lxml(self.xml)
+
+    @cached_property
+    def id_string(self) -> str:
+        """
+        `id` attribute of the root node or, for submissions wrapped like
+        `<submission><data><form_id id="...">`, of the first child of `data`
+        """
+        if self.engine == PARSER_ENGINE_MINIDOM:
+            root_node = self.document.documentElement
+            id_string = root_node.getAttribute('id')
+            if not id_string:
+                for data in root_node.getElementsByTagName('data'):
+                    id_string = data.childNodes[0].getAttribute('id')
+                    if id_string:
+                        break
+            return id_string
+
+        id_string = self.root_element.get('id', '')
+        if not id_string:
+            for data in self.root_element.iterdescendants(tag=etree.Element):
+                if _get_qualified_name(data) != 'data':
+                    continue
+                child = next(data.iterchildren(tag=etree.Element), None)
+                id_string = child.get('id', '') if child is not None else ''
+                if id_string:
+                    break
+        return id_string
+
+    @cached_property
+    def uuid(self) -> str:
+        if self.engine == PARSER_ENGINE_MINIDOM:
+            return get_uuid_from_xml(self.document)
+
+        uuid = _get_meta_from_element(self.root_element, 'instanceID')
+        if not uuid:
+            # check in survey_node attributes
+            uuid = self.root_element.get('instanceID')
+        return _uuid_only(uuid) if uuid else None
+
+    @cached_property
+    def deprecated_uuid(self) -> str:
+        if self.engine == PARSER_ENGINE_MINIDOM:
+            return get_deprecated_uuid_from_xml(self.document)
+
+        uuid = _get_meta_from_element(self.root_element, 'deprecatedID')
+        return _uuid_only(uuid) if uuid else None
+
+    @cached_property
+    def submission_date(self) -> 'datetime.datetime':
+        if self.engine == PARSER_ENGINE_MINIDOM:
+            return get_submission_date_from_xml(self.document)
+
+        submission_date = self.root_element.get('submissionDate')
+        if submission_date:
+            return dateutil.parser.parse(submission_date)
+        return None
+
+    @property
+    def root_node_name(self) -> str:
+        if self.engine == PARSER_ENGINE_MINIDOM:
+            return self.document.documentElement.nodeName
+        return _get_qualified_name(self.root_element)
+
+    def find_values(self, xpath: str) -> list:
+        """
+        Return the text of every node matching `xpath`, a path of tag names
+        relative to the root node, e.g. `group/question`. With repeat groups,
+        several nodes can match the same XPath. Empty nodes yield `None`.
+        """
+        tag_names = xpath.split('/')
+
+        if self.engine == PARSER_ENGINE_MINIDOM:
+            nodes = [self.document.documentElement]
+            for tag_name in tag_names:
+                nodes = [
+                    child
+                    for node in nodes
+                    for child in node.childNodes
+                    if child.nodeType == Node.ELEMENT_NODE
+                    and child.tagName == tag_name
+                ]
+            return [
+                node.firstChild.nodeValue if node.firstChild else None
+                for node in nodes
+            ]
+
+        elements = [self.root_element]
+        for tag_name in tag_names:
+            elements = [
+                child
+                for element in elements
+                for child in element.iterchildren(tag=etree.Element)
+                if _get_qualified_name(child) == tag_name
+            ]
+        return [_get_text(element) for element in elements]
+
+
+def _get_document(xml: Union[str, Document, ParsedSubmission]) -> Document:
+    """
+    Let the `get_*_from_xml()` helpers accept an XML string, an already
+    parsed DOM or a `ParsedSubmission`.
+    """
+    if isinstance(xml, ParsedSubmission):
+        return xml.document
+    if isinstance(xml, Document):
+        return xml
+    return clean_and_parse_xml(xml)
+
+
+def _get_meta_from_element(root: etree._Element, meta_name: str) -> str:
+    """
+    lxml counterpart of `get_meta_from_xml()`
+    """
+    meta_names = (meta_name.lower(), 'orx:%s' % meta_name.lower())
+    for meta_element in root.iterchildren(tag=etree.Element):
+        if _get_qualified_name(meta_element).lower() not in ('meta', 'orx:meta'):
+            continue
+        for element in meta_element.iterchildren(tag=etree.Element):
+            if _get_qualified_name(element).lower() in meta_names:
+                text = _get_text(element)
+                return text.strip() if text else None
+        return None
+
+    return None
+
+
+def _get_qualified_name(element: etree._Element) -> str:
+    """
+    Return the tag name of `element` as minidom's `nodeName` would, i.e.
+    `prefix:local_name` instead of lxml's `{namespace}local_name`.
+    """
+    tag = element.tag
+    if tag[0] != '{':
+        return tag
+    local_name = tag.split('}', 1)[1]
+    prefix = element.prefix
+    return f'{prefix}:{local_name}' if prefix else local_name
+
+
+def _get_text(element: etree._Element) -> Optional[str]:
+    # Whitespace-only text is what `clean_and_parse_xml()` strips out
+    text = element.text
+    if not text or text.isspace():
+        return None
+    return text
+
+
+def _uuid_only(uuid: str) -> Optional[str]:
+    matches = UUID_REGEX.match(uuid)
+    if matches and len(matches.groups()) > 0:
+        return matches.groups()[0]
+    return None
+
+
 def _xml_node_to_dict(node: Node, repeats: list = []) -> dict:
     assert isinstance(node, Node)
     if len(node.childNodes) == 0:
@@ -273,7 +504,96 @@ def _get_all_attributes(node):
             yield pair
 
 
+def _lxml_element_to_dict(
+    element: etree._Element, repeats: set, xpath: Optional[str] = None
+) -> Optional[dict]:
+    """
+    lxml counterpart of `_xml_node_to_dict()`, producing the same output.
+
+    Instead of rebuilding each node's XPath from its ancestors, the XPath of
+    `element` (relative to the root node, `None` for the root itself) is
+    passed down while walking the tree.
+    """
+    name = _get_qualified_name(element)
+    text = _get_text(element)
+    # Count what minidom would see as child nodes: the text, elements,
+    # comments, processing instructions and the text between them
+    children_count = len(element)
+    for child in element:
+        if child.tail and not child.tail.isspace():
+            children_count += 1
+
+    if not children_count:
+        # no child elements: this is a leaf node, with or without data
+        return {name: text} if text is not None else None
+
+    value = {}
+    for child in element.iterchildren(tag=etree.Element):
+        child_name = _get_qualified_name(child)
+        child_xpath = (
+            child_name if xpath is None else f'{xpath}/{child_name}'
+        )
+        d = _lxml_element_to_dict(child, repeats, child_xpath)
+        if d is None:
+            continue
+        child_value = d[child_name]
+        # check if name is in list of repeats and make it a list if so
+        if child_xpath in repeats:
+            value.setdefault(child_name, []).append(child_value)
+        elif child_name not in value:
+            value[child_name] = child_value
+        else:
+            # Same as `_xml_node_to_dict()`, aggregate duplicate nodes
+            if not isinstance(value[child_name], list):
+                value[child_name] = [value[child_name]]
+            value[child_name].append(child_value)
+
+    if not value:
+        return None
+    return {name: value}
+
+
+def _get_all_lxml_attributes(root: etree._Element):
+    """
+    lxml counterpart of `_get_all_attributes()`, yielding attributes with
+    their qualified names, namespace declarations first, in document order.
+    """
+    stack = [(root, {})]
+    while stack:
+        element, parent_nsmap = stack.pop()
+        nsmap = element.nsmap
+        for prefix, uri in nsmap.items():
+            if parent_nsmap.get(prefix) != uri:
+                yield (f'xmlns:{prefix}' if prefix else 'xmlns'), uri
+
+        for key, value in element.attrib.items():
+            if key[0] == '{':
+                uri, local_name = key[1:].split('}', 1)
+                prefix = 'xml' if uri == XML_NAMESPACE else next(
+                    (p for p, u in nsmap.items() if p and u == uri), None
+                )
+                if prefix:
+                    key = f'{prefix}:{local_name}'
+                else:
+                    key = local_name
+            yield key, value
+
+        stack.extend(
+            (child, nsmap)
+            for child in reversed(element)
+            if isinstance(child.tag, str)
+        )
+
+
 class XFormInstanceParser:
+    """
+    Turn a submission into the nested and flat dictionaries stored in
+    `Instance.json` and MongoDB.
+
+    The engine is chosen by `settings.XFORM_INSTANCE_PARSER_ENGINE`: `lxml`
+    walks an lxml tree once, while `minidom` (the original implementation)
+    is kept to compare the results of both.
+    """
 
     def __init__(self, xml_str, data_dictionary):
         self.dd = data_dictionary
@@ -284,6 +604,8 @@ class XFormInstanceParser:
             self.parse(xml_str)
         except Exception as e:
             logger = logging.getLogger("console_logger")
+            if isinstance(xml_str, ParsedSubmission):
+                xml_str = xml_str.xml
             logger.error(
                 "Failed to parse instance '%s'" % xml_str, exc_info=True)
             # `self.parse()` has been wrapped in to try/except but it makes the
@@ -293,22 +615,37 @@ class XFormInstanceParser:
             six.reraise(*sys.exc_info())
 
     def parse(self, xml_str):
-        self._xml_obj = clean_and_parse_xml(xml_str)
-        self._root_node = self._xml_obj.documentElement
-        repeats = [e.get_abbreviated_xpath()
-                   for e in self.dd.get_survey_elements_of_type("repeat")]
-        self._dict = _xml_node_to_dict(self._root_node, repeats)
+        """
+        `xml_str` can be either a string or a `ParsedSubmission`.
+        """
+        if isinstance(xml_str, ParsedSubmission):
+            self._parsed_submission = xml_str
+        else:
+            self._parsed_submission = ParsedSubmission(xml_str)
+
+        repeats = self.dd.get_repeat_xpaths()
+
+        if self._parsed_submission.engine == PARSER_ENGINE_LXML:
+            root_element = self._parsed_submission.root_element
+            self._dict = _lxml_element_to_dict(root_element, repeats)
+            all_attributes = _get_all_lxml_attributes(root_element)
+        else:
+            root_node = self._parsed_submission.document.documentElement
+            self._dict = _xml_node_to_dict(root_node, list(repeats))
+            all_attributes = _get_all_attributes(root_node)
+
         if self._dict is None:
             raise InstanceEmptyError
         for path, value in _flatten_dict_nest_repeats(self._dict, []):
             self._flat_dict["/".join(path[1:])] = value
-        self._set_attributes()
+        self._set_attributes(all_attributes)
 
     def get_root_node(self):
-        return self._root_node
+        # minidom node, parsed on demand with the lxml engine
+        return self._parsed_submission.document.documentElement
 
     def get_root_node_name(self):
-        return self._root_node.nodeName
+        return self._parsed_submission.root_node_name
 
     def get(self, abbreviated_xpath):
         return self.to_flat_dict()[abbreviated_xpath]
@@ -322,8 +659,7 @@ class XFormInstanceParser:
     def get_attributes(self):
         return self._attributes
 
-    def _set_attributes(self):
-        all_attributes = list(_get_all_attributes(self._root_node))
+    def _set_attributes(self, all_attributes):
         for key, value in all_attributes:
             # commented since enketo forms may have the template attribute in
             # multiple xml tags and I dont see the harm in overiding
@@ -364,10 +700,22 @@ def parse_xform_instance(xml_str, data_dictionary):
 
 def get_xform_media_question_xpaths(
     xform: 'onadata.apps.logger.models.XForm',
+) -> list:
+    return list(survey_cache.get(
+        xform,
+        'media_question_xpaths',
+        lambda: _build_xform_media_question_xpaths(xform),
+    ))
+
+
+def _build_xform_media_question_xpaths(
+    xform: 'onadata.apps.logger.models.XForm',
 ) -> list:
     logger = logging.getLogger('console_logger')
-    parser = XFormInstanceParser(xform.xml, xform.data_dictionary(use_cache=True))
-    all_attributes = _get_all_attributes(parser.get_root_node())
+    # Only the attributes of the form XML are needed; there is no need to
+    # build its survey nor to parse it as a submission
+    root_node = clean_and_parse_xml(xform.xml).documentElement
+    all_attributes = _get_all_attributes(root_node)
     media_field_xpaths = []
     # This code expects that the attributes from Enketo Express are **always**
     # sent in the same order.
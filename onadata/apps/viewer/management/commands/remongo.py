@@ -3,7 +3,7 @@ from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
-from onadata.libs.utils.common_tags import USERFORM_ID
+from onadata.libs.utils.common_tags import ID, USERFORM_ID
 
 
 class Command(BaseCommand):
@@ -59,3 +59,6 @@ class Command(BaseCommand):
         # add indexes after writing so the writing operation above is not
         # slowed
         settings.MONGO_DB.instances.create_index(USERFORM_ID)
+        settings.MONGO_DB.instances.create_index(
+            [(USERFORM_ID, 1), (ID, 1)], name='userform_id_id'
+        )
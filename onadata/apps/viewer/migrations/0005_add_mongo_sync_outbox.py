@@ -0,0 +1,29 @@
+# coding: utf-8
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0034_set_require_auth_at_project_level'),
+        ('viewer', '0004_update_meta_data_export_types'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MongoSyncOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logger.instance')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt', 'id'], name='viewer_mong_next_at_2eeedf_idx')],
+            },
+        ),
+    ]
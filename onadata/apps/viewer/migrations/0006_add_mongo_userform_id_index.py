@@ -0,0 +1,32 @@
+# coding: utf-8
+from django.conf import settings
+from django.db import migrations
+
+from onadata.libs.utils.common_tags import ID, USERFORM_ID
+
+INDEX_NAME = 'userform_id_id'
+
+
+def create_mongo_index(apps, schema_editor):
+    """
+    Let MongoDB sort the records of a form by `_id`, and find the ones
+    following a given `_id` (keyset pagination), with an index scan
+    """
+    settings.MONGO_DB.instances.create_index(
+        [(USERFORM_ID, 1), (ID, 1)], name=INDEX_NAME, background=True
+    )
+
+
+def drop_mongo_index(apps, schema_editor):
+    settings.MONGO_DB.instances.drop_index(INDEX_NAME)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0005_add_mongo_sync_outbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_mongo_index, drop_mongo_index),
+    ]
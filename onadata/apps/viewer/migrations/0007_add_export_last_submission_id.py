@@ -0,0 +1,22 @@
+# coding: utf-8
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0006_add_mongo_userform_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='last_submission_id',
+            field=models.IntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='num_of_records',
+            field=models.IntegerField(default=None, null=True),
+        ),
+    ]
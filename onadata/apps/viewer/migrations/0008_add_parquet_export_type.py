@@ -0,0 +1,17 @@
+# coding: utf-8
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0007_add_export_last_submission_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='export',
+            name='export_type',
+            field=models.CharField(choices=[('xls', 'Excel'), ('csv', 'CSV'), ('zip', 'ZIP'), ('kml', 'kml'), ('parquet', 'Parquet')], default='xls', max_length=10),
+        ),
+    ]
@@ -20,6 +20,7 @@ from onadata.libs.utils.export_tools import (
     DictOrganizer,
 )
 from onadata.libs.utils.model_tools import queryset_iterator, set_uuid
+from onadata.libs.utils.survey_cache import survey_cache
 
 
 class ColumnRename(models.Model):
@@ -34,6 +35,45 @@ class ColumnRename(models.Model):
         return dict([(cr.xpath, cr.column_name) for cr in cls.objects.all()])
 
 
+class SurveyElementIndex:
+    """
+    Lookup tables over the elements of a survey, built with a single pass
+    over `survey.iter_descendants()` instead of walking them on every call.
+    It is cached along with the survey (see `survey_cache`) and must be
+    treated as read-only.
+    """
+
+    def __init__(self, survey):
+        self.elements = []
+        # When several elements share an XPath, the last one wins, as it
+        # did in `DataDictionary.get_element()`
+        self.by_xpath = {}
+        # When several elements share a name, the first one wins, as it
+        # did in `DataDictionary.get_survey_element()`
+        self.by_name = {}
+        self.by_type = {}
+        self.by_bind_type = {}
+        # Position of the first element with a given XPath
+        self.ordinals = {}
+
+        for ordinal, element in enumerate(survey.iter_descendants()):
+            xpath = element.get_abbreviated_xpath()
+            self.elements.append(element)
+            self.by_xpath[xpath] = element
+            self.by_name.setdefault(element.name, element)
+            self.by_type.setdefault(element.type, []).append(element)
+            self.by_bind_type.setdefault(
+                element.bind.get('type'), []
+            ).append(element)
+            self.ordinals.setdefault(xpath, ordinal)
+
+    def get_elements_of_type(self, element_type):
+        return self.by_type.get(element_type, [])
+
+    def get_elements_of_bind_type(self, bind_type):
+        return self.by_bind_type.get(bind_type, [])
+
+
 def upload_to(instance, filename, username=None):
     if instance:
         username = instance.xform.user.username
@@ -165,36 +205,45 @@ class DataDictionary(XForm):
             self._mark_start_time_boolean()
             set_uuid(self)
             self.set_uuid_in_xml(id_string=survey.id_string)
+            # Forget about the survey of the previous version, if any
+            self.__dict__.pop('_survey', None)
         super().save(*args, **kwargs)
+        # Build the survey and its index once, at publication time
+        self.get_survey_index()
 
     def file_name(self):
         return os.path.split(self.xls.name)[-1]
 
     def get_survey(self):
         if not hasattr(self, "_survey"):
-            try:
-                builder = SurveyElementBuilder()
-                self._survey = \
-                    builder.create_survey_element_from_json(self.json)
-            except ValueError:
-                xml = bytes(bytearray(self.xml, encoding='utf-8'))
-                self._survey = create_survey_element_from_xml(xml)
+            # Building the survey is expensive; share it with the other
+            # `DataDictionary` objects of this process
+            self._survey = survey_cache.get(self, 'survey', self._build_survey)
         return self._survey
 
+    def _build_survey(self):
+        try:
+            builder = SurveyElementBuilder()
+            return builder.create_survey_element_from_json(self.json)
+        except ValueError:
+            xml = bytes(bytearray(self.xml, encoding='utf-8'))
+            return create_survey_element_from_xml(xml)
+
     survey = property(get_survey)
 
+    def get_survey_index(self):
+        return survey_cache.get(
+            self, 'survey_index', lambda: SurveyElementIndex(self.survey)
+        )
+
     def get_survey_elements(self):
-        return self.survey.iter_descendants()
+        return iter(self.get_survey_index().elements)
 
     def get_survey_element(self, name_or_xpath):
         element = self.get_element(name_or_xpath)
         name = (element and element['name']) or name_or_xpath
 
-        for field in self.get_survey_elements():
-            if field.name == name:
-                return field
-
-        return None
+        return self.get_survey_index().by_name.get(name)
 
     def get_choice_label(self, field, choice_value, lang='English'):
         for choice in field.children:
@@ -213,22 +262,30 @@ class DataDictionary(XForm):
         Return a dictionary of fieldnames as saved in mongodb with
         corresponding xform field names e.g {"Q1Lg==1": "Q1.1"}
         """
-        names = {}
-        for elem in self.get_survey_elements():
-            names[MongoHelper.encode(str(elem.get_abbreviated_xpath()))] = \
-                elem.get_abbreviated_xpath()
-        return names
+        def _build_mongo_field_names():
+            return {
+                MongoHelper.encode(str(xpath)): xpath
+                for xpath in self.get_survey_index().ordinals
+            }
+
+        return dict(
+            survey_cache.get(self, 'mongo_field_names', _build_mongo_field_names)
+        )
 
     survey_elements = property(get_survey_elements)
 
     def geopoint_xpaths(self):
-        geo_xpaths = []
-
-        for e in self.get_survey_elements():
-            if e.bind.get('type') == 'geopoint':
-                geo_xpaths.append(e.get_abbreviated_xpath())
-
-        return geo_xpaths
+        def _build_geopoint_xpaths():
+            return [
+                e.get_abbreviated_xpath()
+                for e in self.get_survey_index().get_elements_of_bind_type(
+                    'geopoint'
+                )
+            ]
+
+        return list(
+            survey_cache.get(self, 'geopoint_xpaths', _build_geopoint_xpaths)
+        )
 
     def xpath_of_first_geopoint(self):
         geo_xpaths = self.geopoint_xpaths()
@@ -317,16 +374,11 @@ class DataDictionary(XForm):
         return [remove_first_index(header) for header in self.get_headers()]
 
     def get_element(self, abbreviated_xpath):
-        if not hasattr(self, "_survey_elements"):
-            self._survey_elements = {}
-            for e in self.get_survey_elements():
-                self._survey_elements[e.get_abbreviated_xpath()] = e
-
         def remove_all_indices(xpath):
             return re.sub(r"\[\d+\]", "", xpath)
 
         clean_xpath = remove_all_indices(abbreviated_xpath)
-        return self._survey_elements.get(clean_xpath)
+        return self.get_survey_index().by_xpath.get(clean_xpath)
 
     def get_label(self, abbreviated_xpath):
         e = self.get_element(abbreviated_xpath)
@@ -335,9 +387,10 @@ class DataDictionary(XForm):
             return e.label
 
     def get_xpath_cmp(self):
-        if not hasattr(self, "_xpaths"):
-            self._xpaths = [e.get_abbreviated_xpath()
-                            for e in self.survey_elements]
+        ordinals = self.get_survey_index().ordinals
+
+        def cmp(a, b):
+            return (a > b) - (a < b)
 
         def xpath_cmp(x, y):
             # For the moment, we aren't going to worry about repeating
@@ -346,13 +399,13 @@ class DataDictionary(XForm):
             new_y = re.sub(r"\[\d+\]", "", y)
             if new_x == new_y:
                 return cmp(x, y)
-            if new_x not in self._xpaths and new_y not in self._xpaths:
+            if new_x not in ordinals and new_y not in ordinals:
                 return 0
-            elif new_x not in self._xpaths:
+            elif new_x not in ordinals:
                 return 1
-            elif new_y not in self._xpaths:
+            elif new_y not in ordinals:
                 return -1
-            return cmp(self._xpaths.index(new_x), self._xpaths.index(new_y))
+            return cmp(ordinals[new_x], ordinals[new_y])
 
         return xpath_cmp
 
@@ -423,5 +476,15 @@ class DataDictionary(XForm):
             self.has_start_time = False
 
     def get_survey_elements_of_type(self, element_type):
-        return [e for e in self.get_survey_elements()
-                if e.type == element_type]
+        return list(self.get_survey_index().get_elements_of_type(element_type))
+
+    def get_repeat_xpaths(self):
+        """
+        Return the abbreviated XPaths of all repeat groups, as a frozenset
+        """
+        return survey_cache.get(
+            self,
+            'repeat_xpaths',
+            lambda: frozenset(e.get_abbreviated_xpath()
+                              for e in self.get_survey_elements_of_type('repeat')),
+        )
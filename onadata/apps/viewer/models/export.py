@@ -18,13 +18,16 @@ class Export(models.Model):
     CSV_EXPORT = 'csv'
     KML_EXPORT = 'kml'
     ZIP_EXPORT = 'zip'
+    PARQUET_EXPORT = 'parquet'
+    JSONL_EXPORT = 'jsonl'
 
     EXPORT_MIMES = {
         'xls': 'vnd.ms-excel',
         'xlsx': 'vnd.openxmlformats',
         'csv': 'csv',
         'zip': 'zip',
-        'kml': 'vnd.google-earth.kml+xml'
+        'kml': 'vnd.google-earth.kml+xml',
+        'jsonl': 'x-ndjson',
     }
 
     EXPORT_TYPES = [
@@ -32,6 +35,8 @@ class Export(models.Model):
         (CSV_EXPORT, 'CSV'),
         (ZIP_EXPORT, 'ZIP'),
         (KML_EXPORT, 'kml'),
+        (PARQUET_EXPORT, 'Parquet'),
+        (JSONL_EXPORT, 'JSON Lines'),
     ]
 
     EXPORT_TYPE_DICT = dict(export_type for export_type in EXPORT_TYPES)
@@ -56,6 +61,10 @@ class Export(models.Model):
     task_id = models.CharField(max_length=255, null=True, blank=True)
     # time of last submission when this export was created
     time_of_last_submission = models.DateTimeField(null=True, default=None)
+    # `_id` of the last submission contained by the export file, and number of
+    # submissions it contains, for exports which can be appended to
+    last_submission_id = models.IntegerField(null=True, default=None)
+    num_of_records = models.IntegerField(null=True, default=None)
     # status
     internal_status = models.SmallIntegerField(default=PENDING)
     export_url = models.URLField(null=True, default=None)
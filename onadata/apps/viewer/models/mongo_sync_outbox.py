@@ -0,0 +1,31 @@
+# coding: utf-8
+from django.db import models
+from django.utils import timezone
+
+from onadata.apps.logger.models import Instance
+
+
+class MongoSyncOutbox(models.Model):
+    """
+    Submissions waiting to be copied to MongoDB.
+
+    A row is inserted in the same transaction as the submission it refers
+    to, and deleted once `ParsedInstance.sync_mongo_outbox()` has written the
+    submission to MongoDB. Rows only point at submissions: the MongoDB
+    document is built from their current state when the outbox is drained,
+    so several rows for the same submission result in a single write.
+    """
+
+    instance = models.ForeignKey(
+        Instance, related_name='+', on_delete=models.CASCADE
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        app_label = 'viewer'
+        indexes = [
+            models.Index(fields=['next_attempt', 'id']),
+        ]
@@ -1,19 +1,24 @@
 # coding: utf-8
 import json
+from collections import defaultdict
+from datetime import timedelta
 
 from bson import json_util
 from dateutil import parser
 from django.conf import settings
-from django.db import models
-
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.translation import gettext as t
-from pymongo.errors import PyMongoError
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
 from onadata.celery import app
 from onadata.apps.api.mongo_helper import MongoHelper
 from onadata.apps.logger.models import Instance
 from onadata.apps.logger.models import Note
 from onadata.apps.restservice.utils import call_service
+from onadata.apps.viewer.models.mongo_sync_outbox import MongoSyncOutbox
 from onadata.libs.utils.common_tags import (
     ID,
     UUID,
@@ -24,8 +29,10 @@ from onadata.libs.utils.common_tags import (
     TAGS,
     NOTES,
     SUBMITTED_BY,
+    USERFORM_ID,
     VALIDATION_STATUS
 )
+from onadata.libs.utils import count_cache
 from onadata.libs.utils.decorators import apply_form_field_names
 from onadata.libs.utils.model_tools import queryset_iterator
 
@@ -59,6 +66,7 @@ def update_mongo_instance(record):
         xform_instances.replace_one({'_id': record['_id']}, record, upsert=True)
     except PyMongoError as e:
         raise Exception('Submission could not be saved to Mongo') from e
+    count_cache.invalidate_counts([record.get(USERFORM_ID)])
     return True
 
 
@@ -88,9 +96,11 @@ class ParsedInstance(models.Model):
     @classmethod
     @apply_form_field_names
     def query_mongo(cls, username, id_string, query, fields, sort, start=0,
-                    limit=DEFAULT_LIMIT, count=False):
+                    limit=DEFAULT_LIMIT, count=False, last_id=None):
 
-        query = cls._get_mongo_cursor_query(query, username, id_string)
+        query = cls._get_mongo_cursor_query(
+            query, username, id_string, last_id=last_id
+        )
 
         if count:
             return [
@@ -112,6 +122,42 @@ class ParsedInstance(models.Model):
 
         return cls._get_paginated_and_sorted_cursor(cursor, start, limit, sort)
 
+    @classmethod
+    def count_records(cls, xform, query=None):
+        """
+        Returns the number of records of `xform` matching `query`.
+
+        Without `query`, it is `XForm.num_of_submissions`, which is updated
+        as submissions are received and deleted. Otherwise, it is counted by
+        MongoDB and cached, see `onadata.libs.utils.count_cache`. So are
+        unfiltered counts when `settings.COALESCE_SUBMISSION_COUNTERS` or
+        `settings.MONGO_SYNC_OUTBOX_ENABLED` is enabled: the former delays
+        `num_of_submissions`, the latter the records in MongoDB, and both
+        counts would not agree with each other.
+
+        :param xform: XForm
+        :param query: JSON string or dict
+        :return: integer
+        """
+        if isinstance(query, str):
+            query = json.loads(query, object_hook=json_util.object_hook)
+        query = query if query else {}
+        if not query and not (
+            settings.COALESCE_SUBMISSION_COUNTERS
+            or settings.MONGO_SYNC_OUTBOX_ENABLED
+        ):
+            return xform.num_of_submissions
+
+        def _count_documents():
+            return xform_instances.count_documents(
+                cls._get_mongo_cursor_query(
+                    dict(query), xform.user.username, xform.id_string
+                ),
+                maxTimeMS=settings.MONGO_DB_MAX_TIME_MS,
+            )
+
+        return count_cache.get_count(xform, query, _count_documents)
+
     @classmethod
     @apply_form_field_names
     def mongo_aggregate(cls, query, pipeline):
@@ -140,9 +186,15 @@ class ParsedInstance(models.Model):
     @apply_form_field_names
     def query_mongo_minimal(
             cls, query, fields, sort, start=0, limit=DEFAULT_LIMIT,
-            count=False):
+            count=False, last_id=None, last_value=None):
 
-        query = cls._get_mongo_cursor_query(query)
+        if isinstance(sort, str):
+            sort = json.loads(sort, object_hook=json_util.object_hook)
+        sort = sort if sort else {}
+
+        query = cls._get_mongo_cursor_query(
+            query, last_id=last_id, sort=sort, last_value=last_value
+        )
 
         if count:
             return [
@@ -155,10 +207,6 @@ class ParsedInstance(models.Model):
 
         cursor = cls._get_mongo_cursor(query, fields)
 
-        if isinstance(sort, str):
-            sort = json.loads(sort, object_hook=json_util.object_hook)
-        sort = sort if sort else {}
-
         if start < 0 or limit < 0:
             raise ValueError(t("Invalid start/limit params"))
 
@@ -213,13 +261,25 @@ class ParsedInstance(models.Model):
         )
 
     @classmethod
-    def _get_mongo_cursor_query(cls, query, username=None, id_string=None):
+    def _get_mongo_cursor_query(
+        cls,
+        query,
+        username=None,
+        id_string=None,
+        last_id=None,
+        sort=None,
+        last_value=None,
+    ):
         """
         Returns the query to get a Mongo cursor.
 
         :param query: JSON string
         :param username: string
         :param id_string: string
+        :param last_id: integer. Only match records which come after the
+            record with this `_id` in the order of `sort`
+        :param sort: dict
+        :param last_value: value of the sort key of the record `last_id`
         :return: dict
         """
         # TODO: give more detailed error messages to 3rd parties
@@ -229,6 +289,16 @@ class ParsedInstance(models.Model):
         query = query if query else {}
         query = MongoHelper.to_safe_dict(query, reading=True)
 
+        if last_id is not None:
+            # Keyset pagination: the next page starts right after the last
+            # record of the previous one, which `_id` index finds directly,
+            # whereas `skip()` has to walk through every previous record
+            keyset_query = cls._get_keyset_query(sort, last_id, last_value)
+            if keyset_query.keys() & query.keys():
+                query = {'$and': [query, keyset_query]}
+            else:
+                query.update(keyset_query)
+
         if username and id_string:
             query.update(cls.get_base_query(username, id_string))
 
@@ -247,16 +317,66 @@ class ParsedInstance(models.Model):
         """
         cursor.skip(start).limit(limit)
 
-        if type(sort) == dict and len(sort) == 1:
-            sort = MongoHelper.to_safe_dict(sort, reading=True)
-            sort_key = list(sort)[0]
-            sort_dir = int(sort[sort_key])  # -1 for desc, 1 for asc
-            cursor.sort(sort_key, sort_dir)
+        sort_key, sort_dir = cls._get_sort_key(sort)
+        if sort_key == ID:
+            cursor.sort(ID, sort_dir)
+        else:
+            # `_id` breaks ties, so that the order is stable, which keyset
+            # pagination (`last_id`) relies on
+            cursor.sort([(sort_key, sort_dir), (ID, 1)])
 
         # set batch size
-        cursor.batch_size = cls.DEFAULT_BATCHSIZE
+        cursor.batch_size(cls.DEFAULT_BATCHSIZE)
         return cursor
 
+    @classmethod
+    def _get_keyset_query(cls, sort, last_id, last_value):
+        """
+        Returns the query matching records which come after the record
+        `last_id`, whose sort key is `last_value`, in the order of `sort`.
+
+        Records are ordered by sort key, then by `_id`. Records without the
+        sort key (or with `null`) come first in ascending order and last in
+        descending order, as MongoDB sorts them.
+
+        :param sort: dict
+        :param last_id: integer
+        :param last_value: value of the sort key of the record `last_id`
+        :return: dict
+        """
+        sort_key, sort_dir = cls._get_sort_key(sort)
+        operator = '$gt' if sort_dir > 0 else '$lt'
+        if sort_key == ID:
+            return {ID: {operator: last_id}}
+
+        same_value_query = {sort_key: last_value, ID: {'$gt': last_id}}
+        if last_value is None:
+            if sort_dir > 0:
+                return {
+                    '$or': [same_value_query, {sort_key: {'$ne': None}}]
+                }
+            return same_value_query
+
+        conditions = [{sort_key: {operator: last_value}}, same_value_query]
+        if sort_dir < 0:
+            conditions.append({sort_key: None})
+        return {'$or': conditions}
+
+    @classmethod
+    def _get_sort_key(cls, sort):
+        """
+        Returns the key, encoded for MongoDB, and the direction of `sort`.
+        Records are sorted by `_id` unless `sort` has exactly one key.
+
+        :param sort: dict
+        :return: tuple
+        """
+        if type(sort) == dict and len(sort) == 1:
+            sort = MongoHelper.to_safe_dict(dict(sort), reading=True)
+            sort_key = list(sort)[0]
+            return sort_key, int(sort[sort_key])  # -1 for desc, 1 for asc
+        return ID, 1
+
     def to_dict_for_mongo(self):
         d = self.to_dict()
         data = {
@@ -304,16 +424,150 @@ class ParsedInstance(models.Model):
 
         return True
 
+    @classmethod
+    def bulk_update_mongo(cls, parsed_instances):
+        """
+        Write `parsed_instances` to MongoDB with a single `bulk_write()`, and
+        flag the submissions which were written as synced.
+
+        Returns a dict of the errors, keyed by `Instance` primary key.
+        """
+        instance_ids = []
+        userform_ids = set()
+        operations = []
+        for parsed_instance in parsed_instances:
+            record = parsed_instance.to_dict_for_mongo()
+            if record.get('_xform_id_string') is None:
+                # Instance could not be parsed, see `update_mongo()`
+                continue
+            instance_ids.append(parsed_instance.instance_id)
+            userform_ids.add(record[cls.USERFORM_ID])
+            operations.append(
+                ReplaceOne({'_id': record['_id']}, record, upsert=True)
+            )
+
+        errors = {}
+        if not operations:
+            return errors
+
+        try:
+            xform_instances.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                instance_id = instance_ids[write_error['index']]
+                errors[instance_id] = write_error.get('errmsg', str(e))
+        except PyMongoError as e:
+            errors = {instance_id: str(e) for instance_id in instance_ids}
+        # Even a failed `bulk_write()` may have written some of the records
+        count_cache.invalidate_counts(userform_ids)
+
+        synced_instance_ids = [
+            instance_id
+            for instance_id in instance_ids
+            if instance_id not in errors
+        ]
+        if synced_instance_ids:
+            Instance.objects.filter(pk__in=synced_instance_ids).update(
+                is_synced_with_mongo=True
+            )
+
+        return errors
+
+    def queue_mongo_sync(self):
+        """
+        Queue this submission in the MongoDB outbox, within the current
+        database transaction. `sync_mongo_outbox()` writes it to MongoDB
+        later on.
+        """
+        MongoSyncOutbox.objects.create(instance_id=self.instance_id)
+        if self.instance.is_synced_with_mongo:
+            Instance.objects.filter(pk=self.instance_id).update(
+                is_synced_with_mongo=False
+            )
+            self.instance.is_synced_with_mongo = False
+
+    @classmethod
+    def sync_mongo_outbox(cls, batch_size=None):
+        """
+        Write up to `batch_size` submissions queued in the MongoDB outbox with
+        one `bulk_write()`. Documents are replaced (or inserted) by `_id`, so
+        writing a submission twice is harmless.
+
+        Outbox entries of submissions which could not be written are kept
+        and retried later on, with an exponential backoff.
+
+        Returns the number of outbox entries removed from the outbox.
+        """
+        batch_size = batch_size or settings.MONGO_SYNC_OUTBOX_BATCH_SIZE
+        now = timezone.now()
+        entries = list(
+            MongoSyncOutbox.objects.filter(next_attempt__lte=now)
+            .order_by('pk')
+            .values_list('pk', 'instance_id', 'attempts')[:batch_size]
+        )
+        if not entries:
+            return 0
+
+        entry_ids = defaultdict(list)
+        attempts = {}
+        for entry_id, instance_id, entry_attempts in entries:
+            entry_ids[instance_id].append(entry_id)
+            attempts[instance_id] = max(
+                attempts.get(instance_id, 0), entry_attempts
+            )
+
+        parsed_instances = cls.objects.filter(
+            instance_id__in=list(entry_ids)
+        ).select_related('instance__xform__user', 'instance__user')
+
+        errors = cls.bulk_update_mongo(parsed_instances)
+
+        with transaction.atomic():
+            # Entries of submissions which do not exist anymore, or cannot be
+            # parsed, are dropped as well
+            done_entry_ids = [
+                entry_id
+                for instance_id, ids in entry_ids.items()
+                if instance_id not in errors
+                for entry_id in ids
+            ]
+            MongoSyncOutbox.objects.filter(pk__in=done_entry_ids).delete()
+
+            # One statement per distinct error and delay: when MongoDB is
+            # unreachable, the whole batch is postponed at once
+            retries = defaultdict(list)
+            for instance_id, error in errors.items():
+                delay = min(
+                    settings.MONGO_SYNC_OUTBOX_RETRY_DELAY
+                    * 2 ** attempts[instance_id],
+                    settings.MONGO_SYNC_OUTBOX_MAX_RETRY_DELAY,
+                )
+                retries[(error, delay)].extend(entry_ids[instance_id])
+            for (error, delay), retried_entry_ids in retries.items():
+                MongoSyncOutbox.objects.filter(
+                    pk__in=retried_entry_ids
+                ).update(
+                    attempts=F('attempts') + 1,
+                    next_attempt=now + timedelta(seconds=delay),
+                    last_error=error,
+                )
+
+        return len(done_entry_ids)
+
     @staticmethod
     def bulk_update_validation_statuses(query, validation_status):
-        return xform_instances.update_many(
+        result = xform_instances.update_many(
             query,
             {"$set": {VALIDATION_STATUS: validation_status}},
         )
+        count_cache.invalidate_counts([query.get(USERFORM_ID)])
+        return result
 
     @staticmethod
     def bulk_delete(query):
-        return xform_instances.delete_many(query)
+        result = xform_instances.delete_many(query)
+        count_cache.invalidate_counts([query.get(USERFORM_ID)])
+        return result
 
     def to_dict(self):
         if not hasattr(self, "_dict_cache"):
@@ -370,7 +624,11 @@ class ParsedInstance(models.Model):
         # insert into Mongo.
         # Signal has been removed because of a race condition.
         # Rest Services were called before data was saved in DB.
-        success = self.update_mongo(asynchronous)
+        if settings.MONGO_SYNC_OUTBOX_ENABLED:
+            self.queue_mongo_sync()
+            success = True
+        else:
+            success = self.update_mongo(asynchronous)
         if success and created:
             call_service(self)
         return success
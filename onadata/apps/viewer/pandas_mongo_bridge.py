@@ -1,6 +1,9 @@
 # coding: utf-8
+import csv
+import json
 import time
 from collections import OrderedDict
+from io import StringIO
 from itertools import chain
 
 from django.conf import settings
@@ -34,7 +37,10 @@ from onadata.libs.utils.common_tags import (
     SUBMITTED_BY,
     VALIDATION_STATUS
 )
-from onadata.libs.utils.export_tools import question_types_to_exclude
+from onadata.libs.utils.export_tools import (
+    get_select_multiple_splitters,
+    question_types_to_exclude,
+)
 
 
 # this is Mongo Collection where we will store the parsed submissions
@@ -117,6 +123,10 @@ class AbstractDataFrameBuilder:
                                              id_string=self.id_string)
         self.select_multiples = self._collect_select_multiples(self.dd)
         self.gps_fields = self._collect_gps_fields(self.dd)
+        # Built once, rather than for every record
+        self.select_multiple_splitters = get_select_multiple_splitters(
+            self.select_multiples, self.BINARY_SELECT_MULTIPLES)
+        self.gps_xpaths = self._get_gps_xpaths(self.gps_fields)
 
     @classmethod
     def _fields_to_select(cls, dd):
@@ -136,37 +146,31 @@ class AbstractDataFrameBuilder:
         """ Prefix contains the xpath and slash if we are within a repeat so
         that we can figure out which select multiples belong to which repeat
         """
-        for key, choices in select_multiples.items():
-            # the select multiple might be blank or not exist in the record,
-            # need to make those False
-            selections = []
-            if key in record:
-                # split selected choices by spaces and join by / to the
-                # element's xpath
-                selections = ["%s/%s" % (key, r)
-                              for r in record[key].split(" ")]
+        return cls._apply_select_multiple_splitters(
+            record,
+            get_select_multiple_splitters(
+                select_multiples, binary_select_multiples))
+
+    @classmethod
+    def _apply_select_multiple_splitters(cls, record, splitters):
+        """
+        Replace the select multiples of `record`, and of its repeats, by a
+        column per choice, with `splitters` from
+        `get_select_multiple_splitters()`, in a single pass
+        """
+        for key, value in list(record.items()):
+            split = splitters.get(key)
+            if split is not None:
                 # remove the column since we are adding separate columns
                 # for each choice
                 record.pop(key)
-                if not binary_select_multiples:
-                    # add columns to record for every choice, with default
-                    # False and set to True for items in selections
-                    record.update(dict([(choice, choice in selections)
-                                        for choice in choices]))
-                else:
-                    YES = 1
-                    NO = 0
-                    record.update(
-                        dict([(choice, YES if choice in selections else NO)
-                              for choice in choices]))
-
-            # recurs into repeats
-            for record_key, record_item in record.items():
-                if type(record_item) == list:
-                    for list_item in record_item:
-                        if type(list_item) == dict:
-                            cls._split_select_multiples(
-                                list_item, select_multiples)
+                record.update(split(value))
+            elif type(value) == list:
+                # recurs into repeats
+                for list_item in value:
+                    if type(list_item) == dict:
+                        cls._apply_select_multiple_splitters(
+                            list_item, splitters)
         return record
 
     @classmethod
@@ -188,64 +192,105 @@ class AbstractDataFrameBuilder:
                     tags.append(tag)
             record.update({'_tags': ', '.join(sorted(tags))})
 
+    @classmethod
+    def _get_gps_xpaths(cls, gps_fields):
+        return {
+            key: DataDictionary.get_additional_geopoint_xpaths(key)
+            for key in gps_fields
+        }
+
     @classmethod
     def _split_gps_fields(cls, record, gps_fields):
+        cls._apply_gps_xpaths(record, cls._get_gps_xpaths(gps_fields))
+
+    @classmethod
+    def _apply_gps_xpaths(cls, record, gps_xpaths):
+        """
+        Add the components of the geopoints of `record`, and of its repeats,
+        to it. `gps_xpaths` maps geopoint xpaths to their components, see
+        `_get_gps_xpaths()`
+        """
         updated_gps_fields = {}
         for key, value in record.items():
-            if key in gps_fields and isinstance(value, str):
-                gps_xpaths = DataDictionary.get_additional_geopoint_xpaths(key)
-                gps_parts = dict([(xpath, None) for xpath in gps_xpaths])
+            if key in gps_xpaths and isinstance(value, str):
+                components = gps_xpaths[key]
+                gps_parts = dict.fromkeys(components)
                 # hack, check if its a list and grab the object within that
                 parts = value.split(' ')
                 # TODO: check whether or not we can have a gps recording
                 # from ODKCollect that has less than four components,
                 # for now we are assuming that this is not the case.
                 if len(parts) == 4:
-                    gps_parts = dict(zip(gps_xpaths, parts))
+                    gps_parts = dict(zip(components, parts))
                 updated_gps_fields.update(gps_parts)
             # check for repeats within record i.e. in value
             elif type(value) == list:
                 for list_item in value:
                     if type(list_item) == dict:
-                        cls._split_gps_fields(list_item, gps_fields)
+                        cls._apply_gps_xpaths(list_item, gps_xpaths)
         record.update(updated_gps_fields)
 
     def _query_mongo(self, query='{}', start=0,
                      limit=ParsedInstance.DEFAULT_LIMIT,
-                     fields='[]', count=False):
+                     fields='[]', count=False, last_id=None):
+        """
+        Return the count of records matching `query`, or a list of at most
+        `limit` of them, sorted by `_id`.
+
+        Pass the `_id` of the last record of the previous batch as `last_id`
+        to get the next one: unlike `start`, which is a `skip()`, the cost of
+        a batch does not grow with its position.
+        """
         # ParsedInstance.query_mongo takes params as json strings
         # so we dumps the fields dictionary
-        count_args = {
-            'username': self.username,
-            'id_string': self.id_string,
-            'query': query,
-            'fields': '[]',
-            'sort': '{}',
-            'count': True
-        }
-        count_object = ParsedInstance.query_mongo(**count_args)
-        record_count = count_object[0]["count"]
-        if record_count == 0:
-            raise NoRecordsFoundError("No records found for your query")
-        # if count was requested, return the count
         if count:
-            return record_count
-        else:
-            query_args = {
+            count_args = {
                 'username': self.username,
                 'id_string': self.id_string,
                 'query': query,
-                'fields': fields,
-                # TODO: we might want to add this in for the user
-                # to specify a sort order
+                'fields': '[]',
                 'sort': '{}',
-                'start': start,
-                'limit': limit,
-                'count': False
+                'count': True
             }
-            # use ParsedInstance.query_mongo
-            cursor = ParsedInstance.query_mongo(**query_args)
-            return cursor
+            count_object = ParsedInstance.query_mongo(**count_args)
+            record_count = count_object[0]["count"]
+            if record_count == 0:
+                raise NoRecordsFoundError("No records found for your query")
+            return record_count
+
+        query_args = {
+            'username': self.username,
+            'id_string': self.id_string,
+            'query': query,
+            'fields': fields,
+            # TODO: we might want to add this in for the user
+            # to specify a sort order
+            'sort': '{}',
+            'start': start,
+            'limit': limit,
+            'count': False,
+            'last_id': last_id,
+        }
+        # use ParsedInstance.query_mongo
+        records = list(ParsedInstance.query_mongo(**query_args))
+        if not records and start == 0 and last_id is None:
+            raise NoRecordsFoundError("No records found for your query")
+        return records
+
+    def _iter_batches(self, batchsize, fields='[]'):
+        """
+        Yield lists of at most `batchsize` records matching `filter_query`,
+        by ascending `_id`.
+        """
+        last_id = None
+        while True:
+            records = self._query_mongo(
+                self.filter_query, limit=batchsize, fields=fields,
+                last_id=last_id)
+            if not records:
+                break
+            last_id = records[-1][ID]
+            yield records
 
 
 class XLSDataFrameBuilder(AbstractDataFrameBuilder):
@@ -281,18 +326,11 @@ class XLSDataFrameBuilder(AbstractDataFrameBuilder):
     def export_to(self, file_path, batchsize=1000):
         self.xls_writer = ExcelWriter(file_path)
 
-        # get record count
-        record_count = self._query_mongo(count=True)
-
         # query in batches and for each batch create an XLSDataFrameWriter and
         # write to existing xls_writer object
-        start = 0
         header = True
-        while start < record_count:
-            cursor = self._query_mongo(self.filter_query, start=start,
-                                       limit=batchsize)
-
-            data = self._format_for_dataframe(cursor)
+        for records in self._iter_batches(batchsize):
+            data = self._format_for_dataframe(records)
 
             # write all cursor's data to their respective sheets
             for section_name, section in self.sections.items():
@@ -310,8 +348,6 @@ class XLSDataFrameBuilder(AbstractDataFrameBuilder):
                     writer.write_to_excel(self.xls_writer, section_name,
                                           header=header, index=False)
             header = False
-            # increment counter(s)
-            start += batchsize
             time.sleep(0.1)
         self.xls_writer.save()
 
@@ -367,10 +403,10 @@ class XLSDataFrameBuilder(AbstractDataFrameBuilder):
 
         if self.split_select_multiples:
             # find any select multiple(s) and add additional columns to record
-            record = self._split_select_multiples(
-                record, self.select_multiples)
+            record = self._apply_select_multiple_splitters(
+                record, self.select_multiple_splitters)
         # alt, precision
-        self._split_gps_fields(record, self.gps_fields)
+        self._apply_gps_xpaths(record, self.gps_xpaths)
         for column in columns:
             data_value = None
             try:
@@ -594,8 +630,7 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
                     # generated when we reindex
                 ordered_columns[child.get_abbreviated_xpath()] = None
 
-    def _format_for_dataframe(self, cursor):
-        # TODO: check for and handle empty results
+    def _add_split_columns(self):
         # add ordered columns for select multiples
         if self.split_select_multiples:
             for key, choices in self.select_multiples.items():
@@ -604,18 +639,20 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
                     remove_dups_from_list_maintain_order(choices)
         # add ordered columns for gps fields
         for key in self.gps_fields:
-            gps_xpaths = self.dd.get_additional_geopoint_xpaths(key)
-            self.ordered_columns[key] = [key] + gps_xpaths
+            self.ordered_columns[key] = [key] + self.gps_xpaths[key]
+
+    def _format_for_dataframe(self, cursor):
+        # TODO: check for and handle empty results
+        self._add_split_columns()
         data = []
         for record in cursor:
             # split select multiples
             if self.split_select_multiples:
-                record = self._split_select_multiples(
-                    record, self.select_multiples,
-                    self.BINARY_SELECT_MULTIPLES)
+                record = self._apply_select_multiple_splitters(
+                    record, self.select_multiple_splitters)
             # check for gps and split into components i.e. latitude, longitude,
             # altitude, precision
-            self._split_gps_fields(record, self.gps_fields)
+            self._apply_gps_xpaths(record, self.gps_xpaths)
             self._tag_edit_string(record)
             flat_dict = {}
             # re index repeats
@@ -631,27 +668,75 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
         return data
 
     def export_to(self, file_or_path, data_frame_max_size=30000):
-        from math import ceil
-        # get record count
-        record_count = self._query_mongo(query=self.filter_query, count=True)
+        """
+        Write the CSV export in two passes over the submissions, one batch of
+        `data_frame_max_size` records at a time, so that memory usage does not
+        depend on the number of submissions.
+
+        Repeat columns (e.g. `kids/kids_details[3]/kids_name`) depend on the
+        content of every submission. The first pass only fetches the repeat
+        groups to discover them, and is skipped if the form has none. The
+        second pass writes the rows.
+        """
+        self.discover_columns(data_frame_max_size)
+        columns = self.get_columns()
 
+        if hasattr(file_or_path, 'read'):
+            csv_file = file_or_path
+            close = False
+        else:
+            csv_file = open(file_or_path, 'w', newline='')
+            close = True
+
+        try:
+            csv.writer(csv_file, lineterminator='\n').writerow(columns)
+            self.write_rows(csv_file, columns, data_frame_max_size)
+        finally:
+            if close:
+                csv_file.close()
+
+    def discover_columns(self, data_frame_max_size=30000):
+        """
+        Build `self.ordered_columns`, going through the repeat groups of all
+        the submissions matching `filter_query` if the form has any
+        """
         self.ordered_columns = OrderedDict()
         self._build_ordered_columns(self.dd.survey, self.ordered_columns)
+        self._add_split_columns()
+
+        repeat_xpaths = sorted(self.dd.get_repeat_xpaths())
+        if repeat_xpaths:
+            for records in self._iter_batches(
+                data_frame_max_size, fields=json.dumps(repeat_xpaths)
+            ):
+                # Only the side effect on `self.ordered_columns` is needed
+                self._format_for_dataframe(records)
 
-        # pandas will only export 30k records in a dataframe to a csv
-        # - we need to create multiple 30k dataframes if required,
-        # we need to go through all the records though so that
-        # we can figure out the columns we need for repeats
-        datas = []
-        num_data_frames = \
-            int(ceil(float(record_count) / float(data_frame_max_size)))
-        for i in range(num_data_frames):
-            cursor = self._query_mongo(
-                self.filter_query, start=(i * data_frame_max_size),
-                limit=data_frame_max_size)
-            data = self._format_for_dataframe(cursor)
-            datas.append(data)
+        return self.ordered_columns
 
+    @classmethod
+    def merge_ordered_columns(cls, ordered_columns_list):
+        """
+        Merge the `ordered_columns` discovered over consecutive ranges of
+        submissions, e.g. by `discover_columns()` on export shards. The result
+        is the same as if all the submissions had been gone through at once.
+        """
+        merged = OrderedDict()
+        for ordered_columns in ordered_columns_list:
+            for key, cols in ordered_columns.items():
+                if cols is None:
+                    merged.setdefault(key, None)
+                    continue
+                merged_cols = merged.get(key) or []
+                merged[key] = merged_cols + [
+                    col for col in cols if col not in merged_cols
+                ]
+        return merged
+
+    def get_columns(self):
+        """
+        Return the header of the export, from `self.ordered_columns`
+        """
         columns = list(chain.from_iterable(
             [[xpath] if cols is None else cols
              for xpath, cols in self.ordered_columns.items()]))
@@ -664,20 +749,53 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
         # add extra columns
         columns += [col for col in self.ADDITIONAL_COLUMNS]
 
-        header = True
-        if hasattr(file_or_path, 'read'):
-            csv_file = file_or_path
-            close = False
-        else:
-            csv_file = open(file_or_path, "w")
-            close = True
+        # remove columns we don't want
+        return [col for col in columns if col not in self.IGNORED_COLUMNS]
 
-        for data in datas:
-            writer = CSVDataFrameWriter(data, columns)
-            writer.write_to_csv(csv_file, header=header)
-            header = False
-        if close:
-            csv_file.close()
+    def write_rows(self, csv_file, columns, data_frame_max_size=30000):
+        """
+        Write the submissions matching `filter_query` to `csv_file`, without
+        header, one batch of `data_frame_max_size` records at a time
+        """
+        writer = csv.writer(csv_file, lineterminator='\n')
+        for rows in self._iter_row_batches(columns, data_frame_max_size):
+            writer.writerows(rows)
+
+    def iter_csv(self, data_frame_max_size=30000):
+        """
+        Return an iterator over the CSV export as text: the header, and then
+        the rows of one batch of `data_frame_max_size` records at a time.
+
+        The columns are discovered before this returns, i.e. before a
+        streaming response is started, so that errors are reported with a
+        proper status. For forms with repeat groups, this is a whole pass
+        over the repeat groups of the matching submissions: the first byte
+        comes only after it.
+        """
+        self.discover_columns(data_frame_max_size)
+        return self._iter_csv(self.get_columns(), data_frame_max_size)
+
+    def _iter_csv(self, columns, data_frame_max_size):
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for rows in self._iter_row_batches(columns, data_frame_max_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+
+    def _iter_row_batches(self, columns, data_frame_max_size):
+        na_rep = getattr(settings, 'NA_REP', NA_REP)
+        for records in self._iter_batches(data_frame_max_size):
+            yield [
+                [
+                    na_rep if record.get(col) is None else record[col]
+                    for col in columns
+                ]
+                for record in self._format_for_dataframe(records)
+            ]
 
 
 class XLSDataFrameWriter:
@@ -8,6 +8,7 @@ from onadata.apps.logger.models import XForm
 from onadata.apps.viewer.models.data_dictionary import DataDictionary
 from onadata.apps.viewer.models.export import Export
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
+from onadata.libs.utils.count_cache import invalidate_counts
 
 
 @receiver(post_delete, sender=Export)
@@ -27,4 +28,8 @@ def set_object_permissions(sender, instance=None, created=False, **kwargs):
 @receiver(pre_delete, sender=ParsedInstance)
 def remove_from_mongo(sender, **kwargs):
     instance_id = kwargs.get('instance').instance.id
-    settings.MONGO_DB.instances.delete_one({'_id': instance_id})
+    record = settings.MONGO_DB.instances.find_one_and_delete(
+        {'_id': instance_id}, {ParsedInstance.USERFORM_ID: 1}
+    )
+    if record:
+        invalidate_counts([record.get(ParsedInstance.USERFORM_ID)])
@@ -8,17 +8,31 @@ try:
 except ImportError:
     from backports.zoneinfo import ZoneInfo
 
-from celery import shared_task
+from celery import chord, shared_task
 from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.mail import mail_admins
 
 from onadata.celery import app
+from onadata.apps.logger.models import XForm
 from onadata.apps.viewer.models.export import Export
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance
 from onadata.libs.exceptions import NoRecordsFoundError
 from onadata.libs.utils.export_tools import (
+    discover_csv_export_columns,
+    generate_csv_export_part,
     generate_export,
     generate_attachments_zip_export,
-    generate_kml_export
+    generate_kml_export,
+    generate_xls_export_part,
+    get_csv_export_columns,
+    get_export_part_path,
+    get_export_shard_query,
+    get_export_shards,
+    get_previous_export,
+    is_incremental_export,
+    merge_export_parts,
 )
 from onadata.libs.utils.logger_tools import mongo_sync_status, report_exception
 
@@ -39,7 +53,10 @@ def create_async_export(xform, export_type, query, force_xlsx, options=None):
         'export_id': export.id,
         'query': query,
     }
-    if export_type in [Export.XLS_EXPORT, Export.CSV_EXPORT]:
+    if export_type in [
+        Export.XLS_EXPORT, Export.CSV_EXPORT, Export.PARQUET_EXPORT,
+        Export.JSONL_EXPORT,
+    ]:
         if options and "group_delimiter" in options:
             arguments["group_delimiter"] = options["group_delimiter"]
         if options and "split_select_multiples" in options:
@@ -50,7 +67,17 @@ def create_async_export(xform, export_type, query, force_xlsx, options=None):
                 options["binary_select_multiples"]
 
         # start async export
-        if export_type == Export.XLS_EXPORT:
+        if export_type == Export.PARQUET_EXPORT:
+            result = create_parquet_export.apply_async(
+                (), arguments, countdown=10)
+        elif export_type == Export.JSONL_EXPORT:
+            result = create_jsonl_export.apply_async(
+                (), arguments, countdown=10)
+        elif settings.SHARDED_EXPORTS_ENABLED:
+            arguments['export_type'] = export_type
+            result = create_sharded_export.apply_async(
+                (), arguments, countdown=10)
+        elif export_type == Export.XLS_EXPORT:
             result = create_xls_export.apply_async((), arguments, countdown=10)
         elif export_type == Export.CSV_EXPORT:
             result = create_csv_export.apply_async(
@@ -88,9 +115,7 @@ def create_xls_export(username, id_string, export_id, query=None,
     # http://docs.celeryproject.org/en/latest/userguide/tasks.html#state
     ext = 'xls' if not force_xlsx else 'xlsx'
 
-    try:
-        export = Export.objects.get(id=export_id)
-    except Export.DoesNotExist:
+    if not Export.objects.filter(id=export_id).exists():
         # no export for this ID return None.
         return None
 
@@ -101,17 +126,7 @@ def create_xls_export(username, id_string, export_id, query=None,
             Export.XLS_EXPORT, ext, username, id_string, export_id, query,
             group_delimiter, split_select_multiples, binary_select_multiples)
     except (Exception, NoRecordsFoundError) as e:
-        export.internal_status = Export.FAILED
-        export.save()
-        # mail admins
-        details = {
-            'export_id': export_id,
-            'username': username,
-            'id_string': id_string
-        }
-        report_exception("XLS Export Exception: Export ID - "
-                         "%(export_id)s, /%(username)s/%(id_string)s"
-                         % details, e, sys.exc_info())
+        _fail_export(export_id, Export.XLS_EXPORT, username, id_string, e)
         # Raise for now to let celery know we failed
         # - doesnt seem to break celery`
         raise
@@ -138,20 +153,242 @@ def create_csv_export(username, id_string, export_id, query=None,
         export.internal_status = Export.FAILED
         export.save()
     except Exception as e:
+        _fail_export(export_id, Export.CSV_EXPORT, username, id_string, e)
+        raise
+    else:
+        return gen_export.id
+
+
+@app.task()
+def create_parquet_export(username, id_string, export_id, query=None,
+                          group_delimiter='/', split_select_multiples=True,
+                          binary_select_multiples=False):
+    export = Export.objects.get(id=export_id)
+    try:
+        gen_export = generate_export(
+            Export.PARQUET_EXPORT, 'zip', username, id_string, export_id,
+            query, group_delimiter, split_select_multiples,
+            binary_select_multiples)
+    except NoRecordsFoundError:
+        export.internal_status = Export.FAILED
+        export.save()
+    except Exception as e:
+        _fail_export(export_id, Export.PARQUET_EXPORT, username, id_string, e)
+        raise
+    else:
+        return gen_export.id
+
+
+@app.task()
+def create_jsonl_export(username, id_string, export_id, query=None,
+                        group_delimiter='/', split_select_multiples=True,
+                        binary_select_multiples=False):
+    export = Export.objects.get(id=export_id)
+    try:
+        gen_export = generate_export(
+            Export.JSONL_EXPORT, 'jsonl', username, id_string, export_id,
+            query, group_delimiter, split_select_multiples,
+            binary_select_multiples)
+    except NoRecordsFoundError:
         export.internal_status = Export.FAILED
         export.save()
-        # mail admins
+    except Exception as e:
+        _fail_export(export_id, Export.JSONL_EXPORT, username, id_string, e)
+        raise
+    else:
+        return gen_export.id
+
+
+@app.task()
+def create_sharded_export(export_type, username, id_string, export_id,
+                          query=None, group_delimiter='/',
+                          split_select_multiples=True,
+                          binary_select_multiples=False):
+    """
+    Split a CSV or XLSX export into shards of `settings.EXPORT_SHARD_SIZE`
+    submissions, which are generated in parallel by several workers and
+    merged by a chord callback. Exports which fit in a single shard are
+    generated by this task directly.
+
+    CSV exports need two chords: the repeat columns of all shards must be
+    known before any row is written.
+    """
+    options = {
+        'group_delimiter': group_delimiter,
+        'split_select_multiples': split_select_multiples,
+        'binary_select_multiples': binary_select_multiples,
+    }
+    export_task = (
+        create_csv_export if export_type == Export.CSV_EXPORT
+        else create_xls_export
+    )
+
+    incremental = is_incremental_export(export_type, query, **options)
+    try:
+        if incremental:
+            xform = XForm.objects.get(
+                user__username__iexact=username, id_string__exact=id_string)
+            if get_previous_export(xform, export_type, export_id):
+                # Appending the new submissions is cheaper
+                return export_task(
+                    username, id_string, export_id, query, **options)
+        shards = get_export_shards(username, id_string, query)
+    except Exception as e:
+        _fail_export(export_id, export_type, username, id_string, e)
+        raise
+
+    if len(shards) <= 1:
+        return export_task(username, id_string, export_id, query, **options)
+
+    high_water_mark = {}
+    if incremental:
+        high_water_mark = {
+            'last_submission_id': shards[-1]['last_id'],
+            'num_of_records': sum(shard['count'] for shard in shards),
+        }
+
+    extension = 'csv' if export_type == Export.CSV_EXPORT else 'xlsx'
+    part_paths = [
+        get_export_part_path(
+            username, id_string, export_type, export_id, index, extension)
+        for index in range(len(shards))
+    ]
+    on_error = mark_export_as_failed.si(
+        export_id, export_type, username, id_string, part_paths)
+    if export_type == Export.CSV_EXPORT:
+        chord(
+            [
+                find_csv_export_part_columns.s(
+                    username, id_string, get_export_shard_query(query, shard),
+                    **options)
+                for shard in shards
+            ],
+            create_csv_export_parts.s(
+                username, id_string, export_id, query, shards,
+                high_water_mark, **options
+            ).on_error(on_error),
+        ).apply_async()
+    else:
+        part_tasks = [
+            create_xls_export_part.s(
+                username, id_string, part_path,
+                get_export_shard_query(query, shard), **options)
+            for part_path, shard in zip(part_paths, shards)
+        ]
+        chord(
+            part_tasks,
+            finish_sharded_export.si(
+                export_type, 'xlsx', username, id_string, export_id,
+                part_paths, query=query, **high_water_mark
+            ).on_error(on_error),
+        ).apply_async()
+
+    return export_id
+
+
+@app.task()
+def find_csv_export_part_columns(username, id_string, query, **options):
+    return discover_csv_export_columns(username, id_string, query, **options)
+
+
+@app.task()
+def create_csv_export_parts(ordered_columns_list, username, id_string,
+                            export_id, query, shards, high_water_mark,
+                            **options):
+    """
+    Chord callback of `find_csv_export_part_columns`, which starts writing
+    the rows of every shard once the columns are known
+    """
+    columns = get_csv_export_columns(
+        username, id_string, ordered_columns_list, **options)
+    part_paths = [
+        get_export_part_path(
+            username, id_string, Export.CSV_EXPORT, export_id, index, 'csv')
+        for index in range(len(shards))
+    ]
+    chord(
+        [
+            create_csv_export_part.s(
+                username, id_string, part_path, columns,
+                get_export_shard_query(query, shard), **options)
+            for part_path, shard in zip(part_paths, shards)
+        ],
+        finish_sharded_export.si(
+            Export.CSV_EXPORT, 'csv', username, id_string, export_id,
+            part_paths, columns=columns, query=query, **high_water_mark
+        ).on_error(mark_export_as_failed.si(
+            export_id, Export.CSV_EXPORT, username, id_string, part_paths)),
+    ).apply_async()
+
+
+@app.task()
+def create_csv_export_part(username, id_string, part_path, columns, query,
+                           **options):
+    generate_csv_export_part(
+        username, id_string, part_path, columns, query, **options)
+
+
+@app.task()
+def create_xls_export_part(username, id_string, part_path, query,
+                           **options):
+    generate_xls_export_part(
+        username, id_string, part_path, query, **options)
+
+
+@app.task()
+def finish_sharded_export(export_type, extension, username, id_string,
+                          export_id, part_paths, columns=None, query=None,
+                          last_submission_id=None, num_of_records=None):
+    try:
+        gen_export = merge_export_parts(
+            export_type, extension, username, id_string, export_id,
+            part_paths, columns, query, last_submission_id, num_of_records)
+    except Exception as e:
+        _fail_export(export_id, export_type, username, id_string, e)
+        raise
+    else:
+        return gen_export.id
+
+
+@app.task()
+def mark_export_as_failed(export_id, export_type=None, username=None,
+                          id_string=None, part_paths=()):
+    """
+    Error callback of the chords of sharded exports: delete the parts which
+    have been written, mark the export as failed and report it, unless
+    `finish_sharded_export` already has
+    """
+    for part_path in part_paths:
+        # Missing files are ignored
+        default_storage.delete(part_path)
+
+    if Export.objects.filter(id=export_id).exclude(
+        internal_status=Export.FAILED
+    ).update(internal_status=Export.FAILED):
         details = {
+            'export_type': (export_type or '').upper(),
             'export_id': export_id,
             'username': username,
             'id_string': id_string
         }
-        report_exception("CSV Export Exception: Export ID - "
+        report_exception("%(export_type)s Export Exception: Export ID - "
                          "%(export_id)s, /%(username)s/%(id_string)s"
-                         % details, e, sys.exc_info())
-        raise
-    else:
-        return gen_export.id
+                         % details,
+                         "A part of the sharded export failed")
+
+
+def _fail_export(export_id, export_type, username, id_string, e):
+    Export.objects.filter(id=export_id).update(internal_status=Export.FAILED)
+    # mail admins
+    details = {
+        'export_type': export_type.upper(),
+        'export_id': export_id,
+        'username': username,
+        'id_string': id_string
+    }
+    report_exception("%(export_type)s Export Exception: Export ID - "
+                     "%(export_id)s, /%(username)s/%(id_string)s"
+                     % details, e, sys.exc_info())
 
 
 @app.task()
@@ -159,24 +396,14 @@ def create_kml_export(username, id_string, export_id, query=None):
     # we re-query the db instead of passing model objects according to
     # http://docs.celeryproject.org/en/latest/userguide/tasks.html#state
 
-    export = Export.objects.get(id=export_id)
+    Export.objects.get(id=export_id)
     try:
         # though export is not available when for has 0 submissions, we
         # catch this since it potentially stops celery
         gen_export = generate_kml_export(
             Export.KML_EXPORT, 'kml', username, id_string, export_id, query)
     except (Exception, NoRecordsFoundError) as e:
-        export.internal_status = Export.FAILED
-        export.save()
-        # mail admins
-        details = {
-            'export_id': export_id,
-            'username': username,
-            'id_string': id_string
-        }
-        report_exception("KML Export Exception: Export ID - "
-                         "%(export_id)s, /%(username)s/%(id_string)s"
-                         % details, e, sys.exc_info())
+        _fail_export(export_id, Export.KML_EXPORT, username, id_string, e)
         raise
     else:
         return gen_export.id
@@ -184,22 +411,12 @@ def create_kml_export(username, id_string, export_id, query=None):
 
 @app.task()
 def create_zip_export(username, id_string, export_id, query=None):
-    export = Export.objects.get(id=export_id)
+    Export.objects.get(id=export_id)
     try:
         gen_export = generate_attachments_zip_export(
             Export.ZIP_EXPORT, 'zip', username, id_string, export_id, query)
     except (Exception, NoRecordsFoundError) as e:
-        export.internal_status = Export.FAILED
-        export.save()
-        # mail admins
-        details = {
-            'export_id': export_id,
-            'username': username,
-            'id_string': id_string
-        }
-        report_exception("Zip Export Exception: Export ID - "
-                         "%(export_id)s, /%(username)s/%(id_string)s"
-                         % details, e)
+        _fail_export(export_id, Export.ZIP_EXPORT, username, id_string, e)
         raise
     else:
         if not settings.TESTING_MODE:
@@ -260,6 +477,27 @@ def email_mongo_sync_status():
                              SYNC_MONGO_MANUAL_INSTRUCTIONS]))
 
 
+@shared_task(soft_time_limit=600, time_limit=630)
+def sync_mongo_outbox():
+    """
+    Write the submissions queued in the MongoDB outbox, batch after batch,
+    until the outbox is empty. Only one worker drains the outbox at a time,
+    so that a submission queued twice cannot be overwritten by its older
+    version.
+    """
+    batch_size = settings.MONGO_SYNC_OUTBOX_BATCH_SIZE
+    lock = cache.lock('mongo_sync_outbox_lock', timeout=630)
+    if not lock.acquire(blocking=False):
+        # Another worker is already draining the outbox
+        return
+
+    try:
+        while ParsedInstance.sync_mongo_outbox(batch_size) == batch_size:
+            pass
+    finally:
+        lock.release()
+
+
 @shared_task(soft_time_limit=60, time_limit=90)
 def log_stuck_exports_and_mark_failed():
     # How long can an export possibly run, not including time spent waiting in
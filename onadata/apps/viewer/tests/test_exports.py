@@ -4,13 +4,19 @@ import datetime
 import json
 import os
 import io
+import zipfile
+from xml.etree import ElementTree
 from time import sleep
 
+import pyarrow.parquet as pq
 import requests
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage, FileSystemStorage
+from django.test import override_settings
 from django.urls import reverse
 from django.utils.dateparse import parse_datetime
+from mock import patch
 from openpyxl import load_workbook
 
 from onadata.apps.main.tests.test_base import TestBase
@@ -24,10 +30,15 @@ from onadata.apps.viewer.views import (
 from onadata.apps.viewer.xls_writer import XlsWriter
 from onadata.apps.viewer.models.export import Export
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
-from onadata.apps.logger.models import Instance
-from onadata.apps.viewer.tasks import create_xls_export
+from onadata.apps.logger.models import Attachment, Instance
+from onadata.apps.viewer.tasks import (
+    create_sharded_export,
+    create_xls_export,
+    mark_export_as_failed,
+)
 from onadata.libs.utils.export_tools import generate_export,\
-    increment_index_in_filename, dict_to_joined_export
+    increment_index_in_filename, dict_to_joined_export, get_previous_export,\
+    generate_attachments_zip_export, generate_kml_export, get_export_part_path
 
 AMBULANCE_KEY = (
     'transport/available_transportation_types_to_referral_facility/ambulance'
@@ -43,6 +54,20 @@ def _main_fixture_path(instance_name):
                         instance_name, instance_name + '.xml')
 
 
+def _read_csv_export(export):
+    with default_storage.open(export.filepath) as f:
+        return f.read()
+
+
+def _read_xlsx_export(export):
+    with default_storage.open(export.filepath) as f:
+        wb = load_workbook(f, read_only=True)
+        return {
+            ws.title: list(ws.iter_rows(values_only=True))
+            for ws in wb.worksheets
+        }
+
+
 class TestExports(TestBase):
 
     def setUp(self):
@@ -960,3 +985,203 @@ class TestExports(TestBase):
             self.xform.id_string, non_existent_id)
 
         self.assertEqual(result, None)
+
+    @override_settings(EXPORT_SHARD_SIZE=2)
+    def test_sharded_export_matches_export(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+
+        for export_type, read_export in [
+            (Export.CSV_EXPORT, _read_csv_export),
+            (Export.XLS_EXPORT, _read_xlsx_export),
+        ]:
+            expected = generate_export(
+                export_type, 'csv' if export_type == Export.CSV_EXPORT
+                else 'xlsx', self.user.username, self.xform.id_string)
+            export = Export.objects.create(
+                xform=self.xform, export_type=export_type)
+            create_sharded_export(
+                export_type, self.user.username, self.xform.id_string,
+                export.id)
+            export = Export.objects.get(pk=export.pk)
+            self.assertEqual(export.status, Export.SUCCESSFUL)
+            self.assertEqual(read_export(export), read_export(expected))
+
+    def test_mark_sharded_export_as_failed(self):
+        self._publish_transportation_form()
+        export = Export.objects.create(
+            xform=self.xform, export_type=Export.XLS_EXPORT)
+        part_paths = [
+            get_export_part_path(
+                self.user.username, self.xform.id_string, Export.XLS_EXPORT,
+                export.id, index, 'xlsx')
+            for index in range(2)
+        ]
+        # Only the first part has been written
+        default_storage.save(part_paths[0], ContentFile(b'part'))
+
+        with patch(
+            'onadata.apps.viewer.tasks.report_exception'
+        ) as mock_report_exception:
+            for _ in range(2):
+                mark_export_as_failed(
+                    export.id, Export.XLS_EXPORT, self.user.username,
+                    self.xform.id_string, part_paths)
+
+        self.assertFalse(default_storage.exists(part_paths[0]))
+        export = Export.objects.get(pk=export.pk)
+        self.assertEqual(export.status, Export.FAILED)
+        # Only reported once
+        mock_report_exception.assert_called_once()
+
+    @override_settings(INCREMENTAL_EXPORTS_ENABLED=True)
+    def test_incremental_export(self):
+        self._publish_transportation_form()
+        self._submit_transport_instance_w_uuid('transport_2011-07-25_19-05-36')
+        previous_export = generate_export(
+            Export.CSV_EXPORT, 'csv', self.user.username,
+            self.xform.id_string)
+        self.assertEqual(previous_export.num_of_records, 1)
+        # XLSX exports are always generated from scratch
+        xlsx_export = generate_export(
+            Export.XLS_EXPORT, 'xlsx', self.user.username,
+            self.xform.id_string)
+        self.assertIsNone(xlsx_export.last_submission_id)
+
+        self._submit_transport_instance()
+        self.assertEqual(
+            get_previous_export(self.xform, Export.CSV_EXPORT),
+            previous_export)
+        self.assertIsNone(get_previous_export(self.xform, Export.XLS_EXPORT))
+        export = generate_export(
+            Export.CSV_EXPORT, 'csv', self.user.username,
+            self.xform.id_string)
+        self.assertEqual(export.num_of_records, 2)
+        self.assertEqual(
+            export.last_submission_id,
+            self.xform.instances.latest('pk').pk)
+        with override_settings(INCREMENTAL_EXPORTS_ENABLED=False):
+            expected = generate_export(
+                Export.CSV_EXPORT, 'csv', self.user.username,
+                self.xform.id_string)
+        self.assertEqual(_read_csv_export(export), _read_csv_export(expected))
+
+        # Submissions which have been exported are edited
+        self._make_submission(
+            _main_fixture_path('transport_2011-07-25_19-05-36-edited'))
+        self.assertIsNone(get_previous_export(self.xform, Export.CSV_EXPORT))
+
+    def test_parquet_export(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        export = generate_export(
+            Export.PARQUET_EXPORT, 'zip', self.user.username,
+            self.xform.id_string)
+        self.assertTrue(export.filename.endswith('.zip'))
+
+        expected = generate_export(
+            Export.XLS_EXPORT, 'xlsx', self.user.username,
+            self.xform.id_string)
+        sheets = _read_xlsx_export(expected)
+
+        with default_storage.open(export.filepath) as f:
+            with zipfile.ZipFile(f) as zip_file:
+                self.assertEqual(
+                    sorted(zip_file.namelist()),
+                    sorted(title + '.parquet' for title in sheets))
+                for title, rows in sheets.items():
+                    table = pq.read_table(
+                        io.BytesIO(zip_file.read(title + '.parquet')))
+                    self.assertEqual(table.column_names, list(rows[0]))
+                    self.assertEqual(table.num_rows, len(rows) - 1)
+                    self.assertEqual(
+                        table.column('_index').to_pylist(),
+                        [row[rows[0].index('_index')] for row in rows[1:]])
+
+    def test_jsonl_export(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        export = generate_export(
+            Export.JSONL_EXPORT, 'jsonl', self.user.username,
+            self.xform.id_string)
+        self.assertTrue(export.filename.endswith('.jsonl'))
+
+        expected = generate_export(
+            Export.XLS_EXPORT, 'xlsx', self.user.username,
+            self.xform.id_string)
+        sheets = _read_xlsx_export(expected)
+
+        tables = {}
+        with default_storage.open(export.filepath) as f:
+            for line in f:
+                row = json.loads(line)
+                tables.setdefault(row.pop('_table'), []).append(row)
+        self.assertEqual(
+            sorted(tables), sorted(t for t, r in sheets.items() if r[1:]))
+        for title, rows in tables.items():
+            headers = sheets[title][0]
+            self.assertEqual(list(rows[0]), headers)
+            self.assertEqual(len(rows), len(sheets[title]) - 1)
+            self.assertEqual(
+                [row['_parent_table_name'] for row in rows],
+                [r[headers.index('_parent_table_name')]
+                 for r in sheets[title][1:]])
+
+    @override_settings(ATTACHMENTS_ZIP_PREFETCH_WORKERS=1)
+    def test_attachments_zip_export(self):
+        self._publish_transportation_form()
+        for survey_at in range(3):
+            self._submit_transport_instance_w_attachment(survey_at)
+        attachments = list(Attachment.objects.filter(
+            instance__xform=self.xform).order_by('pk'))
+        self.assertEqual(len(attachments), 3)
+        # Missing files are skipped
+        default_storage.delete(attachments[1].media_file.name)
+
+        export = generate_attachments_zip_export(
+            Export.ZIP_EXPORT, 'zip', self.user.username, self.xform.id_string)
+
+        with default_storage.open(export.filepath) as f:
+            with zipfile.ZipFile(f) as zip_file:
+                self.assertEqual(
+                    sorted(zip_file.namelist()),
+                    sorted([attachments[0].media_file.name,
+                            attachments[2].media_file.name]))
+                for attachment in attachments[::2]:
+                    with default_storage.open(
+                            attachment.media_file.name) as media_file:
+                        self.assertEqual(
+                            zip_file.read(attachment.media_file.name),
+                            media_file.read())
+
+    def test_kml_export(self):
+        self._publish_xls_file_and_set_xform(
+            self._fixture_path('gps', 'gps.xls'))
+        self._make_submissions_gps()
+
+        export = generate_kml_export(
+            Export.KML_EXPORT, 'kml', self.user.username, self.xform.id_string)
+
+        namespace = '{http://earth.google.com/kml/2.2}'
+        with default_storage.open(export.filepath) as f:
+            document = ElementTree.parse(f).getroot().find(
+                namespace + 'Document')
+        self.assertEqual(
+            document.find(namespace + 'name').text, self.xform.id_string)
+        placemarks = [
+            (
+                placemark.find(namespace + 'description').text.strip(),
+                placemark.find(
+                    '{0}Point/{0}coordinates'.format(namespace)).text.strip(),
+            )
+            for placemark in document.findall(namespace + 'Placemark')
+        ]
+        instances = self.xform.instances.order_by('id')
+        self.assertEqual(len(placemarks), 2)
+        self.assertEqual(placemarks, [
+            (
+                'Survey Instance: {}'.format(instance.uuid),
+                '{}, {}'.format(instance.point.x, instance.point.y),
+            )
+            for instance in instances
+        ])
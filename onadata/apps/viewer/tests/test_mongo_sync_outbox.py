@@ -0,0 +1,85 @@
+# coding: utf-8
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from mock import patch
+from pymongo.errors import PyMongoError
+
+from onadata.apps.logger.models import Instance
+from onadata.apps.main.tests.test_base import TestBase
+from onadata.apps.viewer.models.mongo_sync_outbox import MongoSyncOutbox
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance
+from onadata.apps.viewer.tasks import sync_mongo_outbox
+
+
+@override_settings(MONGO_SYNC_OUTBOX_ENABLED=True)
+class TestMongoSyncOutbox(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self._publish_transportation_form()
+        self._make_submissions()
+
+    def _count_mongo_documents(self):
+        return settings.MONGO_DB.instances.count_documents(
+            {'_xform_id_string': self.xform.id_string}
+        )
+
+    def test_submissions_are_queued(self):
+        self.assertEqual(self._count_mongo_documents(), 0)
+        self.assertEqual(MongoSyncOutbox.objects.count(), 4)
+        self.assertFalse(
+            Instance.objects.filter(is_synced_with_mongo=True).exists()
+        )
+
+    def test_sync_mongo_outbox(self):
+        self.assertEqual(ParsedInstance.sync_mongo_outbox(), 4)
+        self.assertEqual(self._count_mongo_documents(), 4)
+        self.assertFalse(MongoSyncOutbox.objects.exists())
+        self.assertEqual(
+            Instance.objects.filter(is_synced_with_mongo=True).count(), 4
+        )
+
+        # Syncing the same submissions again does not duplicate them
+        for parsed_instance in ParsedInstance.objects.all():
+            parsed_instance.queue_mongo_sync()
+        self.assertEqual(ParsedInstance.sync_mongo_outbox(), 4)
+        self.assertEqual(self._count_mongo_documents(), 4)
+
+    def test_failed_writes_are_retried(self):
+        with patch(
+            'onadata.apps.viewer.models.parsed_instance.xform_instances'
+            '.bulk_write',
+            side_effect=PyMongoError('MongoDB is down'),
+        ):
+            self.assertEqual(ParsedInstance.sync_mongo_outbox(), 0)
+
+        self.assertEqual(self._count_mongo_documents(), 0)
+        self.assertEqual(MongoSyncOutbox.objects.count(), 4)
+        for entry in MongoSyncOutbox.objects.all():
+            self.assertEqual(entry.attempts, 1)
+            self.assertEqual(entry.last_error, 'MongoDB is down')
+            self.assertGreater(entry.next_attempt, timezone.now())
+
+        # Nothing is retried before the delay has elapsed
+        self.assertEqual(ParsedInstance.sync_mongo_outbox(), 0)
+        MongoSyncOutbox.objects.update(next_attempt=timezone.now())
+        self.assertEqual(ParsedInstance.sync_mongo_outbox(), 4)
+        self.assertEqual(self._count_mongo_documents(), 4)
+
+    @override_settings(MONGO_SYNC_OUTBOX_BATCH_SIZE=3)
+    def test_sync_mongo_outbox_task(self):
+        # Another worker holds the lock
+        lock = cache.lock('mongo_sync_outbox_lock', timeout=60)
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            sync_mongo_outbox()
+        finally:
+            lock.release()
+        self.assertEqual(MongoSyncOutbox.objects.count(), 4)
+
+        # Batch after batch, until the outbox is empty
+        sync_mongo_outbox()
+        self.assertFalse(MongoSyncOutbox.objects.exists())
+        self.assertEqual(self._count_mongo_documents(), 4)
@@ -339,6 +339,34 @@ class TestPandasMongoBridge(TestBase):
                                                              select_multiples)
         self.assertEqual(expected_result, result)
 
+    def test_split_binary_select_multiples_within_repeats(self):
+        record = {
+            'browser_use': [
+                {
+                    'browser_use/year': '2010',
+                    'browser_use/browsers': 'firefox safari'
+                }
+            ]
+        }
+        expected_result = {
+            'browser_use': [
+                {
+                    'browser_use/year': '2010',
+                    'browser_use/browsers/firefox': 1,
+                    'browser_use/browsers/safari': 1,
+                    'browser_use/browsers/ie': 0,
+                }
+            ]
+        }
+        select_multiples = {
+            'browser_use/browsers': [
+                'browser_use/browsers/firefox',
+                'browser_use/browsers/safari',
+                'browser_use/browsers/ie']}
+        result = CSVDataFrameBuilder._split_select_multiples(
+            record, select_multiples, binary_select_multiples=True)
+        self.assertEqual(expected_result, result)
+
     def test_split_gps_fields(self):
         record = {
             'gps': '5 6 7 8'
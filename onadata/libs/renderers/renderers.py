@@ -28,6 +28,18 @@ class CSVRenderer(BaseRenderer):
     format = 'csv'
     charset = 'utf-8'
 
+
+class ParquetRenderer(XLSRenderer):
+    # ZIP archive of one Parquet file per section
+    media_type = 'application/zip'
+    format = 'parquet'
+
+
+class JSONLRenderer(XLSRenderer):
+    # one JSON object per row, of any section
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+
 # TODO add KML, ZIP(attachments) support
 
 
@@ -1,9 +1,13 @@
 # coding: utf-8
+import binascii
 import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 
+from bson import json_util
 from django.utils.translation import gettext as t
 from rest_framework import serializers
 from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 
 from onadata.apps.logger.models.xform import XForm
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
@@ -21,18 +25,232 @@ class DataSerializer(serializers.HyperlinkedModelSerializer):
         lookup_field = 'pk'
 
 
+def decode_cursor(cursor: str) -> dict:
+    """
+    Return the position of the last record of the previous page from a cursor
+    returned by `encode_cursor()`, as a dict with its `_id`, and with the
+    `sort` of the records and the `value` of its sort key if they are not
+    sorted by `_id`
+    """
+    try:
+        position = json_util.loads(urlsafe_b64decode(cursor.encode()))
+        if not isinstance(position['_id'], int):
+            raise ValueError
+        sort = position.get('sort')
+        if sort is not None and (
+            not isinstance(sort, dict) or len(sort) != 1
+            or list(sort.values())[0] not in (1, -1)
+        ):
+            raise ValueError
+    except (AttributeError, binascii.Error, KeyError, TypeError, ValueError):
+        raise ParseError(t("Invalid cursor: %(cursor)s" % {'cursor': cursor}))
+    return {
+        '_id': position['_id'],
+        'sort': position.get('sort'),
+        'value': position.get('value'),
+    }
+
+
+def encode_cursor(last_id: int, sort: dict = None, last_value=None) -> str:
+    """
+    Return an opaque cursor from the `_id` of the last record of a page, and
+    the `sort` of the records and the value of its sort key if they are not
+    sorted by `_id`, which can be passed back with the `cursor` query
+    parameter to get the next page
+    """
+    position = {'_id': last_id}
+    if sort:
+        position.update({'sort': sort, 'value': last_value})
+    return urlsafe_b64encode(json_util.dumps(position).encode()).decode()
+
+
 class DataListSerializer(serializers.Serializer):
 
     class Meta:
         fields = '__all__'
 
-    def to_representation(self, obj):
+    @classmethod
+    def get_next_cursor(cls, request, records):
+        """
+        Return the cursor of the page after `records`, or `None` if `records`
+        is the last page or its sort key is not among the returned `fields`
+        """
+        query_params = request.query_params
+        if query_params.get('count'):
+            return None
+
+        limit = min(
+            int(query_params.get('limit') or ParsedInstance.DEFAULT_LIMIT),
+            ParsedInstance.DEFAULT_LIMIT,
+        )
+        if not records or len(records) < limit:
+            return None
+
+        sort = cls.get_sort(query_params)
+        if sort and not cls._has_sort_key(query_params, sort):
+            return None
+
+        return cls._get_cursor_after(records[-1], sort)
+
+    def get_streaming_next_cursor(self, obj):
+        """
+        Return the cursor of the page after the records of `obj` which are
+        streamed by `stream_representation()`, or `None` if it is the last
+        page. Unlike `get_next_cursor()`, the records are not needed: the
+        headers are sent before them.
+        """
         request = self.context.get('request')
+        query_params = request.query_params
+        if query_params.get('count'):
+            return None
+
+        sort = self.get_sort(query_params)
+        query_kwargs = self._get_query_kwargs(obj)
+        limit = min(
+            query_kwargs.get('limit') or ParsedInstance.DEFAULT_LIMIT,
+            ParsedInstance.DEFAULT_LIMIT,
+        )
+        # Only the `_id` and the sort key of the last record of the page are
+        # fetched
+        fields = ['_id']
+        if sort and list(sort)[0] != '_id':
+            fields.append(list(sort)[0])
+        query_kwargs.update({
+            'fields': json.dumps(fields),
+            'start': query_kwargs.get('start', 0) + limit - 1,
+            'limit': 1,
+        })
+        records = list(ParsedInstance.query_mongo_minimal(**query_kwargs))
+        if not records:
+            return None
+
+        return self._get_cursor_after(
+            MongoHelper.to_readable_dict(records[0]), sort
+        )
+
+    @staticmethod
+    def get_sort(query_params):
+        """
+        Return the sort of the records as a `{key: direction}` dict, from the
+        `sort` query parameter or else from the `cursor`, or `None` if they
+        are sorted by ascending `_id`
+        """
+        sort = query_params.get('sort')
+        if sort:
+            try:
+                sort = json.loads(sort)
+            except ValueError:
+                raise ParseError(t("Invalid sort: %(sort)s" % {'sort': sort}))
+        elif query_params.get('cursor'):
+            sort = decode_cursor(query_params['cursor'])['sort']
+
+        # Like `ParsedInstance`, anything but a single key sorts by `_id`
+        if not isinstance(sort, dict) or len(sort) != 1:
+            return None
+        sort_key, sort_dir = list(sort.items())[0]
+        try:
+            sort_dir = 1 if int(sort_dir) > 0 else -1
+        except (TypeError, ValueError):
+            raise ParseError(t("Invalid sort: %(sort)s" % {'sort': sort}))
+        if sort_key == '_id' and sort_dir == 1:
+            return None
+        return {sort_key: sort_dir}
+
+    @staticmethod
+    def _get_cursor_after(record, sort):
+        last_id = record.get('_id')
+        if not isinstance(last_id, int):
+            return None
+        if not sort:
+            return encode_cursor(last_id)
+
+        sort_key = list(sort)[0]
+        if sort_key == '_id':
+            return encode_cursor(last_id, sort, last_id)
+        if sort_key in record:
+            return encode_cursor(last_id, sort, record[sort_key])
+
+        # e.g. `_validation_status.uid`, which is a nested key
+        value = record
+        for part in sort_key.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        return encode_cursor(last_id, sort, value)
+
+    @staticmethod
+    def _has_sort_key(query_params, sort):
+        fields = query_params.get('fields')
+        if not fields:
+            return True
+        try:
+            fields = json.loads(fields)
+        except ValueError:
+            return False
+        if not isinstance(fields, list) or not fields:
+            return True
+
+        sort_key = list(sort)[0]
+        return any(
+            sort_key == field or sort_key.startswith(f'{field}.')
+            for field in ['_id'] + fields
+        )
 
+    def stream_representation(self, obj):
+        """
+        Return an iterator over the records of `obj` as a JSON array, which
+        are rendered as they are read from MongoDB, one batch of
+        `ParsedInstance.DEFAULT_BATCHSIZE` records at a time. Unlike
+        `to_representation()`, the records are never all held in memory.
+        """
+        # Invalid parameters are reported before anything is sent
+        return self._iter_json(self._query_mongo(obj))
+
+    @staticmethod
+    def _iter_json(cursor):
+        renderer = JSONRenderer()
+        chunk = [b'[']
+        count = 0
+        for record in cursor:
+            if count:
+                chunk.append(b',')
+            chunk.append(renderer.render(MongoHelper.to_readable_dict(record)))
+            count += 1
+            if count % ParsedInstance.DEFAULT_BATCHSIZE == 0:
+                yield b''.join(chunk)
+                chunk = []
+        chunk.append(b']')
+        yield b''.join(chunk)
+
+    def to_representation(self, obj):
         if not isinstance(obj, XForm):
             return super().to_representation(obj)
 
-        query_params = (request and request.query_params) or {}
+        if self._get_query_params().get('count', False):
+            return {
+                'count': ParsedInstance.count_records(
+                    obj, json.dumps(self._get_user_query())
+                )
+            }
+
+        cursor = self._query_mongo(obj)
+        return [MongoHelper.to_readable_dict(record) for record in cursor]
+
+    def _get_query_params(self):
+        request = self.context.get('request')
+        return (request and request.query_params) or {}
+
+    def _get_user_query(self):
+        query_params = self._get_query_params()
+        try:
+            return json.loads(query_params.get('query', '{}'))
+        except ValueError:
+            raise ParseError(t("Invalid query: %(query)s"
+                             % {'query': query_params.get('query')}))
+
+    def _query_mongo(self, obj):
+        return ParsedInstance.query_mongo_minimal(**self._get_query_kwargs(obj))
+
+    def _get_query_kwargs(self, obj):
+        query_params = self._get_query_params()
         query = {
             ParsedInstance.USERFORM_ID:
             '%s_%s' % (obj.user.username, obj.id_string)
@@ -40,12 +258,9 @@ class DataListSerializer(serializers.Serializer):
         limit = query_params.get('limit', False)
         start = query_params.get('start', False)
         count = query_params.get('count', False)
+        cursor = query_params.get('cursor', False)
 
-        try:
-            query.update(json.loads(query_params.get('query', '{}')))
-        except ValueError:
-            raise ParseError(t("Invalid query: %(query)s"
-                             % {'query': query_params.get('query')}))
+        query.update(self._get_user_query())
 
         query_kwargs = {
             'query': json.dumps(query),
@@ -64,13 +279,26 @@ class DataListSerializer(serializers.Serializer):
             if start:
                 query_kwargs['start'] = int(start)
 
-        cursor = ParsedInstance.query_mongo_minimal(**query_kwargs)
+            if cursor:
+                if start:
+                    raise ParseError(t(
+                        "`cursor` cannot be used with `start`"
+                    ))
+                position = decode_cursor(cursor)
+                sort = self.get_sort(query_params)
+                # The position of a record only makes sense in the order it
+                # was read in
+                if position['sort'] != sort:
+                    raise ParseError(t(
+                        "`cursor` cannot be used with another `sort`"
+                    ))
+                query_kwargs.update({
+                    'sort': json.dumps(sort) if sort else None,
+                    'last_id': position['_id'],
+                    'last_value': position['value'],
+                })
 
-        # if we want the count, we only need the first index of the list.
-        if count:
-            return cursor[0]
-        else:
-            return [MongoHelper.to_readable_dict(record) for record in cursor]
+        return query_kwargs
 
 
 class DataInstanceSerializer(serializers.Serializer):
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+Cache of the numbers of records of forms which match MongoDB queries, which
+dashboards poll with `/api/v1/data/<pk>?count=1`.
+
+Counts are stored in the default (Redis) cache, keyed by form, by a hash of
+the normalized query and by the time of the last submission of the form.
+The key holds a generation of the form as well, which is bumped every time
+its records are written to or deleted from MongoDB: edits, validation
+statuses and deletions, which leave the time of the last submission
+untouched, make its cached counts unreachable too.
+
+Entries expire after `settings.DATA_COUNT_CACHE_TIMEOUT` seconds anyway.
+"""
+import hashlib
+from typing import Callable, Iterable
+
+from bson import json_util
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = 'data_counts'
+
+
+def get_count(
+    xform: 'onadata.apps.logger.models.XForm',
+    query: dict,
+    counter: Callable[[], int],
+) -> int:
+    """
+    Return the number of records of `xform` matching `query`, calling
+    `counter()` to count them on a cache miss
+    """
+    if settings.DATA_COUNT_CACHE_TIMEOUT <= 0:
+        return counter()
+
+    # Read before counting: records written in the meantime bump the
+    # generation, and the count is then stored under an unreachable key
+    generation = cache.get(
+        _get_generation_key(f'{xform.user.username}_{xform.id_string}'), 0
+    )
+    query_hash = hashlib.sha256(
+        json_util.dumps(query, sort_keys=True).encode()
+    ).hexdigest()
+    last_submission_time = (
+        xform.last_submission_time.isoformat()
+        if xform.last_submission_time
+        else ''
+    )
+    # `date_created` tells apart forms which are deleted and published again
+    key = (
+        f'{KEY_PREFIX}:{xform.pk}:{xform.date_created.timestamp()}:'
+        f'{generation}:{last_submission_time}:{query_hash}'
+    )
+
+    count = cache.get(key)
+    if count is None:
+        count = counter()
+        cache.set(key, count, settings.DATA_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_counts(userform_ids: Iterable[str]):
+    """
+    Make the cached counts of the forms whose records are identified by
+    `userform_ids`, i.e. `<username>_<id_string>`, unreachable
+    """
+    if settings.DATA_COUNT_CACHE_TIMEOUT <= 0:
+        return
+
+    for userform_id in set(userform_ids):
+        if not userform_id:
+            continue
+        key = _get_generation_key(userform_id)
+        # `incr()` fails on missing keys, `add()` leaves existing ones alone
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def _get_generation_key(userform_id):
+    return f'{KEY_PREFIX}:generation:{userform_id}'
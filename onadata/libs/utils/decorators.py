@@ -1,7 +1,9 @@
 # coding: utf-8
 from functools import wraps
 
+from onadata.apps.api.mongo_helper import MongoHelper
 from onadata.apps.logger.models import XForm
+from onadata.libs.utils.survey_cache import survey_cache
 
 
 def check_obj(f):
@@ -13,37 +15,82 @@ def check_obj(f):
     return with_check_obj
 
 
+class FieldNamesDecoder:
+    """
+    Rename the keys of MongoDB records which are encoded versions of form
+    field names, e.g. `Q1Lg==1` to `Q1.1`, in the records themselves and in
+    their repeat groups.
+
+    It is compiled once per version of a form, from the output of
+    `DataDictionary.get_mongo_field_names_dict()`, and only keeps the keys
+    which actually need renaming: records of forms without any are returned
+    untouched.
+    """
+
+    def __init__(self, mongo_field_names: dict, repeat_xpaths):
+        field_names = set(mongo_field_names.values())
+        self.translations = {
+            mongo_field_name: field_name
+            for mongo_field_name, field_name in mongo_field_names.items()
+            if mongo_field_name not in field_names
+        }
+        # Repeat groups may be stored under encoded names too
+        self.repeat_keys = frozenset(repeat_xpaths) | frozenset(
+            MongoHelper.encode(xpath) for xpath in repeat_xpaths
+        )
+
+    def decode(self, record):
+        if not self.translations or not isinstance(record, dict):
+            return record
+
+        translations = self.translations
+        pending = [record]
+        while pending:
+            current = pending.pop()
+            for key in self.repeat_keys.intersection(current):
+                items = current[key]
+                if isinstance(items, list):
+                    pending.extend(
+                        item for item in items if isinstance(item, dict)
+                    )
+            for key in translations.keys() & current.keys():
+                current[translations[key]] = current.pop(key)
+
+        return record
+
+
+def get_field_names_decoder(username, id_string):
+    """
+    Return the `FieldNamesDecoder` of a form, built on the first call for each
+    version of the form
+    """
+    # Only what identifies the version of the form is needed on a cache hit
+    xform = XForm.objects.only('pk', 'date_modified').get(
+        id_string=id_string, user__username=username
+    )
+
+    def _build_field_names_decoder():
+        data_dictionary = xform.data_dictionary()
+        return FieldNamesDecoder(
+            data_dictionary.get_mongo_field_names_dict(),
+            data_dictionary.get_repeat_xpaths(),
+        )
+
+    return survey_cache.get(
+        xform, 'field_names_decoder', _build_field_names_decoder
+    )
+
+
 def apply_form_field_names(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        def _get_decoded_record(record):
-            if isinstance(record, dict):
-                # Avoid RuntimeError: dictionary keys changed during iteration
-                record_iter = dict(record)
-                for field in record_iter:
-                    if isinstance(record[field], list):
-                        tmp_items = []
-                        items = record[field]
-                        for item in items:
-                            tmp_items.append(_get_decoded_record(item))
-                        record[field] = tmp_items
-                    if field not in field_names.values() and \
-                            field in field_names.keys():
-                        record[field_names[field]] = record.pop(field)
-            return record
-
         cursor = func(*args, **kwargs)
         # Compare by class name instead of type because tests use MockMongo
         if cursor.__class__.__name__ == 'Cursor' and 'id_string' in kwargs and \
                 'username' in kwargs:
-            username = kwargs.get('username')
-            id_string = kwargs.get('id_string')
-            dd = XForm.objects.get(
-                id_string=id_string, user__username=username)
-            records = []
-            field_names = dd.data_dictionary().get_mongo_field_names_dict()
-            for record in cursor:
-                records.append(_get_decoded_record(record))
-            return records
+            decoder = get_field_names_decoder(
+                kwargs.get('username'), kwargs.get('id_string')
+            )
+            return [decoder.decode(record) for record in cursor]
         return cursor
     return wrapper
@@ -1,8 +1,14 @@
 # coding: utf-8
+import abc
+import csv
 import json
 import os
 import re
+import shutil
+import zipfile
 from datetime import datetime, date, time, timedelta
+from itertools import islice
+from tempfile import TemporaryDirectory
 
 from bson import json_util
 from django.conf import settings
@@ -11,8 +17,11 @@ from django.core.files.storage import FileSystemStorage
 from django.core.files.temp import NamedTemporaryFile
 from django.core.files.storage import default_storage
 from django.contrib.auth.models import User
-from django.shortcuts import render
+from django.contrib.gis.db.models import PointField
+from django.db.models import FloatField, Func, Value
+from django.template.loader import render_to_string
 from django.utils.text import slugify
+from openpyxl import load_workbook
 from openpyxl.utils.datetime import to_excel, time_to_days, timedelta_to_days
 from openpyxl.workbook import Workbook
 from pyxform.constants import SELECT_ALL_THAT_APPLY
@@ -22,6 +31,7 @@ from pyxform.section import Section, RepeatingSection
 from onadata.apps.logger.models import Attachment, Instance, XForm
 from onadata.apps.viewer.models.export import Export
 from onadata.apps.api.mongo_helper import MongoHelper
+from onadata.libs.exceptions import NoRecordsFoundError
 from onadata.libs.utils.viewer_tools import create_attachments_zipfile
 from onadata.libs.utils.common_tags import (
     ID,
@@ -43,6 +53,13 @@ from onadata.libs.utils.common_tags import (
 # this is Mongo Collection where we will store the parsed submissions
 xform_instances = settings.MONGO_DB.instances
 
+# export types which can be streamed by `stream_export()`, and number of rows
+# per chunk
+STREAMING_EXPORT_TYPES = [Export.CSV_EXPORT, Export.JSONL_EXPORT]
+STREAMING_EXPORT_BATCH_SIZE = 1000
+# number of points of KML exports rendered at once
+KML_EXPORT_BATCH_SIZE = 1000
+
 QUESTION_TYPES_TO_EXCLUDE = [
     'note',
 ]
@@ -74,6 +91,56 @@ def question_types_to_exclude(_type):
     return _type in QUESTION_TYPES_TO_EXCLUDE
 
 
+def get_select_multiple_splitter(xpath, choices,
+                                 binary_select_multiples=False,
+                                 null_if_blank=False):
+    """
+    Return a function which maps a value of the select multiple `xpath` to a
+    dict of a column per choice: `True` for the selected `choices` and
+    `False` for the others, or 1 and 0 with `binary_select_multiples`.
+
+    With `null_if_blank`, blank values map to `None` columns instead, unless
+    `binary_select_multiples`.
+
+    Everything which does not depend on the value is computed once, so that
+    a selection is a dict lookup instead of a scan of `choices`.
+    """
+    yes, no = (1, 0) if binary_select_multiples else (True, False)
+    prefix_length = len(xpath) + 1
+    choice_columns = {choice[prefix_length:]: choice for choice in choices}
+    unselected = dict.fromkeys(choices, no)
+    blank = unselected
+    if null_if_blank and not binary_select_multiples:
+        blank = dict.fromkeys(choices)
+
+    def split(value):
+        selections = value.split() if isinstance(value, str) else None
+        if not selections:
+            return blank.copy()
+        columns = unselected.copy()
+        for selection in selections:
+            column = choice_columns.get(selection)
+            if column is not None:
+                columns[column] = yes
+        return columns
+
+    return split
+
+
+def get_select_multiple_splitters(select_multiples,
+                                  binary_select_multiples=False,
+                                  null_if_blank=False):
+    """
+    Return `get_select_multiple_splitter()` for each xpath of
+    `select_multiples`, `{xpath: [choice xpaths]}`
+    """
+    return {
+        xpath: get_select_multiple_splitter(
+            xpath, choices, binary_select_multiples, null_if_blank)
+        for xpath, choices in select_multiples.items()
+    }
+
+
 class DictOrganizer:
 
     def set_dict_iterator(self, dict_iterator):
@@ -327,6 +394,7 @@ class ExportBuilder:
 
         self.survey = survey
         self.select_multiples = {}
+        self._select_multiple_splitters = {}
         self.gps_fields = {}
         self.encoded_fields = {}
         main_section = {'name': survey.name, 'elements': []}
@@ -344,26 +412,27 @@ class ExportBuilder:
     @classmethod
     def split_select_multiples(cls, row, select_multiples):
         # for each select_multiple, get the associated data and split it
-        for xpath, choices in select_multiples.items():
-            # get the data matching this xpath
-            data = row.get(xpath)
-            selections = []
-            if data:
-                selections = [
-                    '{0}/{1}'.format(
-                        xpath, selection) for selection in data.split()]
-            if not cls.BINARY_SELECT_MULTIPLES:
-                row.update(dict(
-                    [(choice, choice in selections if selections else None)
-                     for choice in choices]))
-            else:
-                YES = 1
-                NO = 0
-                row.update(dict(
-                    [(choice, YES if choice in selections else NO)
-                     for choice in choices]))
+        splitters = get_select_multiple_splitters(
+            select_multiples, cls.BINARY_SELECT_MULTIPLES, null_if_blank=True)
+        for xpath, split in splitters.items():
+            row.update(split(row.get(xpath)))
         return row
 
+    def _get_select_multiple_splitters(self, section_name):
+        """
+        Return the splitters of the select multiples of `section_name`, which
+        are only built once per export
+        """
+        try:
+            return self._select_multiple_splitters[section_name]
+        except KeyError:
+            splitters = get_select_multiple_splitters(
+                self.select_multiples[section_name],
+                self.BINARY_SELECT_MULTIPLES,
+                null_if_blank=True)
+            self._select_multiple_splitters[section_name] = splitters
+            return splitters
+
     @classmethod
     def split_gps_components(cls, row, gps_fields):
         # for each gps_field, get associated data and split it
@@ -415,8 +484,9 @@ class ExportBuilder:
 
         if self.SPLIT_SELECT_MULTIPLES and\
                 section_name in self.select_multiples:
-            row = ExportBuilder.split_select_multiples(
-                row, self.select_multiples[section_name])
+            for xpath, split in self._get_select_multiple_splitters(
+                    section_name).items():
+                row.update(split(row.get(xpath)))
 
         if section_name in self.gps_fields:
             row = ExportBuilder.split_gps_components(
@@ -456,35 +526,13 @@ class ExportBuilder:
             i += 1
         return generated_name
 
-    def to_xls_export(self, path, data, *args):
-        def write_row(data, work_sheet, fields, work_sheet_titles):
-            # update parent_table with the generated sheet's title
-            data[PARENT_TABLE_NAME] = work_sheet_titles.get(
-                data.get(PARENT_TABLE_NAME))
-            work_sheet.append([data.get(f) for f in fields])
-
-        wb = Workbook(write_only=True)
-        work_sheets = {}
-        # map of section_names to generated_names
-        work_sheet_titles = {}
-        for section in self.sections:
-            section_name = section['name']
-            work_sheet_title = ExportBuilder.get_valid_sheet_name(
-                "_".join(section_name.split("/")), list(work_sheet_titles.values()))
-            work_sheet_titles[section_name] = work_sheet_title
-            work_sheets[section_name] = wb.create_sheet(
-                title=work_sheet_title)
-
-        # write the headers
-        for section in self.sections:
-            section_name = section['name']
-            headers = [
-                element['title'] for element in
-                section['elements']] + self.EXTRA_FIELDS
-            # get the worksheet
-            ws = work_sheets[section_name]
-            ws.append(headers)
-
+    def _iter_section_rows(self, data):
+        """
+        Yield `(section, row)` for the rows of every section of each record
+        in `data`. `_index` numbers the rows of each section, and repeat rows
+        refer to the `_index` of their parent by `_parent_index` and
+        `_parent_table_name`.
+        """
         index = 1
         indices = {}
         survey_name = self.survey.name
@@ -500,28 +548,57 @@ class ExportBuilder:
             output[survey_name][INDEX] = index
             output[survey_name][PARENT_INDEX] = -1
             for section in self.sections:
-                # get data for this section and write to xls
-                section_name = section['name']
-                fields = [
-                    element['xpath'] for element in
-                    section['elements']] + self.EXTRA_FIELDS
-
-                ws = work_sheets[section_name]
                 # section might not exist within the output, e.g. data was
                 # not provided for said repeat - write test to check this
-                row = output.get(section_name, None)
+                row = output.get(section['name'], None)
                 if type(row) == dict:
-                    write_row(
-                        self.pre_process_row(row, section),
-                        ws, fields, work_sheet_titles)
+                    yield section, self.pre_process_row(row, section)
                 elif type(row) == list:
                     for child_row in row:
-                        write_row(
-                            self.pre_process_row(child_row, section),
-                            ws, fields, work_sheet_titles)
+                        yield section, self.pre_process_row(
+                            child_row, section)
             index += 1
 
-        wb.save(filename=path)
+    def iter_export_rows(self, table_names, data):
+        """
+        Yield `(section_name, values)` for every row of every section of the
+        records in `data`, where `table_names` maps section names to the
+        names of the generated tables
+        """
+        fields = {
+            section['name']: [
+                element['xpath'] for element in
+                section['elements']] + self.EXTRA_FIELDS
+            for section in self.sections
+        }
+        for section, row in self._iter_section_rows(data):
+            section_name = section['name']
+            # update parent_table with the generated table's name
+            row[PARENT_TABLE_NAME] = table_names.get(
+                row.get(PARENT_TABLE_NAME))
+            yield section_name, [row.get(f) for f in fields[section_name]]
+
+    def export_to(self, sink, data):
+        """
+        Write the rows of every section of the records in `data` to `sink`,
+        an `ExportSink`. Rows are only built once, whatever the format.
+        """
+        sink.open()
+        try:
+            for section_name, values in self.iter_export_rows(
+                    sink.table_names, data):
+                sink.write_row(section_name, values)
+        finally:
+            sink.close()
+
+    def to_xls_export(self, path, data, *args):
+        self.export_to(XLSXExportSink(self, path), data)
+
+    def to_parquet_export(self, path, data, *args):
+        self.export_to(ParquetExportSink(self, path), data)
+
+    def to_jsonl_export(self, path, data, *args):
+        self.export_to(JSONLExportSink(self, path), data)
 
     def to_flat_csv_export(self, path, data, username, id_string, filter_query):
         # TODO resolve circular import
@@ -538,6 +615,241 @@ class ExportBuilder:
         csv_builder.export_to(path)
 
 
+class ExportSink(abc.ABC):
+    """
+    Destination of `ExportBuilder.export_to()`, which writes the rows of each
+    section to a table of their own, named by `table_names`. Rows are lists
+    of values, in the order of the `headers` of their section.
+
+    Subclasses implement `open()`, `write_row()` and `close()`.
+    """
+
+    def __init__(self, export_builder, path):
+        self.export_builder = export_builder
+        self.path = path
+        # map of section_names to generated_names
+        self.table_names = {}
+        self.headers = {}
+        for section in export_builder.sections:
+            section_name = section['name']
+            self.table_names[section_name] = self.get_table_name(
+                "_".join(section_name.split("/")),
+                list(self.table_names.values()))
+            self.headers[section_name] = [
+                element['title'] for element in
+                section['elements']] + export_builder.EXTRA_FIELDS
+
+    @classmethod
+    def get_table_name(cls, desired_name, existing_names):
+        table_name = desired_name
+        i = 1
+        while table_name in existing_names:
+            table_name = "{0}{1}".format(desired_name, i)
+            i += 1
+        return table_name
+
+    @abc.abstractmethod
+    def open(self):
+        pass
+
+    @abc.abstractmethod
+    def write_row(self, section_name, values):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+
+class XLSXExportSink(ExportSink):
+    """
+    One sheet per section
+    """
+
+    @classmethod
+    def get_table_name(cls, desired_name, existing_names):
+        return ExportBuilder.get_valid_sheet_name(desired_name, existing_names)
+
+    def open(self):
+        self.wb = Workbook(write_only=True)
+        self.work_sheets = {}
+        for section_name, table_name in self.table_names.items():
+            self.work_sheets[section_name] = self.wb.create_sheet(
+                title=table_name)
+            # write the headers
+            self.work_sheets[section_name].append(self.headers[section_name])
+
+    def write_row(self, section_name, values):
+        self.work_sheets[section_name].append(values)
+
+    def close(self):
+        self.wb.save(filename=self.path)
+
+
+class ParquetExportSink(ExportSink):
+    """
+    ZIP archive of Parquet files, one per section. `_parent_table_name` is
+    the name of the parent file, without extension.
+
+    Questions of the `TYPES_TO_CONVERT` types get typed columns, as well as
+    split select multiples. Values which cannot be converted are null.
+
+    pyarrow is only imported by Parquet exports, not by every process which
+    imports this module.
+    """
+    # number of rows of a section buffered before being written
+    BATCH_SIZE = 10000
+
+    @staticmethod
+    def get_types():
+        """
+        Return the Parquet types of the `TYPES_TO_CONVERT` questions and of
+        the extra fields. Other columns are strings.
+        """
+        import pyarrow as pa
+
+        types = {
+            'int': pa.int64(),
+            'decimal': pa.float64(),
+            'date': pa.date32(),
+        }
+        extra_field_types = {
+            ID: pa.int64(),
+            INDEX: pa.int64(),
+            PARENT_INDEX: pa.int64(),
+        }
+        return types, extra_field_types
+
+    def open(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        export_builder = self.export_builder
+        question_types, extra_field_types = self.get_types()
+        self.schemas = {}
+        for section in export_builder.sections:
+            section_name = section['name']
+            choices = set()
+            if export_builder.SPLIT_SELECT_MULTIPLES:
+                for xpaths in export_builder.select_multiples.get(
+                        section_name, {}).values():
+                    choices.update(xpaths)
+            choice_type = (
+                pa.int64() if export_builder.BINARY_SELECT_MULTIPLES
+                else pa.bool_())
+
+            types = []
+            for element in section['elements']:
+                if element['xpath'] in choices:
+                    types.append(choice_type)
+                else:
+                    types.append(
+                        question_types.get(element['type'], pa.string())
+                    )
+            types += [
+                extra_field_types.get(field, pa.string())
+                for field in export_builder.EXTRA_FIELDS
+            ]
+            self.schemas[section_name] = pa.schema(
+                list(zip(self.headers[section_name], types)))
+
+        self.temp_dir = TemporaryDirectory()
+        self.writers = {
+            section_name: pq.ParquetWriter(
+                os.path.join(self.temp_dir.name, table_name + '.parquet'),
+                self.schemas[section_name])
+            for section_name, table_name in self.table_names.items()
+        }
+        self.batches = {section_name: [] for section_name in self.table_names}
+
+    def write_row(self, section_name, values):
+        self.batches[section_name].append(values)
+        if len(self.batches[section_name]) >= self.BATCH_SIZE:
+            self._write_batch(section_name)
+
+    def _write_batch(self, section_name):
+        import pyarrow as pa
+
+        schema = self.schemas[section_name]
+        rows = self.batches[section_name]
+        self.writers[section_name].write_batch(pa.record_batch(
+            [
+                pa.array(
+                    [
+                        _to_parquet_value(row[i], schema.field(i).type)
+                        for row in rows
+                    ],
+                    type=schema.field(i).type)
+                for i in range(len(schema))
+            ],
+            schema=schema))
+        self.batches[section_name] = []
+
+    def close(self):
+        try:
+            for section_name, rows in self.batches.items():
+                if rows:
+                    self._write_batch(section_name)
+            for writer in self.writers.values():
+                writer.close()
+            with zipfile.ZipFile(
+                    self.path, 'w', zipfile.ZIP_STORED) as zip_file:
+                for table_name in self.table_names.values():
+                    filename = table_name + '.parquet'
+                    zip_file.write(
+                        os.path.join(self.temp_dir.name, filename), filename)
+        finally:
+            self.temp_dir.cleanup()
+
+
+class JSONLExportSink(ExportSink):
+    """
+    One JSON object per line and per row, whose `_table` is the name of the
+    section
+    """
+    TABLE = '_table'
+
+    def open(self):
+        self.file = open(self.path, 'w', encoding='utf-8')
+
+    def write_row(self, section_name, values):
+        self.file.write(self.format_row(section_name, values))
+
+    def format_row(self, section_name, values):
+        row = {self.TABLE: self.table_names[section_name]}
+        row.update(zip(self.headers[section_name], values))
+        return json.dumps(row, default=str) + '\n'
+
+    def close(self):
+        self.file.close()
+
+
+def _to_parquet_value(value, data_type):
+    """
+    Return `value` if it is of the Python type matching `data_type`, or
+    `None` otherwise. Anything is a string.
+    """
+    import pyarrow as pa
+
+    if value is None:
+        return None
+    if pa.types.is_string(data_type):
+        return value if isinstance(value, str) else str(value)
+    if pa.types.is_boolean(data_type):
+        return value if isinstance(value, bool) else None
+    if isinstance(value, bool):
+        return None
+    if pa.types.is_integer(data_type):
+        return value if isinstance(value, int) else None
+    if pa.types.is_floating(data_type):
+        return float(value) if isinstance(value, (int, float)) else None
+    if pa.types.is_date(data_type):
+        if isinstance(value, datetime):
+            return value.date()
+        return value if isinstance(value, date) else None
+    return value
+
+
 def dict_to_flat_export(d, parent_index=0):
     pass
 
@@ -553,27 +865,261 @@ def generate_export(export_type, extension, username, id_string,
     export_type_func_map = {
         Export.XLS_EXPORT: 'to_xls_export',
         Export.CSV_EXPORT: 'to_flat_csv_export',
+        Export.PARQUET_EXPORT: 'to_parquet_export',
+        Export.JSONL_EXPORT: 'to_jsonl_export',
     }
 
     xform = XForm.objects.get(
         user__username__iexact=username, id_string__exact=id_string)
 
-    # query mongo for the cursor
-    records = query_mongo(username, id_string, filter_query)
+    export_builder = _get_export_builder(
+        xform, group_delimiter, split_select_multiples,
+        binary_select_multiples)
+
+    prefix = slugify('{}_export__{}__{}'.format(export_type, username, id_string))
+    temp_file = NamedTemporaryFile(prefix=prefix, suffix=("." + extension))
+
+    last_submission_id = num_of_records = time_of_last_submission = None
+    records_query = filter_query
+    if is_incremental_export(export_type, filter_query, group_delimiter,
+                             split_select_multiples,
+                             binary_select_multiples):
+        # Edits made while the export is being generated must be detected by
+        # `get_previous_export()`
+        time_of_last_submission = xform.time_of_last_submission_update()
+        # Only export the submissions received so far, so that the next
+        # export knows where to resume from
+        last_submission_id = get_last_submission_id(username, id_string)
+        if last_submission_id is not None:
+            records_query = json_util.dumps(
+                {ID: {'$lte': last_submission_id}})
+            num_of_records = xform_instances.count_documents({
+                USERFORM_ID: '{0}_{1}'.format(username, id_string),
+                ID: {'$lte': last_submission_id},
+            })
+
+    previous_export = None
+    if last_submission_id is not None:
+        previous_export = get_previous_export(xform, export_type, export_id)
+
+    if not (
+        previous_export
+        and _append_to_previous_export(
+            previous_export, temp_file.name, last_submission_id)
+    ):
+        # query mongo for the cursor
+        records = query_mongo(username, id_string, records_query)
+
+        # get the export function by export type
+        func = getattr(export_builder, export_type_func_map[export_type])
+        func.__call__(
+            temp_file.name, records, username, id_string, records_query)
 
+    return _save_export(
+        xform, export_type, extension, temp_file, export_id, filter_query,
+        last_submission_id=last_submission_id,
+        num_of_records=num_of_records,
+        time_of_last_submission=time_of_last_submission)
+
+
+def stream_export(export_type, username, id_string, filter_query=None,
+                  group_delimiter='/', split_select_multiples=True,
+                  binary_select_multiples=False):
+    """
+    Return an iterator over the contents of a CSV or JSONL export, which is
+    generated while it is consumed, e.g. by a `StreamingHttpResponse`.
+    Unlike `generate_export()`, nothing is written to the storage.
+
+    Raise `NoRecordsFoundError` right away if no submissions match
+    `filter_query`. The columns of CSV exports are discovered right away as
+    well, which takes a pass over the repeat groups of the submissions if
+    the form has any.
+    """
+    if export_type not in STREAMING_EXPORT_TYPES:
+        raise Export.ExportTypeError
+
+    xform = XForm.objects.get(
+        user__username__iexact=username, id_string__exact=id_string)
+
+    if next(
+        query_mongo(username, id_string, filter_query, [ID]).limit(1), None
+    ) is None:
+        raise NoRecordsFoundError("No records found for your query")
+
+    if export_type == Export.CSV_EXPORT:
+        # TODO resolve circular import
+        from onadata.apps.viewer.pandas_mongo_bridge import (
+            CSVDataFrameBuilder
+        )
+
+        csv_builder = CSVDataFrameBuilder(
+            username, id_string, filter_query, group_delimiter,
+            split_select_multiples, binary_select_multiples)
+        return csv_builder.iter_csv(STREAMING_EXPORT_BATCH_SIZE)
+
+    export_builder = _get_export_builder(
+        xform, group_delimiter, split_select_multiples,
+        binary_select_multiples)
+    return _iter_jsonl_export(
+        export_builder, query_mongo(username, id_string, filter_query))
+
+
+def _iter_jsonl_export(export_builder, records):
+    sink = JSONLExportSink(export_builder, None)
+    lines = []
+    for section_name, values in export_builder.iter_export_rows(
+            sink.table_names, records):
+        lines.append(sink.format_row(section_name, values))
+        if len(lines) >= STREAMING_EXPORT_BATCH_SIZE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def is_incremental_export(export_type, filter_query, group_delimiter,
+                          split_select_multiples, binary_select_multiples):
+    """
+    Only the CSV exports of all the submissions, with the default options,
+    can be appended to by the next export, see `_append_to_previous_export()`
+    """
+    return (
+        settings.INCREMENTAL_EXPORTS_ENABLED
+        and export_type == Export.CSV_EXPORT
+        and filter_query is None
+        and group_delimiter == '/'
+        and split_select_multiples
+        and not binary_select_multiples
+    )
+
+
+def get_last_submission_id(username, id_string):
+    records = query_mongo(username, id_string, fields={ID: 1})
+    for record in records.sort(ID, -1).limit(1):
+        return record[ID]
+
+
+def get_previous_export(xform, export_type, export_id=None):
+    """
+    Return the latest export of `xform` which the submissions received since
+    can be appended to, or `None`.
+
+    A new export has to be generated from scratch if, since the previous one
+    - the form has been modified
+    - submissions it contains have been deleted, see
+      `nullify_exports_time_of_last_submission()`, or edited
+    - submissions older than its last one have shown up, e.g. because they
+      were synchronised with MongoDB late
+    """
+    previous_export = Export.objects.filter(
+        xform=xform,
+        export_type=export_type,
+        internal_status=Export.SUCCESSFUL,
+        filename__isnull=False,
+        last_submission_id__isnull=False,
+        time_of_last_submission__isnull=False,
+    ).exclude(pk=export_id).order_by('-created_on').first()
+    if previous_export is None:
+        return None
+
+    xform.refresh_from_db(fields=['date_modified'])
+    if xform.date_modified > previous_export.created_on:
+        return None
+
+    if xform.instances.filter(
+        pk__lte=previous_export.last_submission_id,
+        date_modified__gt=previous_export.time_of_last_submission,
+    ).exists():
+        return None
+
+    if xform_instances.count_documents({
+        USERFORM_ID: '{0}_{1}'.format(xform.user.username, xform.id_string),
+        ID: {'$lte': previous_export.last_submission_id},
+    }) != previous_export.num_of_records:
+        return None
+
+    return previous_export
+
+
+def _append_to_previous_export(previous_export, path, last_submission_id):
+    """
+    Write the file of `previous_export`, followed by the submissions received
+    since, up to `last_submission_id`, to `path`.
+
+    The previous CSV file is copied byte for byte, and only the new
+    submissions are read from MongoDB and converted, so the cost is a file
+    copy plus O(new submissions). Other export types cannot be appended to
+    without rewriting every row, e.g. XLSX workbooks, and are regenerated
+    instead.
+
+    Returns `False` if the export has to be generated from scratch, e.g.
+    because the submissions received since have more repeats than any
+    before, which would add columns to the CSV header.
+    """
+    if previous_export.export_type != Export.CSV_EXPORT:
+        return False
+
+    xform = previous_export.xform
+    username = xform.user.username
+    id_string = xform.id_string
+    new_records_query = json_util.dumps({
+        ID: {
+            '$gt': previous_export.last_submission_id,
+            '$lte': last_submission_id,
+        }
+    })
+
+    # TODO resolve circular import
+    from onadata.apps.viewer.pandas_mongo_bridge import (
+        CSVDataFrameBuilder,
+    )
+
+    csv_builder = CSVDataFrameBuilder(
+        username, id_string, new_records_query)
+    try:
+        csv_builder.discover_columns()
+    except NoRecordsFoundError:
+        pass
+    with default_storage.open(previous_export.filepath, 'rb') as f:
+        header_line = f.readline().decode('utf-8')
+    columns = next(csv.reader([header_line]))
+    if not set(csv_builder.get_columns()).issubset(columns):
+        return False
+
+    with open(path, 'wb') as csv_file:
+        with default_storage.open(previous_export.filepath, 'rb') as f:
+            shutil.copyfileobj(f, csv_file)
+    with open(path, 'a', newline='') as csv_file:
+        try:
+            csv_builder.write_rows(csv_file, columns)
+        except NoRecordsFoundError:
+            pass
+
+    return True
+
+
+def _get_export_builder(xform, group_delimiter, split_select_multiples,
+                        binary_select_multiples):
     export_builder = ExportBuilder()
     export_builder.GROUP_DELIMITER = group_delimiter
     export_builder.SPLIT_SELECT_MULTIPLES = split_select_multiples
     export_builder.BINARY_SELECT_MULTIPLES = binary_select_multiples
     export_builder.set_survey(xform.data_dictionary().survey)
+    return export_builder
 
-    prefix = slugify('{}_export__{}__{}'.format(export_type, username, id_string))
-    temp_file = NamedTemporaryFile(prefix=prefix, suffix=("." + extension))
 
-    # get the export function by export type
-    func = getattr(export_builder, export_type_func_map[export_type])
-    func.__call__(
-        temp_file.name, records, username, id_string, filter_query)
+def _save_export(xform, export_type, extension, temp_file, export_id=None,
+                 filter_query=None, last_submission_id=None,
+                 num_of_records=None, time_of_last_submission=None):
+    """
+    Save the content of `temp_file` to the storage, and point the export to
+    it.
+
+    `last_submission_id` and `num_of_records` are only given for exports
+    which the next export can be appended to, see `is_incremental_export()`.
+    """
+    username = xform.user.username
+    id_string = xform.id_string
 
     # generate filename
     basename = "%s_%s" % (
@@ -609,18 +1155,238 @@ def generate_export(export_type, extension, username, id_string,
     export.filedir = dir_name
     export.filename = basename
     export.internal_status = Export.SUCCESSFUL
+    export.last_submission_id = last_submission_id
+    export.num_of_records = num_of_records
+    if time_of_last_submission is not None:
+        export.time_of_last_submission = time_of_last_submission
     # do not persist exports that have a filter
     if filter_query is None:
         export.save()
     return export
 
 
-def query_mongo(username, id_string, query=None):
+def get_export_shards(username, id_string, filter_query=None):
+    """
+    Split the records matching `filter_query` into consecutive ranges of
+    `_id`, of at most `settings.EXPORT_SHARD_SIZE` records each, which can be
+    exported in parallel.
+
+    Returns a list of `{'first_id': …, 'last_id': …, 'count': …}` dicts.
+    """
+    shard_size = settings.EXPORT_SHARD_SIZE
+    shards = []
+    # Only `_id`s are fetched, from the `(_userform_id, _id)` index
+    for record in query_mongo(
+        username, id_string, filter_query, fields={ID: 1}
+    ).sort(ID, 1):
+        if not shards or shards[-1]['count'] == shard_size:
+            shards.append({'first_id': record[ID], 'count': 0})
+        shards[-1]['last_id'] = record[ID]
+        shards[-1]['count'] += 1
+    return shards
+
+
+def get_export_shard_query(filter_query, shard):
+    """
+    Return `filter_query`, as a JSON string, restricted to the records of
+    `shard`
+    """
+    shard_query = {ID: {'$gte': shard['first_id'], '$lte': shard['last_id']}}
+    if filter_query:
+        shard_query = {
+            '$and': [
+                json.loads(filter_query, object_hook=json_util.object_hook),
+                shard_query,
+            ]
+        }
+    return json_util.dumps(shard_query)
+
+
+def get_export_part_path(username, id_string, export_type, export_id, index,
+                         extension):
+    return os.path.join(
+        username,
+        'exports',
+        id_string,
+        export_type,
+        'parts',
+        str(export_id),
+        '%s.%s' % (index, extension))
+
+
+def discover_csv_export_columns(username, id_string, filter_query=None,
+                                group_delimiter='/',
+                                split_select_multiples=True,
+                                binary_select_multiples=False):
+    """
+    Return the `ordered_columns` of the CSV export of the records matching
+    `filter_query`, which `CSVDataFrameBuilder.merge_ordered_columns()`
+    combines across shards
+    """
+    # TODO resolve circular import
+    from onadata.apps.viewer.pandas_mongo_bridge import CSVDataFrameBuilder
+
+    csv_builder = CSVDataFrameBuilder(
+        username, id_string, filter_query, group_delimiter,
+        split_select_multiples, binary_select_multiples)
+    try:
+        return csv_builder.discover_columns()
+    except NoRecordsFoundError:
+        # Records of the shard have been deleted in the meantime
+        return csv_builder.ordered_columns
+
+
+def get_csv_export_columns(username, id_string, ordered_columns_list,
+                           group_delimiter='/', split_select_multiples=True,
+                           binary_select_multiples=False):
+    """
+    Return the header of a sharded CSV export, from the `ordered_columns`
+    returned by `discover_csv_export_columns()` for each shard, in order
+    """
+    # TODO resolve circular import
+    from onadata.apps.viewer.pandas_mongo_bridge import CSVDataFrameBuilder
+
+    csv_builder = CSVDataFrameBuilder(
+        username, id_string, None, group_delimiter, split_select_multiples,
+        binary_select_multiples)
+    csv_builder.ordered_columns = CSVDataFrameBuilder.merge_ordered_columns(
+        ordered_columns_list)
+    return csv_builder.get_columns()
+
+
+def generate_csv_export_part(username, id_string, part_path, columns,
+                             filter_query=None, group_delimiter='/',
+                             split_select_multiples=True,
+                             binary_select_multiples=False):
+    """
+    Write the rows, without header, of the records matching `filter_query`
+    to `part_path` in the storage
+    """
+    # TODO resolve circular import
+    from onadata.apps.viewer.pandas_mongo_bridge import CSVDataFrameBuilder
+
+    csv_builder = CSVDataFrameBuilder(
+        username, id_string, filter_query, group_delimiter,
+        split_select_multiples, binary_select_multiples)
+    temp_file = NamedTemporaryFile(suffix='.csv')
+    with open(temp_file.name, 'w', newline='') as csv_file:
+        try:
+            csv_builder.write_rows(csv_file, columns)
+        except NoRecordsFoundError:
+            # Records of the shard have been deleted in the meantime
+            pass
+    default_storage.save(part_path, File(temp_file, part_path))
+    temp_file.close()
+
+
+def generate_xls_export_part(username, id_string, part_path,
+                             filter_query=None, group_delimiter='/',
+                             split_select_multiples=True,
+                             binary_select_multiples=False):
+    """
+    Write the XLSX export of the records matching `filter_query` to
+    `part_path` in the storage
+    """
+    xform = XForm.objects.get(
+        user__username__iexact=username, id_string__exact=id_string)
+    export_builder = _get_export_builder(
+        xform, group_delimiter, split_select_multiples,
+        binary_select_multiples)
+    temp_file = NamedTemporaryFile(suffix='.xlsx')
+    records = query_mongo(username, id_string, filter_query).sort(ID, 1)
+    export_builder.to_xls_export(
+        temp_file.name, records)
+    temp_file.seek(0)
+    default_storage.save(part_path, File(temp_file, part_path))
+    temp_file.close()
+
+
+def merge_export_parts(export_type, extension, username, id_string,
+                       export_id, part_paths, columns=None,
+                       filter_query=None, last_submission_id=None,
+                       num_of_records=None):
+    """
+    Concatenate the parts of a sharded export, in order, into the export
+    file, then delete them.
+
+    CSV parts have no header: it is written from `columns` first. The rows
+    of each sheet of XLSX parts are appended to the same sheet of the export,
+    see `_append_xlsx_part()`.
+    """
+    xform = XForm.objects.get(
+        user__username__iexact=username, id_string__exact=id_string)
+    prefix = slugify('{}_export__{}__{}'.format(export_type, username, id_string))
+    temp_file = NamedTemporaryFile(prefix=prefix, suffix=("." + extension))
+
+    if export_type == Export.CSV_EXPORT:
+        with open(temp_file.name, 'w', newline='') as csv_file:
+            csv.writer(csv_file, lineterminator='\n').writerow(columns)
+        with open(temp_file.name, 'ab') as csv_file:
+            for part_path in part_paths:
+                with default_storage.open(part_path, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, csv_file)
+    else:
+        wb = Workbook(write_only=True)
+        work_sheets = {}
+        row_counts = {}
+        for part_path in part_paths:
+            with default_storage.open(part_path, 'rb') as part_file:
+                _append_xlsx_part(part_file, wb, work_sheets, row_counts)
+        wb.save(filename=temp_file.name)
+
+    export = _save_export(
+        xform, export_type, extension, temp_file, export_id, filter_query,
+        last_submission_id=last_submission_id, num_of_records=num_of_records)
+
+    for part_path in part_paths:
+        default_storage.delete(part_path)
+
+    return export
+
+
+def _append_xlsx_part(part_file, wb, work_sheets, row_counts):
+    """
+    Append the rows of each sheet of the XLSX `part_file` to the same sheet of
+    the write-only workbook `wb`.
+
+    `_index` starts from 1 in every sheet of every part: it is shifted by the
+    number of rows the sheet already has in `row_counts`, and `_parent_index`
+    by the number of rows of the sheet named by `_parent_table_name`.
+    """
+    part_wb = load_workbook(part_file, read_only=True)
+    offsets = dict(row_counts)
+    for part_ws in part_wb.worksheets:
+        title = part_ws.title
+        rows = part_ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            continue
+        if title not in work_sheets:
+            work_sheets[title] = wb.create_sheet(title=title)
+            work_sheets[title].append(header)
+            row_counts[title] = 0
+        ws = work_sheets[title]
+        index_col = header.index(INDEX)
+        parent_index_col = header.index(PARENT_INDEX)
+        parent_table_col = header.index(PARENT_TABLE_NAME)
+        for row in rows:
+            row = list(row)
+            row[index_col] += offsets.get(title, 0)
+            if row[parent_table_col] in offsets:
+                row[parent_index_col] += offsets[row[parent_table_col]]
+            ws.append(row)
+            row_counts[title] += 1
+    part_wb.close()
+
+
+def query_mongo(username, id_string, query=None, fields=None):
     query = json.loads(query, object_hook=json_util.object_hook)\
         if query else {}
     query = MongoHelper.to_safe_dict(query)
     query[USERFORM_ID] = '{0}_{1}'.format(username, id_string)
-    return xform_instances.find(query, max_time_ms=settings.MONGO_DB_MAX_TIME_MS)
+    return xform_instances.find(
+        query, fields, max_time_ms=settings.MONGO_DB_MAX_TIME_MS
+    )
 
 
 def should_create_new_export(xform, export_type):
@@ -709,11 +1475,6 @@ def generate_kml_export(
 ):
     user = User.objects.get(username=username)
     xform = XForm.objects.get(user__username=username, id_string=id_string)
-    response = render(
-        request=None,
-        template_name='survey.kml',
-        context={'data': kml_export_data(id_string, user)},
-    )
 
     basename = "%s_%s" % (id_string,
                           datetime.now().strftime("%Y_%m_%d_%H_%M_%S"))
@@ -725,15 +1486,13 @@ def generate_kml_export(
         export_type,
         filename)
 
-    temp_file = NamedTemporaryFile(suffix=extension)
-    temp_file.write(response.content)
-    temp_file.seek(0)
-    export_filename = default_storage.save(
-        file_path,
-        File(temp_file, file_path))
-    temp_file.close()
+    absolute_filename = _get_absolute_filename(file_path)
 
-    dir_name, basename = os.path.split(export_filename)
+    with default_storage.open(absolute_filename, 'wb') as destination_file:
+        for chunk in _iter_kml(id_string, user):
+            destination_file.write(chunk.encode('utf-8'))
+
+    dir_name, basename = os.path.split(absolute_filename)
 
     # get or create export object
     if export_id:
@@ -750,25 +1509,42 @@ def generate_kml_export(
 
 
 def kml_export_data(id_string, user):
-
-    instances = Instance.objects.filter(
+    """
+    Return an iterator over the `uuid`, `lat` and `lng` of the first point of
+    each submission to the form, by ascending primary key. Coordinates are
+    read by the database, not from the submissions themselves.
+    """
+    first_point = Func(
+        'geom', Value(1), function='ST_GeometryN', output_field=PointField()
+    )
+    return Instance.objects.filter(
         xform__user=user,
         xform__id_string=id_string,
         geom__isnull=False
-    ).order_by('id')
-    data_for_template = []
-
-    for instance in instances:
-        point = instance.point
-        if point:
-            data_for_template.append({
-                'name': id_string,
-                'id': instance.uuid,
-                'lat': point.y,
-                'lng': point.x,
-                })
-
-    return data_for_template
+    ).annotate(
+        lng=Func(first_point, function='ST_X', output_field=FloatField()),
+        lat=Func(first_point, function='ST_Y', output_field=FloatField()),
+    ).filter(
+        # empty geometry collections
+        lng__isnull=False
+    ).order_by('id').values('uuid', 'lat', 'lng').iterator(
+        chunk_size=KML_EXPORT_BATCH_SIZE
+    )
+
+
+def _iter_kml(id_string, user):
+    """
+    Yield the KML document of the submissions to the form, rendered one batch
+    of `KML_EXPORT_BATCH_SIZE` points at a time
+    """
+    yield render_to_string('survey_header.kml', {'name': id_string})
+    data = kml_export_data(id_string, user)
+    while True:
+        batch = list(islice(data, KML_EXPORT_BATCH_SIZE))
+        if not batch:
+            break
+        yield render_to_string('survey_placemarks.kml', {'data': batch})
+    yield render_to_string('survey_footer.kml')
 
 
 def _get_absolute_filename(filename: str) -> str:
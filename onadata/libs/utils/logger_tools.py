@@ -6,8 +6,9 @@ import os
 import re
 import sys
 import traceback
+from collections import Counter
 from datetime import date, datetime, timezone
-from xml.etree import ElementTree as ET
+from io import StringIO
 from xml.parsers.expat import ExpatError
 try:
     from zoneinfo import ZoneInfo
@@ -21,7 +22,7 @@ from django.core.exceptions import ValidationError, PermissionDenied
 from django.core.files.storage import default_storage
 from django.core.mail import mail_admins
 from django.db import IntegrityError, transaction
-from django.db.models import Q
+from django.db.models import F, Q, prefetch_related_objects
 from django.http import (
     HttpResponse,
     HttpResponseNotFound,
@@ -45,7 +46,12 @@ from onadata.apps.logger.exceptions import (
     FormInactiveError,
     TemporarilyUnavailableError,
 )
-from onadata.apps.logger.models import Attachment, Instance, XForm
+from onadata.apps.logger.models import (
+    Attachment,
+    Instance,
+    SurveyType,
+    XForm,
+)
 from onadata.apps.logger.models.attachment import (
     generate_attachment_filename,
     hash_attachment_contents,
@@ -53,6 +59,7 @@ from onadata.apps.logger.models.attachment import (
 from onadata.apps.logger.models.instance import (
     InstanceHistory,
     get_id_string_from_xml_str,
+    update_xform_counters_in_bulk,
     update_xform_daily_counter,
     update_xform_monthly_counter,
     update_xform_submission_count,
@@ -68,16 +75,18 @@ from onadata.apps.logger.xform_instance_parser import (
     InstanceInvalidUserError,
     InstanceMultipleNodeError,
     DuplicateInstance,
+    ParsedSubmission,
     clean_and_parse_xml,
     get_uuid_from_xml,
-    get_deprecated_uuid_from_xml,
-    get_submission_date_from_xml,
     get_xform_media_question_xpaths,
 )
 from onadata.apps.main.models import UserProfile
+from onadata.apps.restservice.utils import call_service
 from onadata.apps.viewer.models.data_dictionary import DataDictionary
+from onadata.apps.viewer.models.mongo_sync_outbox import MongoSyncOutbox
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
 from onadata.libs.utils import common_tags
+from onadata.libs.utils.count_cache import invalidate_counts
 from onadata.libs.utils.model_tools import queryset_iterator, set_uuid
 
 OPEN_ROSA_VERSION_HEADER = 'X-OpenRosa-Version'
@@ -153,11 +162,14 @@ def create_instance(
 
     xml = smart_str(xml_file.read())
     xml_hash = Instance.get_hash(xml)
-    xform = get_xform_from_submission(xml, username, uuid)
+    # Parse the XML only once; the same DOM is used all the way down to
+    # `Instance.save()`, `ParsedInstance` and the attachments
+    parsed_submission = ParsedSubmission(xml)
+    xform = get_xform_from_submission(parsed_submission, username, uuid)
     check_submission_permissions(request, xform)
 
     # get new and deprecated uuid's
-    new_uuid = get_uuid_from_xml(xml)
+    new_uuid = parsed_submission.uuid
 
     # Dorey's rule from 2012 (commit 890a67aa):
     #   Ignore submission as a duplicate IFF
@@ -171,19 +183,23 @@ def create_instance(
     # and still exactly matches an existing submission, it's certainly a
     # duplicate (https://docs.opendatakit.org/openrosa-metadata/#fields).
     if xform.has_start_time or new_uuid is not None:
-        # XML matches are identified by identical content hash OR, when a
-        # content hash is not present, by string comparison of the full
-        # content, which is slow! Use the management command
-        # `populate_xml_hashes_for_instances` to hash existing submissions
+        # XML matches are identified by identical content hash only, with a
+        # single lookup of the `(xform_id, xml_hash)` index. The XML contains
+        # the form `id_string`, which is unique per user, so looking for
+        # duplicates within the form is the same as within the user's forms.
+        # Submissions without a hash are populated by migration
+        # `0035_populate_instance_xml_hashes` (or by the management command
+        # `populate_xml_hashes_for_instances`)
         existing_instance = Instance.objects.filter(
-            Q(xml_hash=xml_hash) | Q(xml_hash=Instance.DEFAULT_XML_HASH, xml=xml),
-            xform__user=xform.user,
+            xform_id=xform.pk, xml_hash=xml_hash
         ).first()
     else:
         existing_instance = None
 
     if existing_instance:
         existing_instance.check_active(force=False)
+        # Hashes match, so the already parsed XML can be reused
+        existing_instance.parsed_submission = parsed_submission
         # ensure we have saved the extra attachments
         new_attachments, _ = save_attachments(existing_instance, media_files)
         if not new_attachments:
@@ -193,11 +209,132 @@ def create_instance(
             existing_instance.parsed_instance.save(asynchronous=False)
             return existing_instance
     else:
-        instance = save_submission(request, xform, xml, media_files, new_uuid,
-                                   status, date_created_override)
+        instance = save_submission(request, xform, parsed_submission,
+                                   media_files, new_uuid, status,
+                                   date_created_override)
         return instance
 
 
+def create_instances_in_bulk(
+    username: str,
+    submissions: list[
+        tuple[str, list['django.core.files.uploadedfile.UploadedFile']]
+    ],
+    status: str = 'submitted_via_web',
+) -> list[Instance | Exception]:
+    """
+    Create many submissions at once, e.g. when importing the content of a
+    phone. `submissions` is a list of `(xml, media_files)` tuples.
+
+    Unlike calling `create_instance()` for each submission, duplicates are
+    detected with a single `xml_hash` query, `Instance`, `ParsedInstance` and
+    `Attachment` objects are inserted with `bulk_create()`, counters are
+    updated once per form, and MongoDB receives a single `bulk_write()` once
+    the batch is committed. Records which cannot be written to MongoDB are
+    queued in the MongoDB outbox, they do not reject the batch.
+
+    Edits, and duplicates which come with attachments, go through
+    `create_instance()`. So does every submission of the batch if the batch
+    cannot be saved at once, so that one faulty submission does not reject
+    the others.
+
+    Returns, for each submission, either its `Instance` or the exception which
+    prevented its creation.
+    """
+    if username:
+        username = username.lower()
+
+    results = [None] * len(submissions)
+    new_submissions = []
+    one_by_one = []
+    xforms_by_uuid = {}
+    active_xform_ids = set()
+
+    for index, (xml, media_files) in enumerate(submissions):
+        try:
+            xml = smart_str(xml)
+            parsed_submission = ParsedSubmission(xml)
+            xform_uuid = get_uuid_from_submission(xml)
+            xform = xforms_by_uuid.get(xform_uuid)
+            if xform is None:
+                xform = get_xform_from_submission(parsed_submission, username)
+                if xform_uuid:
+                    xforms_by_uuid[xform_uuid] = xform
+            if xform.pk not in active_xform_ids:
+                Instance(xform=xform).check_active(force=False)
+                active_xform_ids.add(xform.pk)
+        except Exception as e:
+            results[index] = e
+            continue
+
+        if parsed_submission.deprecated_uuid is not None:
+            one_by_one.append(index)
+        else:
+            new_submissions.append(
+                (index, xml, parsed_submission, xform, media_files)
+            )
+
+    # See `create_instance()` for the rules of duplicate detection
+    xml_hashes = {
+        Instance.get_hash(xml): xform.pk
+        for index, xml, parsed_submission, xform, media_files
+        in new_submissions
+    }
+    existing_xml_hashes = set(
+        Instance.objects.filter(
+            xml_hash__in=list(xml_hashes),
+            xform_id__in=set(xml_hashes.values()),
+        ).values_list('xml_hash', 'xform_id')
+    ) if xml_hashes else set()
+
+    accepted_submissions = []
+    for new_submission in new_submissions:
+        index, xml, parsed_submission, xform, media_files = new_submission
+        key = (Instance.get_hash(xml), xform.pk)
+        if key in existing_xml_hashes and (
+            xform.has_start_time or parsed_submission.uuid is not None
+        ):
+            if media_files:
+                # `create_instance()` saves the missing attachments, if any
+                one_by_one.append(index)
+            else:
+                results[index] = DuplicateInstance()
+            continue
+        existing_xml_hashes.add(key)
+        accepted_submissions.append(new_submission)
+
+    if accepted_submissions:
+        try:
+            with transaction.atomic():
+                instances = _save_submissions_in_bulk(
+                    accepted_submissions, status
+                )
+        except Exception:
+            logging.warning(
+                'Could not save submissions in bulk, saving them one by one',
+                exc_info=True,
+            )
+            one_by_one.extend(
+                index for index, *_ in accepted_submissions
+            )
+        else:
+            for (index, *_), instance in zip(accepted_submissions, instances):
+                results[index] = instance
+
+    for index in sorted(one_by_one):
+        xml, media_files = submissions[index]
+        for media_file in media_files:
+            media_file.seek(0)
+        try:
+            results[index] = create_instance(
+                username, StringIO(smart_str(xml)), media_files, status
+            )
+        except Exception as e:
+            results[index] = e
+
+    return results
+
+
 def disposition_ext_and_date(name, extension, show_date=True):
     if name is None:
         return 'attachment;'
@@ -249,8 +386,14 @@ def get_uuid_from_submission(xml):
 
 
 def get_xform_from_submission(xml, username, uuid=None):
+    """
+    `xml` can be either a string or a `ParsedSubmission`.
+    """
     # check alternative form submission ids
-    uuid = uuid or get_uuid_from_submission(xml)
+    if isinstance(xml, ParsedSubmission):
+        uuid = uuid or get_uuid_from_submission(xml.xml)
+    else:
+        uuid = uuid or get_uuid_from_submission(xml)
 
     if not username and not uuid:
         raise InstanceInvalidUserError()
@@ -272,8 +415,8 @@ def get_xform_from_submission(xml, username, uuid=None):
 
 
 def inject_instanceid(xml_str, uuid):
-    if get_uuid_from_xml(xml_str) is None:
-        xml = clean_and_parse_xml(xml_str)
+    xml = clean_and_parse_xml(xml_str)
+    if get_uuid_from_xml(xml) is None:
         children = xml.childNodes
         if children.length == 0:
             raise ValueError(t("XML string must have a survey element."))
@@ -589,8 +732,7 @@ def save_attachments(
             media_file=attachment_filename,
             mimetype=f.content_type,
         ).first()
-        if existing_attachment and (existing_attachment.file_hash ==
-                                    hash_attachment_contents(f.read())):
+        if existing_attachment and _is_same_attachment(existing_attachment, f):
             # We already have this attachment!
             continue
         f.seek(0)
@@ -610,18 +752,45 @@ def save_attachments(
     return new_attachments, soft_deleted_attachments
 
 
+def _is_same_attachment(
+    attachment: Attachment, f: 'django.core.files.uploadedfile.UploadedFile'
+) -> bool:
+    """
+    Compare an uploaded file with an existing attachment, without reading
+    either of them entirely in memory.
+    """
+    if (
+        attachment.media_file_size is not None
+        and attachment.media_file_size != f.size
+    ):
+        # No need to fetch and hash the stored file
+        return False
+
+    # `SpooledHashingFileUploadHandler` hashes files while they are uploaded
+    upload_hash = getattr(f, 'file_hash', None)
+    if upload_hash is None:
+        f.seek(0)
+        upload_hash = hash_attachment_contents(f)
+    return attachment.file_hash == upload_hash
+
+
 def save_submission(
     request: 'rest_framework.request.Request',
     xform: XForm,
-    xml: str,
+    xml: str | ParsedSubmission,
     media_files: list['django.core.files.uploadedfile.UploadedFile'],
     new_uuid: str,
     status: str,
     date_created_override: datetime,
 ) -> Instance:
 
+    if isinstance(xml, ParsedSubmission):
+        parsed_submission = xml
+    else:
+        parsed_submission = ParsedSubmission(xml)
+
     if not date_created_override:
-        date_created_override = get_submission_date_from_xml(xml)
+        date_created_override = parsed_submission.submission_date
 
     # We have to save the `Instance` to the database before we can associate
     # any `Attachment`s with it, but we are inside a transaction and saving
@@ -638,7 +807,8 @@ def save_submission(
     # responsible for calling `update_xform_submission_count()` if the returned
     # `Instance` has `defer_counting = True`.
     instance = _get_instance(
-        request, xml, new_uuid, status, xform, defer_counting=True
+        request, parsed_submission, new_uuid, status, xform,
+        defer_counting=True
     )
 
     new_attachments, soft_deleted_attachments = save_attachments(
@@ -659,6 +829,9 @@ def save_submission(
             instance=instance)
 
     if not created:
+        # Reuse our `instance` (and its parser) instead of letting
+        # `pi.instance` fetch and parse it again
+        pi.instance = instance
         pi.save(asynchronous=False)
 
     # Now that the slow tasks are complete and we are (hopefully!) close to the
@@ -702,15 +875,16 @@ def get_soft_deleted_attachments(instance: Instance) -> list[Attachment]:
     if not media_question_xpaths:
         return []
 
-    # Parse instance XML to get the basename of each file of the updated
-    # submission
-    xml_parsed = ET.fromstring(instance.xml)
+    # Get the basename of each file of the updated submission from the
+    # instance XML, which has usually been parsed already
+    parsed_submission = instance._get_parsed_submission()
+    root_tag_name = parsed_submission.root_node_name
     basenames = []
 
     for media_question_xpath in media_question_xpaths:
         root_name, xpath_without_root = media_question_xpath.split('/', 1)
         try:
-            assert root_name == xml_parsed.tag
+            assert root_name == root_tag_name
         except AssertionError:
             logging.warning(
                 'Instance XML root tag name does not match with its form'
@@ -718,13 +892,7 @@ def get_soft_deleted_attachments(instance: Instance) -> list[Attachment]:
 
         # With repeat groups, several nodes can have the same XPath. We
         # need to retrieve all of them
-        questions = xml_parsed.findall(xpath_without_root)
-        for question in questions:
-            try:
-                basename = question.text
-            except AttributeError:
-                raise XPathNotFoundException
-
+        for basename in parsed_submission.find_values(xpath_without_root):
             # Only keep non-empty fields
             if basename:
                 basenames.append(basename)
@@ -748,7 +916,7 @@ def get_soft_deleted_attachments(instance: Instance) -> list[Attachment]:
 
 def _get_instance(
     request: 'rest_framework.request.Request',
-    xml: str,
+    parsed_submission: ParsedSubmission,
     new_uuid: str,
     status: str,
     xform: XForm,
@@ -760,8 +928,9 @@ def _get_instance(
     `update_xform_submission_count()` from doing anything, which avoids locking
     any rows in `logger_xform` or `main_userprofile`.
     """
+    xml = parsed_submission.xml
     # check if it is an edit submission
-    old_uuid = get_deprecated_uuid_from_xml(xml)
+    old_uuid = parsed_submission.deprecated_uuid
     instances = Instance.objects.filter(uuid=old_uuid)
 
     if instances:
@@ -771,6 +940,7 @@ def _get_instance(
         InstanceHistory.objects.create(
             xml=instance.xml, xform_instance=instance, uuid=old_uuid)
         instance.xml = xml
+        instance.parsed_submission = parsed_submission
         instance._populate_xml_hash()
         instance.uuid = new_uuid
         instance.save()
@@ -785,6 +955,7 @@ def _get_instance(
         # attribute, `defer_counting`, before saving
         instance = Instance()
         instance.xml = xml
+        instance.parsed_submission = parsed_submission
         instance.user = submitted_by
         instance.status = status
         instance.xform = xform
@@ -797,6 +968,136 @@ def _get_instance(
     return instance
 
 
+def _save_submissions_in_bulk(
+    submissions: list[tuple],
+    status: str,
+) -> list[Instance]:
+    """
+    Insert new, already validated, submissions for `create_instances_in_bulk()`
+    and return their `Instance`s. What `Instance.save()`, `save_submission()`
+    and the `post_save` signal handlers do one submission at a time is done
+    here for all of them.
+    """
+    now = dj_timezone.now()
+    data_dictionaries = {}
+    survey_types = {}
+    instances = []
+    for index, xml, parsed_submission, xform, media_files in submissions:
+        instance = Instance(xml=xml, xform=xform, status=status)
+        instance.parsed_submission = parsed_submission
+        if xform.pk not in data_dictionaries:
+            data_dictionaries[xform.pk] = xform.data_dictionary()
+        instance._data_dictionary = data_dictionaries[xform.pk]
+        date_created = parsed_submission.submission_date
+        if date_created and not dj_timezone.is_aware(date_created):
+            date_created = dj_timezone.make_aware(date_created, timezone.utc)
+        instance.date_created = date_created or now
+        instance._set_geom()
+        instance._set_json()
+        root_node_name = parsed_submission.root_node_name
+        if root_node_name not in survey_types:
+            survey_types[root_node_name], _ = SurveyType.objects.get_or_create(
+                slug=root_node_name
+            )
+        instance.survey_type = survey_types[root_node_name]
+        instance._set_uuid()
+        instance._populate_xml_hash()
+        instance.validation_status = {}
+        instances.append(instance)
+
+    # `bulk_create()` overwrites `date_created` (`auto_now_add`); restore it
+    dates_created = [instance.date_created for instance in instances]
+    Instance.objects.bulk_create(instances)
+    for instance, date_created in zip(instances, dates_created):
+        instance.date_created = date_created
+    Instance.objects.bulk_update(instances, ['date_created'])
+
+    attachments = []
+    storage_bytes_by_xform = Counter()
+    storage_bytes_by_user = Counter()
+    for (index, xml, parsed_submission, xform, media_files), instance in zip(
+        submissions, instances
+    ):
+        for media_file in media_files:
+            attachment = Attachment(
+                instance=instance,
+                media_file=media_file,
+                mimetype=media_file.content_type,
+            )
+            # Files are written to the storage by `bulk_create()`
+            attachment.set_media_file_attributes()
+            attachments.append(attachment)
+            if attachment.media_file_size:
+                storage_bytes_by_xform[xform.pk] += attachment.media_file_size
+                storage_bytes_by_user[xform.user_id] += (
+                    attachment.media_file_size
+                )
+    Attachment.objects.bulk_create(attachments)
+    for xform_id, storage_bytes in storage_bytes_by_xform.items():
+        XForm.objects.filter(pk=xform_id).update(
+            attachment_storage_bytes=F('attachment_storage_bytes')
+            + storage_bytes
+        )
+    for user_id, storage_bytes in storage_bytes_by_user.items():
+        UserProfile.objects.filter(user_id=user_id).update(
+            attachment_storage_bytes=F('attachment_storage_bytes')
+            + storage_bytes
+        )
+
+    parsed_instances = []
+    for instance in instances:
+        parsed_instance = ParsedInstance(instance=instance)
+        parsed_instance._set_geopoint()
+        parsed_instances.append(parsed_instance)
+    ParsedInstance.objects.bulk_create(parsed_instances)
+
+    update_xform_counters_in_bulk(instances)
+
+    if settings.MONGO_SYNC_OUTBOX_ENABLED:
+        MongoSyncOutbox.objects.bulk_create(
+            [MongoSyncOutbox(instance=instance) for instance in instances]
+        )
+    else:
+        # MongoDB is not rolled back with the database: records are written
+        # once the submissions are committed, so that a batch saved again one
+        # by one is never written twice under different `_id`s
+        transaction.on_commit(
+            lambda: _update_mongo_in_bulk(instances, parsed_instances)
+        )
+
+    xform_ids_with_services = set(
+        XForm.objects.filter(
+            pk__in={instance.xform_id for instance in instances},
+            restservices__isnull=False,
+        ).values_list('pk', flat=True)
+    )
+    for parsed_instance in parsed_instances:
+        if parsed_instance.instance.xform_id in xform_ids_with_services:
+            call_service(parsed_instance)
+
+    return instances
+
+
+def _update_mongo_in_bulk(
+    instances: list[Instance], parsed_instances: list[ParsedInstance]
+):
+    """
+    Write the records of committed submissions saved by
+    `_save_submissions_in_bulk()` to MongoDB. Those which cannot be written
+    are queued in the MongoDB outbox, which retries them later on.
+    """
+    prefetch_related_objects(instances, 'attachments')
+    errors = ParsedInstance.bulk_update_mongo(parsed_instances)
+    if errors:
+        logging.warning(
+            '%d submissions could not be saved to Mongo, queuing them',
+            len(errors),
+        )
+        MongoSyncOutbox.objects.bulk_create(
+            [MongoSyncOutbox(instance_id=instance_id) for instance_id in errors]
+        )
+
+
 def _has_edit_xform_permission(
     request: 'rest_framework.request.Request', xform: XForm
 ) -> bool:
@@ -831,6 +1132,7 @@ def _update_mongo_for_xform(xform, only_update_missing=True):
     else:
         # clear mongo records
         mongo_instances.delete_many({common_tags.USERFORM_ID: userform_id})
+        invalidate_counts([userform_id])
 
     # get instances
     sys.stdout.write(
@@ -925,7 +1227,3 @@ class UnauthenticatedEditAttempt(Exception):
     then returns the appropriate 401 response.
     """
     pass
-
-
-class XPathNotFoundException(Exception):
-    pass
@@ -0,0 +1,106 @@
+# coding: utf-8
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from django.conf import settings
+
+
+class SurveyCache:
+    """
+    Per-process LRU cache of everything derived from a form definition: the
+    pyxform survey built by `DataDictionary.get_survey()` and the indexes
+    computed from it (repeat XPaths, geopoint XPaths, media XPaths, MongoDB
+    field names, etc.).
+
+    Entries are keyed by `(xform.pk, xform.date_modified)`, so that
+    republishing a form, which updates `date_modified`, makes its previous
+    entry unreachable; the latter is dropped as soon as the new one is stored.
+
+    The cache is bounded by its number of forms and by their total size,
+    estimated from the length of their JSON and XML definitions.
+
+    Cached values are shared across threads and requests: callers must not
+    mutate them.
+    """
+
+    def __init__(self, max_entries: int, max_size: int):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._keys_by_pk = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._keys_by_pk.clear()
+            self._size = 0
+
+    def get(
+        self,
+        xform: 'onadata.apps.logger.models.XForm',
+        name: str,
+        builder: Callable[[], Any],
+    ) -> Any:
+        """
+        Return the value called `name` derived from `xform`, calling
+        `builder()` to compute it on a cache miss.
+        """
+        if not xform.pk or self.max_entries <= 0:
+            return builder()
+
+        key = (xform.pk, xform.date_modified)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if name in entry:
+                    return entry[name]
+
+        # Build outside the lock; at worst, two threads build the same value
+        value = builder()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Forget about the previous version of this form, if any
+                if (stale_key := self._keys_by_pk.get(xform.pk)) is not None:
+                    self._pop(stale_key)
+                entry = self._entries[key] = {}
+                self._keys_by_pk[xform.pk] = key
+                self._sizes[key] = len(xform.json or '') + len(xform.xml or '')
+                self._size += self._sizes[key]
+            value = entry.setdefault(name, value)
+            self._evict(keep=key)
+
+        return value
+
+    def _evict(self, keep: tuple):
+        while (
+            len(self._entries) > self.max_entries or self._size > self.max_size
+        ):
+            oldest_key = next(iter(self._entries))
+            if oldest_key == keep:
+                # Never evict the entry that has just been requested, even if
+                # it is bigger than `max_size` on its own
+                break
+            self._pop(oldest_key)
+
+    def _pop(self, key: tuple):
+        self._entries.pop(key, None)
+        self._size -= self._sizes.pop(key, 0)
+        if self._keys_by_pk.get(key[0]) == key:
+            del self._keys_by_pk[key[0]]
+
+
+survey_cache = SurveyCache(
+    max_entries=settings.SURVEY_CACHE_MAX_ENTRIES,
+    max_size=settings.SURVEY_CACHE_MAX_SIZE,
+)
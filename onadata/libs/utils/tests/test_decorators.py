@@ -0,0 +1,63 @@
+# coding: utf-8
+from django.test import SimpleTestCase
+
+from onadata.libs.utils.decorators import FieldNamesDecoder
+
+
+class TestFieldNamesDecoder(SimpleTestCase):
+
+    def test_decode(self):
+        decoder = FieldNamesDecoder(
+            {
+                'name': 'name',
+                'telLg==office': 'tel.office',
+                'childrenLg==info': 'children.info',
+                'childrenLg==info/nameLg==first': 'children.info/name.first',
+                'childrenLg==info/cartoons': 'children.info/cartoons',
+                'childrenLg==info/cartoons/name':
+                    'children.info/cartoons/name',
+            },
+            ['children.info', 'children.info/cartoons'],
+        )
+        record = {
+            'name': 'Abe',
+            'telLg==office': '020123456',
+            '_attachments': [{'filename': 'a.jpg'}],
+            'childrenLg==info': [
+                {
+                    'childrenLg==info/nameLg==first': 'Mike',
+                    'childrenLg==info/cartoons': [
+                        {'childrenLg==info/cartoons/name': 'Tom & Jerry'},
+                    ],
+                },
+            ],
+        }
+        self.assertIs(decoder.decode(record), record)
+        self.assertEqual(record, {
+            'name': 'Abe',
+            'tel.office': '020123456',
+            '_attachments': [{'filename': 'a.jpg'}],
+            'children.info': [
+                {
+                    'children.info/name.first': 'Mike',
+                    'children.info/cartoons': [
+                        {'children.info/cartoons/name': 'Tom & Jerry'},
+                    ],
+                },
+            ],
+        })
+
+    def test_encoded_field_name_of_another_field_is_kept(self):
+        # `aLg==b` is both the encoded name of `a.b` and a field of its own
+        decoder = FieldNamesDecoder(
+            {'aLg==b': 'aLg==b', 'aLg==bLg==c': 'a.b.c'}, []
+        )
+        record = {'aLg==b': 1, 'aLg==bLg==c': 2}
+        self.assertEqual(decoder.decode(record), {'aLg==b': 1, 'a.b.c': 2})
+
+    def test_form_without_encoded_field_names(self):
+        decoder = FieldNamesDecoder({'name': 'name', 'age': 'age'}, [])
+        self.assertEqual(decoder.translations, {})
+        record = {'name': 'Abe', 'age': 35}
+        self.assertIs(decoder.decode(record), record)
+        self.assertEqual(record, {'name': 'Abe', 'age': 35})
@@ -0,0 +1,63 @@
+# coding: utf-8
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from onadata.libs.utils.survey_cache import SurveyCache
+
+
+class TestSurveyCache(SimpleTestCase):
+
+    def _xform(self, pk, date_modified=None, size=10):
+        return SimpleNamespace(
+            pk=pk,
+            date_modified=date_modified or datetime(2024, 1, 1),
+            json='x' * size,
+            xml='',
+        )
+
+    def test_value_is_built_once(self):
+        cache = SurveyCache(max_entries=10, max_size=1000)
+        xform = self._xform(1)
+        calls = []
+
+        def builder():
+            calls.append(1)
+            return ['geo']
+
+        self.assertEqual(cache.get(xform, 'geopoint_xpaths', builder), ['geo'])
+        self.assertEqual(cache.get(xform, 'geopoint_xpaths', builder), ['geo'])
+        self.assertEqual(len(calls), 1)
+
+    def test_new_version_of_form_replaces_previous_one(self):
+        cache = SurveyCache(max_entries=10, max_size=1000)
+        xform = self._xform(1)
+        cache.get(xform, 'survey', lambda: 'v1')
+        xform.date_modified += timedelta(seconds=1)
+        self.assertEqual(cache.get(xform, 'survey', lambda: 'v2'), 'v2')
+        self.assertEqual(len(cache), 1)
+
+    def test_least_recently_used_form_is_evicted(self):
+        cache = SurveyCache(max_entries=2, max_size=1000)
+        xform_1, xform_2, xform_3 = [self._xform(pk) for pk in (1, 2, 3)]
+        cache.get(xform_1, 'survey', lambda: 1)
+        cache.get(xform_2, 'survey', lambda: 2)
+        # Use the first form again, the second one is now the oldest
+        cache.get(xform_1, 'survey', lambda: 1)
+        cache.get(xform_3, 'survey', lambda: 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(xform_1, 'survey', lambda: 'miss'), 1)
+        self.assertEqual(cache.get(xform_2, 'survey', lambda: 'miss'), 'miss')
+
+    def test_size_bound(self):
+        cache = SurveyCache(max_entries=10, max_size=25)
+        cache.get(self._xform(1), 'survey', lambda: 1)
+        cache.get(self._xform(2), 'survey', lambda: 2)
+        cache.get(self._xform(3), 'survey', lambda: 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_unsaved_form_is_not_cached(self):
+        cache = SurveyCache(max_entries=10, max_size=1000)
+        cache.get(self._xform(None), 'survey', lambda: 1)
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,37 @@
+# coding: utf-8
+import hashlib
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from onadata.libs.utils.upload_handlers import SpooledHashingFileUploadHandler
+
+
+@override_settings(FILE_UPLOAD_SPOOL_MAX_SIZE=1024)
+class TestSpooledHashingFileUploadHandler(SimpleTestCase):
+
+    def _upload(self, contents):
+        request = RequestFactory().post(
+            '/', {'media_file': SimpleUploadedFile('image.jpg', contents)}
+        )
+        request.upload_handlers = [SpooledHashingFileUploadHandler(request)]
+        return request.FILES['media_file']
+
+    def test_small_file_stays_in_memory(self):
+        contents = b'a' * 100
+        uploaded_file = self._upload(contents)
+        self.assertFalse(uploaded_file.file._rolled)
+        self.assertEqual(uploaded_file.size, 100)
+        self.assertEqual(uploaded_file.read(), contents)
+        self.assertEqual(
+            uploaded_file.file_hash, hashlib.md5(contents).hexdigest()
+        )
+
+    def test_big_file_is_spooled_to_disk(self):
+        contents = b'b' * 100000
+        uploaded_file = self._upload(contents)
+        self.assertTrue(uploaded_file.file._rolled)
+        self.assertEqual(uploaded_file.read(), contents)
+        self.assertEqual(
+            uploaded_file.file_hash, hashlib.md5(contents).hexdigest()
+        )
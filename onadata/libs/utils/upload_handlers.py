@@ -0,0 +1,50 @@
+# coding: utf-8
+import hashlib
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class SpooledHashingFileUploadHandler(FileUploadHandler):
+    """
+    Stream each uploaded file to a `SpooledTemporaryFile`, which is kept in
+    memory until it grows beyond `settings.FILE_UPLOAD_SPOOL_MAX_SIZE`, and
+    then rolled over to disk. Unlike Django's default handlers, the decision
+    is made per file, not for the whole request, so a worker never holds
+    more than one threshold's worth of each attachment in memory.
+
+    The MD5 hash of the contents is calculated while chunks are received and
+    exposed as `file_hash` on the uploaded file, so that it never has to be
+    read again to be compared with existing attachments.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_SPOOL_MAX_SIZE,
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+        )
+        self.hash = hashlib.md5()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hash.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        uploaded_file = UploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+        uploaded_file.file_hash = self.hash.hexdigest()
+        return uploaded_file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
@@ -3,7 +3,10 @@ import os
 import logging
 import traceback
 import requests
+import shutil
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from tempfile import NamedTemporaryFile
@@ -200,29 +203,94 @@ def create_attachments_zipfile(attachments, output_file=None):
                     f'disabling seeking failed: {e}'
                 )
 
+    workers = settings.ATTACHMENTS_ZIP_PREFETCH_WORKERS
     with zipfile.ZipFile(
         output_file, 'w', zipfile.ZIP_STORED, allowZip64=True
-    ) as zip_file:
-        for attachment in attachments:
-            if default_storage.exists(attachment.media_file.name):
-                try:
-                    with default_storage.open(
-                        attachment.media_file.name, 'rb'
-                    ) as source_file:
-                        zip_file.writestr(
-                            attachment.media_file.name, source_file.read()
-                        )
-                except Exception as e:
+    ) as zip_file, ThreadPoolExecutor(max_workers=workers) as executor:
+        for attachment, future in _prefetch_attachments(
+            attachments, executor, workers
+        ):
+            try:
+                source_file = future.result()
+            except Exception as e:
+                # Missing files are skipped, as `exists()` used to, without
+                # a round trip to the storage for each attachment
+                if not _is_missing_file_error(e):
                     report_exception(
                         "Error adding file \"{}\" to archive.".format(
                             attachment.media_file.name
                         ),
                         e,
                     )
+                continue
+
+            try:
+                with source_file, zip_file.open(
+                    attachment.media_file.name,
+                    'w',
+                    # The size is only known in advance if it has been cached
+                    force_zip64=not attachment.media_file_size
+                    or attachment.media_file_size > zipfile.ZIP64_LIMIT,
+                ) as destination:
+                    shutil.copyfileobj(
+                        source_file,
+                        destination,
+                        settings.ATTACHMENTS_ZIP_CHUNK_SIZE,
+                    )
+            except Exception as e:
+                report_exception(
+                    "Error adding file \"{}\" to archive.".format(
+                        attachment.media_file.name
+                    ),
+                    e,
+                )
 
     return output_file
 
 
+def _prefetch_attachments(attachments, executor, count):
+    """
+    Yield `(attachment, future)` pairs, in order, where `future` opens the
+    media file of the attachment. The files of the next `count` attachments
+    are fetched in the background while the current one is consumed: up to
+    `count + 1` files are open at once.
+    """
+    pending = deque()
+    try:
+        for attachment in attachments:
+            pending.append(
+                (attachment, executor.submit(_open_attachment, attachment))
+            )
+            if len(pending) > count:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        # Close the files which will not be consumed, e.g. after an error
+        for _, future in pending:
+            if not future.cancel() and future.exception() is None:
+                future.result().close()
+
+
+def _open_attachment(attachment):
+    source_file = default_storage.open(attachment.media_file.name, 'rb')
+    # Reading downloads files from remote storages, such as S3, to a
+    # temporary file which spills over to disk beyond
+    # `settings.AWS_S3_MAX_MEMORY_SIZE`
+    source_file.read(0)
+    return source_file
+
+
+def _is_missing_file_error(error):
+    if isinstance(error, FileNotFoundError):
+        return True
+    # e.g. `botocore.exceptions.ClientError`
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code') in ('404', 'NoSuchKey')
+    return False
+
+
 def _get_form_url(username):
     if settings.TESTING_MODE:
         http_host = 'http://{}'.format(settings.TEST_HTTP_HOST)
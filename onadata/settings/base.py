@@ -309,6 +309,12 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760
 # The maximum size (in bytes) that an upload will be before it gets streamed to the file system # noqa
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760
 
+# Files uploaded with submissions (see `XFormSubmissionApi`) are spooled to a
+# temporary file, hashed on the fly, and kept in memory only until they grow
+# beyond this size (in bytes), regardless of the size of the whole request.
+# Other uploads use Django's default `FILE_UPLOAD_HANDLERS`
+FILE_UPLOAD_SPOOL_MAX_SIZE = env.int('FILE_UPLOAD_SPOOL_MAX_SIZE', 1048576)
+
 # When an uploaded file exceeds FILE_UPLOAD_MAX_MEMORY_SIZE, Django streams it
 # to the OS' temporary directory, which usually sets restrictive owner-only
 # read permissions on files created within it. Django then *moves* the file to
@@ -321,6 +327,9 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760
 # problem of NGINX returning 403 when large submission attachments are
 # requested. See
 # https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/#file-upload-permissions
+# Attachments of submissions, which are spooled instead (see
+# `FILE_UPLOAD_SPOOL_MAX_SIZE`), are always written to their destination paths
+# and get these permissions as well.
 FILE_UPLOAD_PERMISSIONS = 0o644
 
 LOCALE_PATHS = [os.path.join(PROJECT_ROOT, 'locale'), ]
@@ -521,6 +530,11 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('KOBOCAT_AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.environ.get('KOBOCAT_AWS_STORAGE_BUCKET_NAME')
 AWS_DEFAULT_ACL = 'private'
 AWS_S3_FILE_BUFFER_SIZE = 50 * 1024 * 1024
+# Files read from S3 are downloaded to a temporary file, which is kept in
+# memory up to this size and rolled over to disk beyond. django-storages'
+# default, 0, keeps whole files in memory, e.g. every attachment prefetched
+# by attachments ZIP exports
+AWS_S3_MAX_MEMORY_SIZE = env.int('AWS_S3_MAX_MEMORY_SIZE', 5 * 1024 * 1024)
 AWS_S3_SIGNATURE_VERSION = env.str('AWS_S3_SIGNATURE_VERSION', 's3v4')
 if env.str('AWS_S3_REGION_NAME', False):
     AWS_S3_REGION_NAME = env.str('AWS_S3_REGION_NAME')
@@ -659,6 +673,84 @@ REVERSION_MIDDLEWARE_SKIPPED_URL_PATTERNS = {
 }
 KOBOCAT_REVERSION_RETENTION_DAYS = env.int("KOBOCAT_REVERSION_RETENTION_DAYS", 90)
 
+# Engine used to parse submission XML: `lxml` (default) or `minidom`, the
+# original, slower implementation kept to compare their results
+XFORM_INSTANCE_PARSER_ENGINE = env.str('XFORM_INSTANCE_PARSER_ENGINE', 'lxml')
+
+# Bounds of the per-process cache of compiled form surveys (see
+# `onadata.libs.utils.survey_cache`). The size is estimated from the length of
+# the JSON and XML definitions of the cached forms. Set the number of entries
+# to 0 to disable the cache.
+SURVEY_CACHE_MAX_ENTRIES = env.int('SURVEY_CACHE_MAX_ENTRIES', 200)
+SURVEY_CACHE_MAX_SIZE = env.int('SURVEY_CACHE_MAX_SIZE', 50 * 1024 * 1024)
+
+# Write submissions to MongoDB asynchronously, through an outbox table which is
+# drained in batches by the `sync_mongo_outbox` periodic task, instead of
+# during the submission request
+MONGO_SYNC_OUTBOX_ENABLED = env.bool('MONGO_SYNC_OUTBOX_ENABLED', False)
+MONGO_SYNC_OUTBOX_BATCH_SIZE = env.int('MONGO_SYNC_OUTBOX_BATCH_SIZE', 500)
+# Delays, in seconds, before retrying failed writes. The delay doubles after
+# each attempt, up to `MONGO_SYNC_OUTBOX_MAX_RETRY_DELAY`
+MONGO_SYNC_OUTBOX_RETRY_DELAY = env.int('MONGO_SYNC_OUTBOX_RETRY_DELAY', 10)
+MONGO_SYNC_OUTBOX_MAX_RETRY_DELAY = env.int(
+    'MONGO_SYNC_OUTBOX_MAX_RETRY_DELAY', 3600
+)
+
+# Number of submissions inserted at once by bulk imports
+BULK_SUBMISSION_BATCH_SIZE = env.int('BULK_SUBMISSION_BATCH_SIZE', 100)
+
+# Accumulate submission counters in Redis instead of updating them in the
+# database with every submission. The `flush_submission_counters` periodic
+# task applies them every `SUBMISSION_COUNTERS_FLUSH_INTERVAL` seconds
+COALESCE_SUBMISSION_COUNTERS = env.bool('COALESCE_SUBMISSION_COUNTERS', False)
+SUBMISSION_COUNTERS_FLUSH_INTERVAL = env.int(
+    'SUBMISSION_COUNTERS_FLUSH_INTERVAL', 30
+)
+
+# Split CSV and XLSX exports of more than `EXPORT_SHARD_SIZE` submissions into
+# shards generated in parallel by several Celery workers, then merged
+SHARDED_EXPORTS_ENABLED = env.bool('SHARDED_EXPORTS_ENABLED', False)
+EXPORT_SHARD_SIZE = env.int('EXPORT_SHARD_SIZE', 50000)
+
+# Generate CSV exports of all the submissions of a form by appending the new
+# submissions to the previous export, unless submissions it contains have been
+# edited or deleted since. XLSX workbooks cannot be appended to without
+# rewriting every row, so XLSX exports are always generated from scratch
+INCREMENTAL_EXPORTS_ENABLED = env.bool('INCREMENTAL_EXPORTS_ENABLED', False)
+
+# Number of attachments fetched from the storage in the background while
+# attachments ZIP exports are written, and size of the chunks in which they are
+# copied to the archive. Up to `ATTACHMENTS_ZIP_PREFETCH_WORKERS + 1` files are
+# open at once, each holding at most `AWS_S3_MAX_MEMORY_SIZE` bytes in memory
+# when stored on S3
+ATTACHMENTS_ZIP_PREFETCH_WORKERS = env.int(
+    'ATTACHMENTS_ZIP_PREFETCH_WORKERS', 4
+)
+ATTACHMENTS_ZIP_CHUNK_SIZE = env.int('ATTACHMENTS_ZIP_CHUNK_SIZE', 1024 * 1024)
+
+# Stream CSV and JSONL exports of the API to the client while they are
+# generated, instead of saving them first, if they are filtered or if the form
+# has at most `STREAMING_EXPORTS_MAX_SUBMISSIONS` submissions. Streamed exports
+# are not saved, and errors while they are generated truncate a response whose
+# status has already been sent
+STREAMING_EXPORTS_ENABLED = env.bool('STREAMING_EXPORTS_ENABLED', False)
+STREAMING_EXPORTS_MAX_SUBMISSIONS = env.int(
+    'STREAMING_EXPORTS_MAX_SUBMISSIONS', 1000
+)
+
+# Stream the JSON lists of records of `/api/v1/data/<pk>` while they are read
+# from MongoDB, instead of rendering them all at once. Errors while the records
+# are read truncate a response whose status has already been sent
+STREAMING_DATA_ENABLED = env.bool('STREAMING_DATA_ENABLED', False)
+
+# Lifetime, in seconds, of the counts of records matching a query of
+# `/api/v1/data/<pk>?count=1` cached in Redis (see
+# `onadata.libs.utils.count_cache`). Writes to MongoDB invalidate them before
+# then. Set to 0 to disable the cache. Unfiltered counts are read from
+# `XForm.num_of_submissions` instead, unless `COALESCE_SUBMISSION_COUNTERS`
+# or `MONGO_SYNC_OUTBOX_ENABLED` is enabled
+DATA_COUNT_CACHE_TIMEOUT = env.int('DATA_COUNT_CACHE_TIMEOUT', 300)
+
 # run heavy migration scripts by default
 # NOTE: this should be set to False for major deployments. This can take a long time
 SKIP_HEAVY_MIGRATIONS = env.bool('SKIP_HEAVY_MIGRATIONS', False)
@@ -711,6 +803,18 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(hour=0, minute=0),
         "options": {"queue": "kobocat_queue"},
     },
+    "sync-mongo-outbox": {
+        "task": "onadata.apps.viewer.tasks.sync_mongo_outbox",
+        "schedule": timedelta(
+            seconds=env.int('MONGO_SYNC_OUTBOX_INTERVAL', 5)
+        ),
+        "options": {"queue": "kobocat_queue"},
+    },
+    "flush-submission-counters": {
+        "task": "onadata.apps.logger.tasks.flush_submission_counters",
+        "schedule": timedelta(seconds=SUBMISSION_COUNTERS_FLUSH_INTERVAL),
+        "options": {"queue": "kobocat_queue"},
+    },
     # Run maintenance every day at 20:00 UTC
     "perform-maintenance": {
         "task": "onadata.apps.logger.tasks.perform_maintenance",